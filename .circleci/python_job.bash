@@ -71,6 +71,7 @@ function run_build_email_tracker_lists {
     mkdir --parents /tmp/workspace/email-trackers
     cp /home/circleci/project/emails/tracker_lists/level-one-trackers.json /tmp/workspace/email-trackers/
     cp /home/circleci/project/emails/tracker_lists/level-two-trackers.json /tmp/workspace/email-trackers/
+    cp /home/circleci/project/emails/tracker_lists/tracker-index.json /tmp/workspace/email-trackers/
 }
 
 # Run a command by name
@@ -1,12 +1,16 @@
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any
 import logging
 import shlex
+import threading
+import time
 
 import requests
 
 from django.conf import settings
 from django.core.cache import cache
+from django.utils.crypto import salted_hmac
 
 from allauth.socialaccount.models import SocialAccount
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
@@ -24,9 +28,51 @@ INTROSPECT_TOKEN_URL = (
     "%s/introspect" % settings.SOCIALACCOUNT_PROVIDERS["fxa"]["OAUTH_ENDPOINT"]
 )
 
+# Introspection responses, by cache key, with the monotonic time they expire. This
+# in-process cache is checked before the shared Django cache.
+TOKEN_CACHE_MAX_SIZE = 1024
+TOKEN_CACHE_SECONDS = 60
+_token_cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+_token_cache_lock = threading.Lock()
 
-def get_cache_key(token):
-    return hash(token)
+
+def get_cache_key(token: str) -> str:
+    """
+    Get the cache key for a token.
+
+    The key is a digest keyed with the SECRET_KEY, so it is the same in every
+    process, without storing the token in the cache.
+    """
+    digest = salted_hmac("api.authentication.get_cache_key", token).hexdigest()
+    return f"fxa_token_{digest}"
+
+
+def _get_locally_cached_response(cache_key: str) -> dict[str, Any] | None:
+    now = time.monotonic()
+    with _token_cache_lock:
+        cached = _token_cache.get(cache_key)
+        if cached and cached[0] > now:
+            _token_cache.move_to_end(cache_key)
+            return cached[1]
+    return None
+
+
+def _cache_response(
+    cache_key: str, fxa_resp_data: dict[str, Any], cache_timeout: int
+) -> None:
+    """
+    Cache an introspection response in the Django cache and in-process.
+
+    Responses are cached in-process for TOKEN_CACHE_SECONDS or the cache timeout if
+    shorter, up to TOKEN_CACHE_MAX_SIZE tokens, dropping the least recently used.
+    """
+    cache.set(cache_key, fxa_resp_data, cache_timeout)
+    expires = time.monotonic() + min(cache_timeout, TOKEN_CACHE_SECONDS)
+    with _token_cache_lock:
+        _token_cache[cache_key] = (expires, fxa_resp_data)
+        _token_cache.move_to_end(cache_key)
+        while len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+            _token_cache.popitem(last=False)
 
 
 def introspect_token(token: str) -> dict[str, Any]:
@@ -56,9 +102,14 @@ def get_fxa_uid_from_oauth_token(token: str, use_cache=True) -> str:
     # the 'exp' time in the JWT returned by FxA
     cache_timeout = 60
     cache_key = get_cache_key(token)
+    # A response cached in-process is already in the Django cache
+    cached_locally = False
 
     if not use_cache:
         fxa_resp_data = introspect_token(token)
+    elif locally_cached_fxa_resp_data := _get_locally_cached_response(cache_key):
+        fxa_resp_data = locally_cached_fxa_resp_data
+        cached_locally = True
     else:
         # set a default fxa_resp_data, so any error during introspection
         # will still cache for at least cache_timeout to prevent an outage
@@ -77,7 +128,7 @@ def get_fxa_uid_from_oauth_token(token: str, use_cache=True) -> str:
         finally:
             # Store potential valid response, errors, inactive users, etc. from FxA
             # for at least 60 seconds. Valid access_token cache extended after checking.
-            cache.set(cache_key, fxa_resp_data, cache_timeout)
+            _cache_response(cache_key, fxa_resp_data, cache_timeout)
 
     if fxa_resp_data["status_code"] is None:
         raise APIException("Previous FXA call failed, wait to retry.")
@@ -104,7 +155,8 @@ def get_fxa_uid_from_oauth_token(token: str, use_cache=True) -> str:
             # cache until access_token expires (matched Relay user)
             # this handles cases where the token already expired
             cache_timeout = fxa_token_exp_cache_timeout
-    cache.set(cache_key, fxa_resp_data, cache_timeout)
+    if not cached_locally:
+        _cache_response(cache_key, fxa_resp_data, cache_timeout)
 
     return fxa_uid
 
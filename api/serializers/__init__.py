@@ -1,9 +1,10 @@
 from django.contrib.auth.models import User
-from django.db.models import prefetch_related_objects
+from django.db.models import Manager, prefetch_related_objects
 
 from rest_framework import serializers, exceptions
 from waffle import get_waffle_flag_model
 
+from emails.counters import add_pending_counts
 from emails.models import DomainAddress, Profile, RelayAddress
 
 
@@ -14,7 +15,7 @@ class PremiumValidatorsMixin:
             return value
         assert hasattr(self, "context")
         user = self.context["request"].user
-        prefetch_related_objects([user], "socialaccount_set", "profile")
+        prefetch_related_objects([user], "profile")
         if not user.profile.has_premium:
             raise exceptions.AuthenticationFailed(
                 "Must be premium to set block_list_emails."
@@ -22,11 +23,21 @@ class PremiumValidatorsMixin:
         return value
 
 
+class PendingCountsListSerializer(serializers.ListSerializer):
+    """Add the pending counts to a list of addresses, with one cache query."""
+
+    def to_representation(self, data):
+        addresses = list(data.all() if isinstance(data, Manager) else data)
+        add_pending_counts(addresses)
+        return super().to_representation(addresses)
+
+
 class RelayAddressSerializer(PremiumValidatorsMixin, serializers.ModelSerializer):
     mask_type = serializers.CharField(default="random", read_only=True, required=False)
 
     class Meta:
         model = RelayAddress
+        list_serializer_class = PendingCountsListSerializer
         fields = [
             "mask_type",
             "enabled",
@@ -64,12 +75,18 @@ class RelayAddressSerializer(PremiumValidatorsMixin, serializers.ModelSerializer
             "num_spam",
         ]
 
+    def to_representation(self, instance):
+        # Include the counts not yet written by emails.counters.flush_counters
+        add_pending_counts([instance])
+        return super().to_representation(instance)
+
 
 class DomainAddressSerializer(PremiumValidatorsMixin, serializers.ModelSerializer):
     mask_type = serializers.CharField(default="custom", read_only=True, required=False)
 
     class Meta:
         model = DomainAddress
+        list_serializer_class = PendingCountsListSerializer
         fields = [
             "mask_type",
             "enabled",
@@ -105,6 +122,11 @@ class DomainAddressSerializer(PremiumValidatorsMixin, serializers.ModelSerialize
             "num_spam",
         ]
 
+    def to_representation(self, instance):
+        # Include the counts not yet written by emails.counters.flush_counters
+        add_pending_counts([instance])
+        return super().to_representation(instance)
+
 
 class StrictReadOnlyFieldsMixin:
     """
@@ -1,4 +1,6 @@
 from datetime import datetime
+from unittest.mock import patch
+import time
 
 from model_bakery import baker
 import responses
@@ -20,6 +22,7 @@ from ..authentication import (
     get_fxa_uid_from_oauth_token,
     introspect_token,
     INTROSPECT_TOKEN_URL,
+    TOKEN_CACHE_SECONDS,
 )
 
 
@@ -88,6 +91,40 @@ class AuthenticationMiscellaneous(TestCase):
         assert responses.assert_call_count(self.fxa_verify_path, 1) is True
         assert fxa_resp_data == expected_fxa_resp_data
 
+    def test_get_cache_key_is_stable_keyed_digest(self):
+        cache_key = get_cache_key("user-123")
+        assert cache_key == get_cache_key("user-123")
+        assert cache_key != get_cache_key("user-456")
+        assert "user-123" not in cache_key
+        with self.settings(SECRET_KEY="another-secret-key"):
+            assert get_cache_key("user-123") != cache_key
+
+    @responses.activate
+    def test_get_fxa_uid_from_oauth_token_uses_in_process_cache(self):
+        user_token = "user-123"
+        now_time = int(datetime.now().timestamp())
+        # Note: FXA iat and exp are timestamps in *milliseconds*
+        exp_time = (now_time + 60 * 60) * 1000
+        _setup_fxa_response(200, {"active": True, "sub": self.uid, "exp": exp_time})
+
+        assert get_fxa_uid_from_oauth_token(user_token) == self.uid
+        assert responses.assert_call_count(self.fxa_verify_path, 1) is True
+
+        # The in-process cache answers without the Django cache or FxA
+        with patch(f"{MOCK_BASE}.cache") as mocked_cache:
+            assert get_fxa_uid_from_oauth_token(user_token) == self.uid
+        mocked_cache.get.assert_not_called()
+        mocked_cache.set.assert_not_called()
+        assert responses.assert_call_count(self.fxa_verify_path, 1) is True
+
+        # After TOKEN_CACHE_SECONDS, the response is read from the Django cache
+        expired = time.monotonic() + TOKEN_CACHE_SECONDS + 1
+        with patch(f"{MOCK_BASE}.time.monotonic", return_value=expired):
+            with patch(f"{MOCK_BASE}.cache.get", wraps=cache.get) as mocked_get:
+                assert get_fxa_uid_from_oauth_token(user_token) == self.uid
+        mocked_get.assert_called_once_with(get_cache_key(user_token))
+        assert responses.assert_call_count(self.fxa_verify_path, 1) is True
+
     @responses.activate
     def test_get_fxa_uid_from_oauth_token_returns_cached_response(self):
         user_token = "user-123"
@@ -0,0 +1,15 @@
+"""Shared fixtures for api tests"""
+
+from typing import Iterator
+
+import pytest
+
+from api.authentication import _token_cache
+
+
+@pytest.fixture(autouse=True)
+def token_cache() -> Iterator[None]:
+    """Forget the introspection responses cached in-process by a test."""
+    _token_cache.clear()
+    yield
+    _token_cache.clear()
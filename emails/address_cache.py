@@ -0,0 +1,243 @@
+"""
+Cache the forwarding state of Relay addresses, for inbound emails.
+
+Each inbound email needs the address and the state of its owner, such as if the
+address is enabled, if the owner is premium, and the owner's email address. These
+are cached as two entries, so that a change to an owner updates all their addresses:
+
+* The address state, keyed by the hash of the normalized email address
+* The owner state, keyed by the user ID
+
+The signals in emails.signals forget entries when the models are saved or deleted
+with changed values, including Mozilla account updates. An entry is also forgotten
+when the transaction commits, in case it was cached from the old values in the
+meantime. Entries expire after settings.ADDRESS_CACHE_SECONDS.
+
+A forgotten entry is replaced by a marker for FORGOTTEN_SECONDS, and snapshots are
+only cached with cache.add, which does not replace the marker. Without it, a process
+that loaded the old values before the commit could cache them after the commit,
+and they would be used until they expired.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha256
+from typing import Any
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+
+from .models import (
+    account_is_flagged,
+    bounce_is_recent,
+    BounceStatus,
+    DomainAddress,
+    Profile,
+    RelayAddress,
+)
+
+# Stored in place of a forgotten entry, for longer than loading a snapshot takes
+FORGOTTEN = "forgotten"
+FORGOTTEN_SECONDS = 10
+
+
+@dataclass(frozen=True)
+class AddressState:
+    """The forwarding state of a RelayAddress or DomainAddress."""
+
+    is_domain_address: bool
+    id: int
+    user_id: int
+    enabled: bool
+    block_list_emails: bool
+
+    @classmethod
+    def from_address(cls, address: RelayAddress | DomainAddress) -> AddressState:
+        return cls(
+            is_domain_address=isinstance(address, DomainAddress),
+            id=address.id,
+            user_id=address.user_id,
+            enabled=address.enabled,
+            block_list_emails=address.block_list_emails,
+        )
+
+    @property
+    def model(self) -> type[RelayAddress] | type[DomainAddress]:
+        return DomainAddress if self.is_domain_address else RelayAddress
+
+
+@dataclass(frozen=True)
+class OwnerState:
+    """The forwarding state of the user and profile that own an address."""
+
+    user_id: int
+    profile_id: int
+    email: str
+    is_staff: bool
+    is_superuser: bool
+    subdomain: str | None
+    language: str
+    has_premium: bool
+    auto_block_spam: bool
+    remove_level_one_email_trackers: bool
+    last_account_flagged: datetime | None
+    last_hard_bounce: datetime | None
+    last_soft_bounce: datetime | None
+
+    @classmethod
+    def from_profile(cls, profile: Profile) -> OwnerState:
+        """Get the owner state, from a profile with the user and social accounts."""
+        return cls(
+            user_id=profile.user_id,
+            profile_id=profile.id,
+            email=profile.user.email,
+            is_staff=profile.user.is_staff,
+            is_superuser=profile.user.is_superuser,
+            subdomain=profile.subdomain,
+            language=profile.language,
+            has_premium=profile.has_premium,
+            auto_block_spam=profile.auto_block_spam,
+            remove_level_one_email_trackers=bool(
+                profile.remove_level_one_email_trackers
+            ),
+            last_account_flagged=profile.last_account_flagged,
+            last_hard_bounce=profile.last_hard_bounce,
+            last_soft_bounce=profile.last_soft_bounce,
+        )
+
+    @property
+    def is_flagged(self) -> bool:
+        return account_is_flagged(self.last_account_flagged)
+
+    @property
+    def user(self) -> User:
+        """An unsaved User with the fields used by flag checks."""
+        return User(
+            id=self.user_id,
+            email=self.email,
+            is_staff=self.is_staff,
+            is_superuser=self.is_superuser,
+        )
+
+    def check_bounce_pause(self) -> BounceStatus:
+        """Check for a bounce pause, like Profile.check_bounce_pause."""
+        for bounce_type, last_bounce in (
+            ("hard", self.last_hard_bounce),
+            ("soft", self.last_soft_bounce),
+        ):
+            if last_bounce:
+                if bounce_is_recent(last_bounce, bounce_type):
+                    return BounceStatus(True, bounce_type)
+                # Let the profile clear the expired bounce, which forgets this state
+                return self.get_profile().check_bounce_pause()
+        return BounceStatus(False, "")
+
+    def get_profile(self) -> Profile:
+        """Load the profile and user from the database."""
+        return Profile.objects.select_related("user").get(id=self.profile_id)
+
+
+@dataclass(frozen=True)
+class AddressSnapshot:
+    address: AddressState
+    owner: OwnerState
+
+    @classmethod
+    def from_address(cls, address: RelayAddress | DomainAddress) -> AddressSnapshot:
+        prefetch_related_objects([address.user], "socialaccount_set", "profile")
+        return cls(
+            address=AddressState.from_address(address),
+            owner=OwnerState.from_profile(address.user.profile),
+        )
+
+
+def _address_key(local_portion: str, domain_portion: str) -> str:
+    email = f"{local_portion}@{domain_portion}".lower()
+    return f"address_state:{sha256(email.encode()).hexdigest()}"
+
+
+def _owner_key(user_id: int) -> str:
+    return f"address_owner_state:{user_id}"
+
+
+def _get(key: str) -> Any:
+    """Get a cache entry, or None if it is not cached or forgotten."""
+    value = cache.get(key)
+    return None if value == FORGOTTEN else value
+
+
+def _forget(key: str) -> None:
+    cache.set(key, FORGOTTEN, FORGOTTEN_SECONDS)
+    transaction.on_commit(lambda: cache.set(key, FORGOTTEN, FORGOTTEN_SECONDS))
+
+
+def get_snapshot(local_portion: str, domain_portion: str) -> AddressSnapshot | None:
+    """Get the cached snapshot of an address, or None if it is not cached."""
+    if settings.ADDRESS_CACHE_SECONDS <= 0:
+        return None
+    address = _get(_address_key(local_portion, domain_portion))
+    if address is None:
+        return None
+    owner = _get(_owner_key(address.user_id))
+    if owner is None:
+        return None
+    if address.is_domain_address:
+        subdomain = domain_portion.lower().split(".", 1)[0]
+        if owner.subdomain != subdomain:
+            return None
+    return AddressSnapshot(address=address, owner=owner)
+
+
+def set_snapshot(
+    local_portion: str, domain_portion: str, snapshot: AddressSnapshot
+) -> None:
+    """Cache the snapshot, unless its entries are cached or were just forgotten."""
+    if settings.ADDRESS_CACHE_SECONDS <= 0:
+        return
+    for key, value in (
+        (_address_key(local_portion, domain_portion), snapshot.address),
+        (_owner_key(snapshot.owner.user_id), snapshot.owner),
+    ):
+        cache.add(key, value, settings.ADDRESS_CACHE_SECONDS)
+
+
+def forget_address(local_portion: str, domain_portion: str) -> None:
+    _forget(_address_key(local_portion, domain_portion))
+
+
+def forget_owner(user_id: int) -> None:
+    _forget(_owner_key(user_id))
+
+
+def address_saved(
+    local_portion: str, domain_portion: str, address: RelayAddress | DomainAddress
+) -> None:
+    """
+    Forget the cached address state, unless the saved address has the same state.
+
+    If it is not cached, it is forgotten anyway, in case another process is loading
+    the old state.
+    """
+    key = _address_key(local_portion, domain_portion)
+    if _get(key) != AddressState.from_address(address):
+        _forget(key)
+
+
+def owner_saved(user_id: int, **values: Any) -> None:
+    """Forget the cached owner state, unless it is cached with the same values."""
+    key = _owner_key(user_id)
+    cached = _get(key)
+    if cached is None or any(
+        getattr(cached, name) != value for name, value in values.items()
+    ):
+        _forget(key)
+
+
+def cached_subdomain(user_id: int) -> str | None:
+    """Get the subdomain of a user from the cached owner state, if cached."""
+    cached = _get(_owner_key(user_id))
+    return None if cached is None else cached.subdomain
@@ -0,0 +1,207 @@
+"""
+Filter out emails to unknown Relay addresses, without a database query.
+
+A Bloom filter of the live RelayAddresses can say that an address is definitely
+not live, or that it may be live, with a false positive rate near
+settings.ADDRESS_FILTER_ERROR_RATE. Addresses on subdomains are not included,
+since an unknown address on a subdomain is created when it is emailed.
+
+The filter is built by the build_address_filter command, and shared through the
+Django cache. The command should run more often than
+settings.ADDRESS_FILTER_MAX_AGE_SECONDS, after which a filter is not used. Each
+process loads the filter from the cache, and checks for a rebuilt filter at most
+every settings.ADDRESS_FILTER_REFRESH_SECONDS.
+
+Addresses created after a filter is built are recorded in separate cache entries,
+which are checked before an address is reported as unknown. They expire after
+twice the maximum age of a filter, when they are included in a newer filter. If the
+cache fails, or has lost the filter's entries, all addresses might exist.
+
+The loaded filter is replaced as a whole, so threads that check addresses while
+another thread loads a new filter see either the old or the new filter.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Iterator
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DOMAIN_CHOICES, RelayAddress
+from .utils import get_domains_from_settings
+
+FILTER_KEY = "address_filter"
+FILTER_BUILT_AT_KEY = "address_filter_built_at"
+NEW_ADDRESS_KEY_PREFIX = "address_filter_new"
+
+logger = logging.getLogger("events")
+
+
+class BloomFilter:
+    """A Bloom filter of strings, with double hashing of SHA-256 digests."""
+
+    def __init__(
+        self, num_bits: int, num_hashes: int, bits: bytes | None = None
+    ) -> None:
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits or (num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> BloomFilter:
+        """Create a filter with the optimal size for a number of items."""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = sha256(item.encode()).digest()
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:16], "big") | 1
+        for num in range(self.num_hashes):
+            yield (first + num * step) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+@dataclass(frozen=True)
+class LoadedFilter:
+    """The filter loaded by this process."""
+
+    bloom: BloomFilter | None = None
+    built_at: float | None = None
+    checked_at: float = -math.inf  # monotonic time
+
+
+_loaded = LoadedFilter()
+
+
+def address_item(local_portion: str, domain_portion: str) -> str:
+    return f"{local_portion}@{domain_portion}".lower()
+
+
+def _new_address_key(item: str) -> str:
+    return f"{NEW_ADDRESS_KEY_PREFIX}:{sha256(item.encode()).hexdigest()}"
+
+
+def build_address_filter(error_rate: float | None = None) -> BloomFilter:
+    """Build a filter of the live RelayAddresses."""
+    if error_rate is None:
+        error_rate = settings.ADDRESS_FILTER_ERROR_RATE
+    domains = get_domains_from_settings()
+    domain_names = {number: domains[name] for number, name in DOMAIN_CHOICES}
+    bloom = BloomFilter.for_capacity(RelayAddress.objects.count(), error_rate)
+    addresses = RelayAddress.objects.values_list("address", "domain")
+    for address, domain in addresses.iterator(chunk_size=10_000):
+        bloom.add(address_item(address, domain_names[domain]))
+    return bloom
+
+
+def store_address_filter(bloom: BloomFilter, built_at: float) -> None:
+    """Share a filter with the other processes."""
+    cache.set_many(
+        {
+            FILTER_KEY: {
+                "built_at": built_at,
+                "num_bits": bloom.num_bits,
+                "num_hashes": bloom.num_hashes,
+                "bits": bytes(bloom.bits),
+            },
+            FILTER_BUILT_AT_KEY: built_at,
+        },
+        settings.ADDRESS_FILTER_MAX_AGE_SECONDS,
+    )
+
+
+def record_new_address(local_portion: str, domain_portion: str) -> None:
+    """
+    Record an address created after the filter was built.
+
+    If it can not be recorded, the shared filter is dropped, so that it does not
+    report the new address as unknown.
+    """
+    global _loaded
+    try:
+        cache.set(
+            _new_address_key(address_item(local_portion, domain_portion)),
+            True,
+            2 * settings.ADDRESS_FILTER_MAX_AGE_SECONDS,
+        )
+    except Exception:
+        logger.exception("address_filter_record_failed")
+        _loaded = LoadedFilter(checked_at=time.monotonic())
+        try:
+            cache.delete(FILTER_BUILT_AT_KEY)
+        except Exception:
+            logger.exception("address_filter_drop_failed")
+
+
+def _load_filter(checked_at: float) -> LoadedFilter:
+    """Load the shared filter, if it was rebuilt since the loaded filter."""
+    built_at = cache.get(FILTER_BUILT_AT_KEY)
+    if built_at is None:
+        return LoadedFilter(checked_at=checked_at)
+    if built_at == _loaded.built_at:
+        return LoadedFilter(_loaded.bloom, _loaded.built_at, checked_at)
+    data = cache.get(FILTER_KEY)
+    if data is None:
+        return LoadedFilter(checked_at=checked_at)
+    bloom = BloomFilter(data["num_bits"], data["num_hashes"], data["bits"])
+    return LoadedFilter(bloom, data["built_at"], checked_at)
+
+
+def _get_filter() -> BloomFilter | None:
+    """Get the shared filter, or None if there is no current filter."""
+    global _loaded
+    loaded = _loaded
+    now = time.monotonic()
+    if now - loaded.checked_at >= settings.ADDRESS_FILTER_REFRESH_SECONDS:
+        try:
+            loaded = _load_filter(now)
+        except Exception:
+            logger.exception("address_filter_load_failed")
+            loaded = LoadedFilter(checked_at=now)
+        _loaded = loaded
+    if (
+        loaded.built_at is None
+        or time.time() - loaded.built_at > settings.ADDRESS_FILTER_MAX_AGE_SECONDS
+    ):
+        return None
+    return loaded.bloom
+
+
+def might_exist(local_portion: str, domain_portion: str) -> bool:
+    """
+    Return False if the address on a Relay domain is definitely not live.
+
+    Without a current filter, all addresses might exist. The new addresses are read
+    with the shared filter's timestamp, which is missing if the cache failed or
+    lost its entries, so that a new address is not reported as unknown.
+    """
+    bloom = _get_filter()
+    if bloom is None:
+        return True
+    item = address_item(local_portion, domain_portion)
+    if item in bloom:
+        return True
+    new_address_key = _new_address_key(item)
+    try:
+        found = cache.get_many([new_address_key, FILTER_BUILT_AT_KEY])
+    except Exception:
+        logger.exception("address_filter_check_failed")
+        return True
+    return new_address_key in found or FILTER_BUILT_AT_KEY not in found
@@ -0,0 +1,236 @@
+"""
+Write-behind counters for the email statistics of addresses and profiles.
+
+Each processed email used to update its address and profile rows, so emails to a
+popular address waited on the row lock. Instead, the changes are recorded in the
+Django cache (Redis in production), and flush_counters writes them to the database,
+with one UPDATE per row, like SET num_forwarded = num_forwarded + 3:
+
+* Counters, like num_forwarded, are incremented with cache.incr.
+* Timestamps, like last_used_at, keep the latest value.
+
+The pending changes are shared, so add_pending_counts can add them to models read
+from the database, for read-your-writes in the API. The rows with pending changes
+are logged in the cache as well, in numbered entries, so any process can flush
+them, including the changes of a process that was killed before its flush. The
+email processors flush after each batch, and the SNS webhook at most once a minute.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Iterable
+import logging
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+logger = logging.getLogger("events")
+
+# The write-behind fields, by model label
+ADDRESS_COUNTER_FIELDS = (
+    "num_forwarded",
+    "num_blocked",
+    "num_level_one_trackers_blocked",
+)
+COUNTER_FIELDS: dict[str, tuple[str, ...]] = {
+    "emails.relayaddress": ADDRESS_COUNTER_FIELDS,
+    "emails.domainaddress": ADDRESS_COUNTER_FIELDS,
+}
+TIMESTAMP_FIELDS: dict[str, tuple[str, ...]] = {
+    "emails.relayaddress": ("last_used_at",),
+    "emails.domainaddress": ("last_used_at",),
+    "emails.profile": ("last_engagement",),
+}
+
+# Pending changes expire if not flushed, such as when no process flushes them
+PENDING_SECONDS = 7 * 24 * 60 * 60
+# One process flushes at a time
+FLUSH_LOCK_SECONDS = 60
+# The SNS webhook flushes if no process has flushed for this long
+WEBHOOK_FLUSH_SECONDS = 60
+# The number of log entries read per cache request
+FLUSH_CHUNK_SIZE = 1000
+
+# The number of the last log entry, and of the last flushed entry
+LOG_SEQ_KEY = "counter_log_seq"
+LOG_CURSOR_KEY = "counter_log_cursor"
+# The first missing log entry, skipped if still missing on the next flush
+LOG_GAP_KEY = "counter_log_gap"
+FLUSH_LOCK_KEY = "counter_flush_lock"
+FLUSHED_KEY = "counter_flushed"
+
+
+def _key(label: str, pk: int, field: str) -> str:
+    return f"counter:{label}:{pk}:{field}"
+
+
+def _dirty_key(label: str, pk: int) -> str:
+    return f"counter_dirty:{label}:{pk}"
+
+
+def _log_key(seq: int) -> str:
+    return f"counter_log:{seq}"
+
+
+def _fields(label: str) -> tuple[str, ...]:
+    return COUNTER_FIELDS.get(label, ()) + TIMESTAMP_FIELDS.get(label, ())
+
+
+def _incr(key: str, delta: int, timeout: int | None) -> int:
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, delta, timeout):
+            return delta
+        return cache.incr(key, delta)
+
+
+def _mark_dirty(label: str, pk: int) -> None:
+    """Log the row as changed, unless it is logged and not flushed yet."""
+    if cache.add(_dirty_key(label, pk), True, PENDING_SECONDS):
+        seq = _incr(LOG_SEQ_KEY, 1, None)
+        cache.set(_log_key(seq), (label, pk), PENDING_SECONDS)
+
+
+def increment(model: type[models.Model], pk: int, field: str, delta: int = 1) -> None:
+    """Add to a counter, like num_forwarded, of a row."""
+    label = model._meta.label_lower
+    assert field in COUNTER_FIELDS[label]
+    _incr(_key(label, pk, field), delta, PENDING_SECONDS)
+    _mark_dirty(label, pk)
+
+
+def set_latest(model: type[models.Model], pk: int, field: str, value: datetime) -> None:
+    """Set a timestamp, like last_used_at, of a row, unless it has a later one."""
+    label = model._meta.label_lower
+    assert field in TIMESTAMP_FIELDS[label]
+    key = _key(label, pk, field)
+    timestamp = value.timestamp()
+    if not cache.add(key, timestamp, PENDING_SECONDS):
+        pending = cache.get(key)
+        if pending is None or pending < timestamp:
+            cache.set(key, timestamp, PENDING_SECONDS)
+    _mark_dirty(label, pk)
+
+
+def add_pending_counts(instances: Iterable[models.Model]) -> None:
+    """Add the pending changes to models loaded from the database."""
+    keys: dict[str, tuple[models.Model, str]] = {}
+    for instance in instances:
+        if getattr(instance, "_pending_counts_added", False):
+            continue
+        instance._pending_counts_added = True  # type: ignore[attr-defined]
+        label = instance._meta.label_lower
+        for field in _fields(label):
+            keys[_key(label, instance.pk, field)] = (instance, field)
+    if not keys:
+        return
+    for key, pending in cache.get_many(list(keys)).items():
+        instance, field = keys[key]
+        current = getattr(instance, field)
+        if field in COUNTER_FIELDS[instance._meta.label_lower]:
+            setattr(instance, field, (current or 0) + pending)
+        else:
+            latest = datetime.fromtimestamp(pending, timezone.utc)
+            if current is None or latest > current:
+                setattr(instance, field, latest)
+
+
+def flush_counters() -> int:
+    """
+    Write the pending changes of the rows in the log.
+
+    Returns the number of rows updated. If another process is flushing, this
+    returns 0, and leaves the new entries for the next flush.
+    """
+    if not cache.add(FLUSH_LOCK_KEY, True, FLUSH_LOCK_SECONDS):
+        return 0
+    try:
+        num_updated = 0
+        head = cache.get(LOG_SEQ_KEY, 0)
+        cursor = cache.get(LOG_CURSOR_KEY, 0)
+        if cursor > head:
+            # The log was reset, such as by clearing the cache
+            cursor = 0
+        while cursor < head:
+            seqs = range(cursor + 1, min(cursor + FLUSH_CHUNK_SIZE, head) + 1)
+            log_keys = [_log_key(seq) for seq in seqs]
+            entries = cache.get_many(log_keys)
+            missing = [seq for seq in seqs if _log_key(seq) not in entries]
+            if missing and missing[0] == cache.get(LOG_GAP_KEY):
+                logger.error("counter_log_entry_missing", extra={"seq": missing[0]})
+                missing = missing[1:]
+            if missing:
+                # The entry can be numbered but not yet written, so stop before it
+                cache.set(LOG_GAP_KEY, missing[0], PENDING_SECONDS)
+                seqs = range(cursor + 1, missing[0])
+                log_keys = log_keys[: len(seqs)]
+                head = missing[0] - 1
+            num_updated += _flush_rows(
+                {entries[key] for key in log_keys if key in entries}
+            )
+            if seqs:
+                cursor = seqs[-1]
+                cache.set(LOG_CURSOR_KEY, cursor, None)
+                cache.delete_many(log_keys)
+        cache.set(FLUSHED_KEY, True, WEBHOOK_FLUSH_SECONDS)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return num_updated
+
+
+def flush_counters_if_due() -> int:
+    """Write the pending changes, unless a process has flushed them recently."""
+    if cache.get(FLUSHED_KEY):
+        return 0
+    return flush_counters()
+
+
+def _flush_rows(rows: set[tuple[str, int]]) -> int:
+    """Write the pending changes of the rows, and return the number updated."""
+    if not rows:
+        return 0
+    # Changes made after this point log the row again
+    cache.delete_many([_dirty_key(label, pk) for label, pk in rows])
+
+    keys = {
+        _key(label, pk, field): (label, pk, field)
+        for label, pk in rows
+        for field in _fields(label)
+    }
+    pending = cache.get_many(list(keys))
+    updates: dict[tuple[str, int], dict[str, Any]] = {}
+    counted: dict[str, int] = {}
+    timestamps: dict[str, float] = {}
+    for key, value in pending.items():
+        label, pk, field = keys[key]
+        if field in COUNTER_FIELDS.get(label, ()):
+            if not value:
+                continue
+            new_value: Any = Coalesce(F(field), 0) + value
+            counted[key] = value
+        else:
+            latest = Value(datetime.fromtimestamp(value, timezone.utc))
+            new_value = Coalesce(Greatest(F(field), latest), latest)
+            timestamps[key] = value
+        updates.setdefault((label, pk), {})[field] = new_value
+
+    num_updated = 0
+    with transaction.atomic():
+        for (label, pk), values in updates.items():
+            model = apps.get_model(label)
+            num_updated += model._default_manager.filter(pk=pk).update(**values)
+
+    for key, value in counted.items():
+        try:
+            cache.decr(key, value)
+        except ValueError:
+            logger.warning("counter_expired", extra={"key": key})
+    # Keep the timestamps set again since they were read
+    current = cache.get_many(list(timestamps))
+    cache.delete_many(
+        [key for key, value in timestamps.items() if current.get(key) == value]
+    )
+    return num_updated
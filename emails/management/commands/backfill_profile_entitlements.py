@@ -0,0 +1,52 @@
+"""
+Set the entitlements of profiles from their Mozilla account data.
+
+The entitlements are updated when the Mozilla account data is saved, and were set
+for existing profiles by a migration. Run this command to re-sync them, such as after
+the subscription settings change.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails import address_cache
+from emails.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Set the entitlements of profiles from their Mozilla account data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="The number of profiles to load and update per query",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("The batch size must be at least 1.")
+        profiles = (
+            Profile.objects.select_related("user")
+            .prefetch_related("user__socialaccount_set")
+            .order_by("id")
+        )
+        checked = updated = 0
+        last_id = 0
+        while batch := list(profiles.filter(id__gt=last_id)[:batch_size]):
+            last_id = batch[-1].id
+            changed = [
+                profile
+                for profile in batch
+                if profile.update_entitlements(profile.fxa, save=False)
+            ]
+            Profile.objects.bulk_update(changed, Profile.ENTITLEMENT_FIELDS)
+            # bulk_update skips the signals that forget the cached owner state
+            for profile in changed:
+                address_cache.forget_owner(profile.user_id)
+            checked += len(batch)
+            updated += len(changed)
+        self.stdout.write(
+            f"Updated the entitlements of {updated} of {checked} profiles."
+        )
@@ -0,0 +1,378 @@
+"""
+Benchmark forwarding emails, without AWS.
+
+SNS notifications are replayed through the same code as process_emails_from_sqs,
+starting at _sns_inbound_logic, with local stand-ins for the SQS queue, the S3
+bucket of stored emails, and the SES client. The SNS signatures are not verified,
+since the notifications are not signed.
+
+The notifications come from a corpus file, with one SNS notification in JSON per
+line, and the S3-stored emails from a directory, at <s3-dir>/<bucket>/<key>.
+Use generate_email_corpus to generate a corpus. Without a corpus, synthetic emails
+are generated from a seed, like generate_email_corpus, with half of the emails in
+the notification and half stored in S3.
+
+Relay addresses and users are created for the recipients, and the tracker_removal
+flag is enabled. All database changes are rolled back at the end, and the cached
+states of the created addresses are forgotten (see emails.address_cache).
+
+The report includes messages per second, the latency percentiles of each stage of
+processing (see emails.utils.email_stage), and the peak memory (RSS). The results
+can be saved with --output, and compared to an earlier run with --baseline.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+from random import Random
+from typing import Any, Iterable, Iterator
+import json
+import math
+import resource
+import sys
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from codetiming import Timer
+from waffle.testutils import override_flag
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.http import HttpResponse
+
+from emails import address_cache
+from emails.apps import emails_config
+from emails.counters import flush_counters
+from emails.models import get_domain_numerical, Profile, RelayAddress
+from emails.management.email_corpus import (
+    CORPUS_BUCKET,
+    EmailCorpus,
+    ses_notification,
+)
+from emails.utils import get_domains_from_settings, stage_timer
+from emails.views import _get_relay_recipient_from_message_json, _sns_inbound_logic
+
+
+# Emails larger than this are stored in S3, like the SES limit for SNS content
+SNS_CONTENT_MAX_BYTES = 150 * 1024
+
+PERCENTILES = (50, 95, 99)
+STAT_KEYS = ("p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+class LocalQueue:
+    """A stand-in for an SQS queue, with messages from an iterable."""
+
+    def __init__(self, bodies: Iterable[str]) -> None:
+        self._bodies = iter(bodies)
+        self._count = 0
+
+    def receive_messages(self, MaxNumberOfMessages: int = 1) -> list["LocalMessage"]:
+        messages = []
+        for body in islice(self._bodies, MaxNumberOfMessages):
+            self._count += 1
+            messages.append(LocalMessage(body, f"local-{self._count}"))
+        return messages
+
+
+class LocalMessage:
+    """A stand-in for an SQS message."""
+
+    def __init__(self, body: str, message_id: str) -> None:
+        self.body = body
+        self.message_id = message_id
+
+
+class LocalS3Client:
+    """
+    A stand-in for the S3 client, with objects in memory or in a directory.
+
+    Objects are not deleted, so that the corpus can be replayed.
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        self.directory = directory
+        self.objects: dict[tuple[str, str], bytes] = {}
+
+    def get_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        data = self.objects.get((Bucket, Key))
+        if data is None and self.directory:
+            path = self.directory / Bucket / Key.lstrip("/")
+            if path.is_file():
+                data = path.read_bytes()
+        if data is None:
+            raise ClientError(
+                operation_name="S3.get_object",
+                error_response={"Error": {"Code": "NoSuchKey", "Message": Key}},
+            )
+        return {"Body": StreamingBody(BytesIO(data), len(data))}
+
+    def delete_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        return {"DeleteMarker": True}
+
+
+class LocalSESClient:
+    """A stand-in for the SES client, which counts the sent emails."""
+
+    def __init__(self) -> None:
+        self.sent_count = 0
+        self.sent_bytes = 0
+
+    def send_raw_email(self, **kwargs: Any) -> dict[str, Any]:
+        self.sent_count += 1
+        self.sent_bytes += len(kwargs["RawMessage"]["Data"])
+        return {"MessageId": f"local-sent-{self.sent_count}"}
+
+    def send_email(self, **kwargs: Any) -> dict[str, Any]:
+        self.sent_count += 1
+        return {"MessageId": f"local-sent-{self.sent_count}"}
+
+
+@contextmanager
+def local_aws_clients(
+    ses_client: LocalSESClient, s3_client: LocalS3Client
+) -> Iterator[None]:
+    """Replace the cached AWS clients of the emails app with local stand-ins."""
+    config = emails_config()
+    saved = {
+        name: config.__dict__[name]
+        for name in ("ses_client", "s3_client")
+        if name in config.__dict__
+    }
+    config.__dict__["ses_client"] = ses_client
+    config.__dict__["s3_client"] = s3_client
+    try:
+        yield
+    finally:
+        for name in ("ses_client", "s3_client"):
+            config.__dict__.pop(name, None)
+        config.__dict__.update(saved)
+
+
+def synthetic_notifications(
+    count: int, seed: int, s3_client: LocalS3Client
+) -> Iterator[str]:
+    """
+    Generate SNS notifications of synthetic emails.
+
+    Emails too large for SNS, and half of the others, are stored in the local S3
+    client.
+    """
+    rng = Random(seed)
+    for email in EmailCorpus(seed).emails(count):
+        if len(email.raw) > SNS_CONTENT_MAX_BYTES or rng.random() < 0.5:
+            s3_client.objects[(CORPUS_BUCKET, email.object_key)] = email.raw
+            yield json.dumps(ses_notification(email, bucket=CORPUS_BUCKET))
+        else:
+            yield json.dumps(ses_notification(email))
+
+
+def corpus_notifications(path: Path) -> Iterator[str]:
+    """Read SNS notifications from a file, one per line."""
+    with path.open() as corpus_file:
+        for line in corpus_file:
+            if line.strip():
+                yield line
+
+
+def percentiles(times: list[float]) -> dict[str, float]:
+    """Get the nearest-rank percentiles and maximum of times, in milliseconds."""
+    ordered = sorted(times)
+    result = {}
+    for percent in PERCENTILES:
+        index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+        result[f"p{percent}_ms"] = round(ordered[index] * 1000, 3)
+    result["max_ms"] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+def change_from(value: float, base: float | None) -> str:
+    """Format the change from a baseline value, or an empty string."""
+    if not base:
+        return ""
+    return f" ({(value - base) / base:+.1%})"
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident memory of this process, in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes on Linux
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / scale, 1)
+
+
+class Command(BaseCommand):
+    help = "Benchmark forwarding emails, with local stand-ins for AWS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--corpus",
+            type=Path,
+            help="File of SNS notifications, one per line (default: synthetic)",
+        )
+        parser.add_argument(
+            "--s3-dir",
+            type=Path,
+            help="Directory of S3-stored emails for the corpus, as <bucket>/<key>",
+        )
+        parser.add_argument(
+            "--count", type=int, default=200, help="Number of synthetic emails"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for synthetic emails"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Times to replay the notifications"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=10, help="Messages per queue receive"
+        )
+        parser.add_argument("--output", type=Path, help="Save the results as JSON")
+        parser.add_argument(
+            "--baseline", type=Path, help="Compare to results saved by --output"
+        )
+
+    def handle(self, *args, **options):
+        if options["corpus"] and not options["corpus"].is_file():
+            raise CommandError(f"Corpus file {options['corpus']} not found.")
+        baseline = None
+        if options["baseline"]:
+            baseline = json.loads(options["baseline"].read_text())
+
+        self.ses_client = LocalSESClient()
+        self.s3_client = LocalS3Client(options["s3_dir"])
+        self.addresses: set[str] = set()
+        self.created: list[tuple[str, str, int]] = []
+        try:
+            with transaction.atomic():
+                with (
+                    override_flag("tracker_removal", active=True),
+                    local_aws_clients(self.ses_client, self.s3_client),
+                ):
+                    results = self.run_benchmark(options)
+                transaction.set_rollback(True)
+        finally:
+            for local_address, domain, user_id in self.created:
+                address_cache.forget_address(local_address, domain)
+                address_cache.forget_owner(user_id)
+
+        self.report(results, baseline)
+        if options["output"]:
+            options["output"].write_text(json.dumps(results, indent=2) + "\n")
+
+    def run_benchmark(self, options: dict[str, Any]) -> dict[str, Any]:
+        """Replay the notifications, and return the results."""
+        statuses: Counter[str] = Counter()
+        stage_times: dict[str, list[float]] = {}
+        message_times: list[float] = []
+        for _ in range(options["repeat"]):
+            if options["corpus"]:
+                bodies = corpus_notifications(options["corpus"])
+            else:
+                bodies = synthetic_notifications(
+                    options["count"], options["seed"], self.s3_client
+                )
+            queue = LocalQueue(bodies)
+            while batch := queue.receive_messages(options["batch_size"]):
+                for message in batch:
+                    self.create_recipient(message)
+                    with stage_timer() as timer, Timer(logger=None) as message_timer:
+                        status = self.process_message(message)
+                    statuses[str(status)] += 1
+                    message_times.append(message_timer.last)
+                    for name, elapsed in timer.stages.items():
+                        stage_times.setdefault(name, []).append(elapsed)
+                with Timer(logger=None) as flush_timer:
+                    flush_counters()
+                stage_times.setdefault("flush_counters", []).append(flush_timer.last)
+
+        if not message_times:
+            raise CommandError("No notifications to process.")
+        process_s = sum(message_times)
+        return {
+            "messages": len(message_times),
+            "process_s": round(process_s, 3),
+            "messages_per_s": round(len(message_times) / process_s, 1),
+            "statuses": dict(sorted(statuses.items())),
+            "emails_sent": self.ses_client.sent_count,
+            "sent_bytes": self.ses_client.sent_bytes,
+            "message": percentiles(message_times),
+            "stages": {
+                name: {"count": len(times)} | percentiles(times)
+                for name, times in sorted(stage_times.items())
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def process_message(self, message: LocalMessage) -> int:
+        """Process a message like process_emails_from_sqs, returning the status."""
+        json_body = json.loads(message.body)
+        response: HttpResponse = _sns_inbound_logic(
+            json_body["TopicArn"], json_body["Type"], json_body
+        )
+        return response.status_code
+
+    def create_recipient(self, message: LocalMessage) -> None:
+        """Create a user and Relay address for the recipient, if needed."""
+        try:
+            message_json = json.loads(json.loads(message.body)["Message"])
+            to_address = _get_relay_recipient_from_message_json(message_json)
+            local_portion, domain_portion = to_address.split("@")
+        except (KeyError, TypeError, AttributeError, ValueError):
+            return
+        local_address = local_portion.lower()
+        domain = domain_portion.lower()
+        if (
+            local_address in self.addresses
+            or domain not in get_domains_from_settings().values()
+        ):
+            return
+        self.addresses.add(local_address)
+        if RelayAddress.objects.filter(address=local_address).exists():
+            return
+        user = User.objects.create(
+            username=f"benchmark-{local_address}",
+            email=f"{local_address}@example.com",
+        )
+        # Skip the signals, which expect a Firefox Account
+        Profile.objects.filter(user=user).update(remove_level_one_email_trackers=True)
+        RelayAddress.objects.create(
+            user=user, address=local_address, domain=get_domain_numerical(domain)
+        )
+        self.created.append((local_address, domain, user.id))
+
+    def report(self, results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+        """Write the results, and the changes from the baseline."""
+        base = baseline or {}
+        self.stdout.write(
+            f"Messages: {results['messages']}, statuses: {results['statuses']},"
+            f" emails sent: {results['emails_sent']}"
+        )
+        self.stdout.write(
+            f"Throughput: {results['messages_per_s']} messages/s"
+            + change_from(results["messages_per_s"], base.get("messages_per_s"))
+        )
+        self.stdout.write(
+            f"Peak RSS: {results['peak_rss_mb']} MB"
+            + change_from(results["peak_rss_mb"], base.get("peak_rss_mb"))
+        )
+        self.stdout.write(
+            f"{'stage':<16}{'count':>8}" + "".join(f"{key:>18}" for key in STAT_KEYS)
+        )
+        rows = [
+            ("message", results["messages"], results["message"], base.get("message"))
+        ]
+        for name, stats in results["stages"].items():
+            base_stats = base.get("stages", {}).get(name)
+            rows.append((name, stats["count"], stats, base_stats))
+        for name, count, stats, base_stats in rows:
+            cells = (
+                str(stats[key]) + change_from(stats[key], (base_stats or {}).get(key))
+                for key in STAT_KEYS
+            )
+            self.stdout.write(
+                f"{name:<16}{count:>8}" + "".join(f"{cell:>18}" for cell in cells)
+            )
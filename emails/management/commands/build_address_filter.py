@@ -0,0 +1,40 @@
+"""
+Build the filter of live Relay addresses, and share it through the cache.
+
+Emails to addresses that are not in the filter are rejected without a database
+query (see emails/address_filter.py). Run this command more often than
+ADDRESS_FILTER_MAX_AGE_SECONDS (default one day), such as every hour, or the
+filter expires and every address is looked up in the database.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.address_filter import build_address_filter, store_address_filter
+
+
+class Command(BaseCommand):
+    help = "Build the filter of live Relay addresses for processing emails."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=settings.ADDRESS_FILTER_ERROR_RATE,
+            help="The false positive rate for unknown addresses",
+        )
+
+    def handle(self, *args, **options):
+        error_rate = options["error_rate"]
+        if not 0 < error_rate < 1:
+            raise CommandError("The error rate must be between 0 and 1.")
+        start = time.monotonic()
+        built_at = time.time()
+        bloom = build_address_filter(error_rate)
+        store_address_filter(bloom, built_at)
+        self.stdout.write(
+            f"Built the address filter in {time.monotonic() - start:0.1f}s:"
+            f" {len(bloom.bits)} bytes, {bloom.num_hashes} hashes."
+        )
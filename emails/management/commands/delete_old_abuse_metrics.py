@@ -0,0 +1,42 @@
+"""
+Delete the abuse metrics of previous UTC days.
+
+The abuse metrics of a user are counted per UTC day, and only the current day is
+checked by Profile.update_abuse_metric. Run this command daily, such as just after
+midnight UTC, to keep the table small. Rows are deleted in batches, so that the
+email processors are not blocked by a long delete.
+"""
+
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.models import AbuseMetrics
+
+
+class Command(BaseCommand):
+    help = "Delete the abuse metrics of previous UTC days."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="The number of rows to delete per query",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("The batch size must be at least 1.")
+        midnight_utc_today = datetime.combine(
+            datetime.now(timezone.utc).date(), datetime.min.time(), timezone.utc
+        )
+        old_metrics = AbuseMetrics.objects.filter(first_recorded__lt=midnight_utc_today)
+        deleted = 0
+        while ids := list(old_metrics.values_list("id", flat=True)[:batch_size]):
+            count, _ = AbuseMetrics.objects.filter(id__in=ids).delete()
+            deleted += count
+        self.stdout.write(
+            f"Deleted {deleted} abuse metrics recorded before {midnight_utc_today}."
+        )
@@ -0,0 +1,134 @@
+"""
+Generate a corpus of synthetic emails, for load and regression tests.
+
+The emails are written to the output directory as they are generated, so large
+corpora do not need much memory:
+
+* notifications-content.jsonl - SNS notifications with the email as content
+* notifications-s3.jsonl - SNS notifications with the email stored in S3
+* s3/<bucket>/<key> - The emails stored in S3
+* manifest.json - The options and the count of each kind of email
+
+Each email is in both files of notifications, in the same order. SES only sends
+emails up to 150 KB as content, so larger emails in notifications-content.jsonl
+are larger than production notifications. Use benchmark_email_forwarding to
+replay a corpus:
+
+  benchmark_email_forwarding --corpus <dir>/notifications-s3.jsonl --s3-dir <dir>/s3
+
+The same seed and options generate the same emails. Use --start to generate part
+of a corpus, such as to split a large corpus between processes.
+"""
+
+from collections import Counter
+from pathlib import Path
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emails.management.email_corpus import (
+    ATTACHMENT_MAX_BYTES,
+    CORPUS_BUCKET,
+    EmailCorpus,
+    KINDS,
+    REFERENCES_MAX,
+    ses_notification,
+    TRACKER_DENSITIES,
+)
+
+
+def comma_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def comma_float_list(value):
+    return [float(item) for item in comma_list(value)]
+
+
+class Command(BaseCommand):
+    help = "Generate a corpus of synthetic emails and SES notifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir", type=Path)
+        parser.add_argument(
+            "--count", type=int, default=1000, help="Number of emails to generate"
+        )
+        parser.add_argument(
+            "--start", type=int, default=0, help="Number of the first email"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the emails")
+        parser.add_argument(
+            "--kinds",
+            type=comma_list,
+            default=list(KINDS),
+            help=f"Comma-separated kinds of emails (default: {','.join(KINDS)})",
+        )
+        parser.add_argument(
+            "--tracker-densities",
+            type=comma_float_list,
+            default=list(TRACKER_DENSITIES),
+            help="Comma-separated fractions of HTML links to trackers",
+        )
+        parser.add_argument(
+            "--attachment-max-bytes",
+            type=int,
+            default=ATTACHMENT_MAX_BYTES,
+            help="Maximum size of attachments",
+        )
+        parser.add_argument(
+            "--references-max",
+            type=int,
+            default=REFERENCES_MAX,
+            help="Maximum length of References chains",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            corpus = EmailCorpus(
+                seed=options["seed"],
+                kinds=options["kinds"],
+                tracker_densities=options["tracker_densities"],
+                attachment_max_bytes=options["attachment_max_bytes"],
+                references_max=options["references_max"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output_dir = options["output_dir"]
+        s3_dir = output_dir / "s3" / CORPUS_BUCKET
+        output_dir.mkdir(parents=True, exist_ok=True)
+        kind_counts: Counter[str] = Counter()
+        total_bytes = 0
+        with (
+            (output_dir / "notifications-content.jsonl").open("w") as content_file,
+            (output_dir / "notifications-s3.jsonl").open("w") as s3_file,
+        ):
+            for email in corpus.emails(options["count"], options["start"]):
+                object_path = s3_dir / email.object_key
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                object_path.write_bytes(email.raw)
+                content_file.write(json.dumps(ses_notification(email)) + "\n")
+                s3_file.write(
+                    json.dumps(ses_notification(email, bucket=CORPUS_BUCKET)) + "\n"
+                )
+                kind_counts[email.kind] += 1
+                total_bytes += len(email.raw)
+                generated = sum(kind_counts.values())
+                if generated % 10_000 == 0:
+                    self.stdout.write(f"Generated {generated} emails")
+
+        manifest = {
+            "seed": options["seed"],
+            "start": options["start"],
+            "count": options["count"],
+            "kinds": corpus.kinds,
+            "tracker_densities": corpus.tracker_densities,
+            "attachment_max_bytes": corpus.attachment_max_bytes,
+            "references_max": corpus.references_max,
+            "kind_counts": dict(sorted(kind_counts.items())),
+            "total_bytes": total_bytes,
+        }
+        (output_dir / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n")
+        self.stdout.write(
+            f"Generated {options['count']} emails ({total_bytes} bytes) in {output_dir}"
+        )
@@ -3,10 +3,21 @@ import pathlib
 
 from django.core.management.base import BaseCommand
 
-from emails.utils import download_trackers, shavar_prod_lists_url, store_trackers
+from emails.utils import (
+    build_tracker_index,
+    download_trackers,
+    shavar_prod_lists_url,
+    store_tracker_index,
+    store_trackers,
+    TRACKER_INDEX_FILE_NAME,
+)
 
 EMAILS_FOLDER_PATH = pathlib.Path(__file__).parents[2]
 TRACKER_FOLDER_PATH = EMAILS_FOLDER_PATH / "tracker_lists"
+TRACKER_LISTS = {
+    1: ("Email", "level-one-trackers"),
+    2: ("EmailAggressive", "level-two-trackers"),
+}
 
 
 class Command(BaseCommand):
@@ -30,14 +41,34 @@ class Command(BaseCommand):
         repo_url = options["repo_url"]
         tracker_level = options["tracker_level"]
 
-        category = "Email"
-        tracker_list_name = "level-one-trackers"
-        if tracker_level == 2:
-            category = "EmailAggressive"
-            tracker_list_name = "level-two-trackers"
-
+        category, tracker_list_name = TRACKER_LISTS[tracker_level]
         trackers = download_trackers(repo_url, category)
         file_name = f"{tracker_list_name}.json"
 
         store_trackers(trackers, TRACKER_FOLDER_PATH, file_name)
         print(f"Added {file_name} in {TRACKER_FOLDER_PATH}")
+
+        # Rebuild the index, which email processors reload between batches
+        lists = {tracker_level: trackers}
+        for level in TRACKER_LISTS:
+            if level not in lists:
+                lists[level] = self.load_trackers(repo_url, level)
+        index = build_tracker_index(lists[1], lists[2])
+        store_tracker_index(index, TRACKER_FOLDER_PATH)
+        print(
+            f"Added {TRACKER_INDEX_FILE_NAME} version {index['version']}"
+            f" in {TRACKER_FOLDER_PATH}"
+        )
+
+    def load_trackers(self, repo_url, tracker_level):
+        """Load a stored tracker list, or download and store it if missing."""
+        category, tracker_list_name = TRACKER_LISTS[tracker_level]
+        file_name = f"{tracker_list_name}.json"
+        try:
+            with open(TRACKER_FOLDER_PATH / file_name, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            trackers = download_trackers(repo_url, category)
+            store_trackers(trackers, TRACKER_FOLDER_PATH, file_name)
+            print(f"Added {file_name} in {TRACKER_FOLDER_PATH}")
+            return trackers
@@ -10,6 +10,7 @@ from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from emails.counters import flush_counters
 from emails.sns import verify_from_sns
 from emails.views import _sns_inbound_logic, validate_sns_arn_and_type
 from emails.utils import incr_if_enabled
@@ -73,6 +74,7 @@ class Command(BaseCommand):
                     )
                 finally:
                     message.delete()
+            flush_counters()
             messages = dl_queue.receive_messages(
                 MaxNumberOfMessages=10, WaitTimeSeconds=1
             )
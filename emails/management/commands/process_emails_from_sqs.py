@@ -7,14 +7,52 @@ least one message is available, or wait_seconds is reached.
 See:
 https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/sqs-short-and-long-polling.html#sqs-long-polling
 https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sqs.html#SQS.Queue.receive_messages
+
+The messages in a batch can be processed concurrently on a thread pool, by
+setting PROCESS_EMAIL_CONCURRENCY to more than 1. Each thread uses its own
+database connection, which is closed when the message is processed.
+
+The next batches can be received while the current batch is processed, by
+setting PROCESS_EMAIL_PREFETCH_BATCHES to the number of batches to buffer. The
+visibility timeout of buffered messages is extended until they are processed.
+
+Processed messages are deleted with DeleteMessageBatch, at the end of each batch,
+or sooner if processing the batch is taking more than DELETE_FLUSH_SECONDS.
+
+With --processes N, this process becomes a supervisor for N worker processes,
+forked after Django is set up. Workers that crash are restarted, and SIGTERM is
+forwarded to the workers so they stop after the current cycle. Each worker writes
+to its own healthcheck file, and the supervisor combines them into the healthcheck
+file read by check_health.
+
+With PROCESS_EMAIL_PROFILE_DIR set, the call stacks of each message are sampled,
+and messages taking longer than PROCESS_EMAIL_PROFILE_SECONDS have their profile
+written to that directory, with metadata like the email size and part counts.
+Only the newest PROCESS_EMAIL_PROFILE_MAX_FILES profiles are kept.
+
+The email statistics of addresses and profiles are written to the database after
+each batch (see emails/counters.py).
+
+The tracker index is loaded before the first batch. Between batches, the index
+file is checked, and a new version from get_latest_email_tracker_lists replaces
+the current index without restarting.
 """
 
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from typing import Any
 from urllib.parse import urlsplit
 import gc
 import json
 import logging
+import os
 import shlex
+import signal
+import sys
+import threading
 import time
 
 import boto3
@@ -24,10 +62,18 @@ from markus.utils import generate_tag
 import OpenSSL
 
 from django.core.management.base import CommandError
+from django.db import connections
 
+from emails.counters import flush_counters
 from emails.sns import verify_from_sns
 from emails.views import _sns_inbound_logic, validate_sns_arn_and_type
-from emails.utils import incr_if_enabled, gauge_if_enabled
+from emails.utils import (
+    email_stage,
+    gauge_if_enabled,
+    incr_if_enabled,
+    refresh_tracker_index,
+    stage_timer,
+)
 from emails.management.command_from_django_settings import (
     CommandFromDjangoSettings,
     SettingToLocal,
@@ -35,6 +81,218 @@ from emails.management.command_from_django_settings import (
 
 logger = logging.getLogger("eventsinfo.process_emails_from_sqs")
 
+# Maximum processing time before pending message deletes are sent
+DELETE_FLUSH_SECONDS = 10.0
+
+# Time between samples of call stacks, when profiling slow messages
+PROFILE_SAMPLE_SECONDS = 0.005
+
+
+@dataclass
+class PrefetchedBatch:
+    """A batch of SQS messages, waiting in the prefetch buffer."""
+
+    messages: list
+    refreshed_at: float
+
+
+class MessagePrefetcher:
+    """
+    Receive SQS messages on a background thread, ahead of processing.
+
+    Up to max_batches non-empty batches are held in memory. While waiting, the
+    visibility timeout of held messages is extended when a quarter of it has passed,
+    so they are not sent to another receiver before they are processed.
+
+    The queue should be a boto3 SQS Queue used only by this prefetcher, since boto3
+    resources are not thread-safe.
+    """
+
+    def __init__(
+        self, queue, batch_size, wait_seconds, visibility_seconds, max_batches
+    ):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.wait_seconds = wait_seconds
+        self.visibility_seconds = visibility_seconds
+        self.max_batches = max_batches
+        self.refresh_seconds = visibility_seconds / 4
+        self.buffer: deque[PrefetchedBatch] = deque()
+        self.condition = threading.Condition()
+        self.stop_requested = False
+        self.thread = threading.Thread(
+            target=self.run, name="process_email_prefetch", daemon=True
+        )
+
+    def start(self):
+        """Start receiving messages in the background."""
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop receiving messages, and release any that are still buffered.
+
+        This waits for an in-progress long poll to complete.
+        """
+        with self.condition:
+            self.stop_requested = True
+            self.condition.notify_all()
+        self.thread.join()
+        with self.condition:
+            released = [msg for batch in self.buffer for msg in batch.messages]
+            self.buffer.clear()
+        if released:
+            self.change_visibility(released, 0)
+
+    def buffered_batches(self):
+        """Return the number of batches waiting in the buffer."""
+        with self.condition:
+            return len(self.buffer)
+
+    def get_batch(self, timeout):
+        """
+        Get the next buffered batch of messages.
+
+        If no batch is ready, wait up to timeout seconds, then return an empty list.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.buffer, timeout):
+                return []
+            batch = self.buffer.popleft()
+            self.condition.notify_all()
+        return batch.messages
+
+    def run(self):
+        """Receive batches until stopped (runs on the prefetch thread)."""
+        while True:
+            self.refresh_visibility()
+            with self.condition:
+                if not self.condition.wait_for(
+                    lambda: self.stop_requested or len(self.buffer) < self.max_batches,
+                    self.refresh_seconds / 2,
+                ):
+                    continue
+                if self.stop_requested:
+                    return
+            try:
+                messages = self.queue.receive_messages(
+                    MaxNumberOfMessages=self.batch_size,
+                    VisibilityTimeout=self.visibility_seconds,
+                    WaitTimeSeconds=self.wait_seconds,
+                )
+            except ClientError as e:
+                logger.error("sqs_prefetch_error", extra=e.response["Error"])
+                with self.condition:
+                    self.condition.wait(1)
+                continue
+            if messages:
+                with self.condition:
+                    self.buffer.append(PrefetchedBatch(messages, time.monotonic()))
+                    self.condition.notify_all()
+
+    def refresh_visibility(self):
+        """
+        Extend the visibility timeout of buffered batches, if needed.
+
+        The batches are picked under the lock, but the SQS requests are made after
+        releasing it, so that get_batch does not wait on them.
+        """
+        now = time.monotonic()
+        with self.condition:
+            due = [
+                batch
+                for batch in self.buffer
+                if now - batch.refreshed_at >= self.refresh_seconds
+            ]
+            for batch in due:
+                batch.refreshed_at = now
+        for batch in due:
+            self.change_visibility(batch.messages, self.visibility_seconds)
+
+    def change_visibility(self, messages, visibility_seconds):
+        """Change the visibility timeout of up to 10 messages, logging failures."""
+        entries = [
+            {
+                "Id": str(num),
+                "ReceiptHandle": message.receipt_handle,
+                "VisibilityTimeout": visibility_seconds,
+            }
+            for num, message in enumerate(messages)
+        ]
+        for start in range(0, len(entries), 10):
+            try:
+                response = self.queue.change_message_visibility_batch(
+                    Entries=entries[start : start + 10]
+                )
+            except ClientError as e:
+                logger.error("sqs_visibility_error", extra=e.response["Error"])
+                continue
+            for failure in response.get("Failed", []):
+                logger.error("sqs_visibility_error", extra=failure)
+
+
+class StackSampler:
+    """
+    Sample the call stacks of threads, a simple statistical profiler.
+
+    A background thread records the stack of each registered thread every interval.
+    The stacks are counted in the "collapsed" format used by flame graph tools,
+    with the frames from outermost to innermost, separated by semicolons.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_SECONDS):
+        self.interval = interval
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    @contextmanager
+    def sample_thread(self):
+        """Sample the current thread's stacks, yielding the counts by stack."""
+        thread_id = threading.get_ident()
+        counts: Counter[str] = Counter()
+        with self._lock:
+            self._counts[thread_id] = counts
+        try:
+            yield counts
+        finally:
+            with self._lock:
+                del self._counts[thread_id]
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, counts in self._counts.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[self.collapse_stack(frame)] += 1
+
+    @staticmethod
+    def collapse_stack(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
 
 class Command(CommandFromDjangoSettings):
     help = "Fetch email tasks from SQS and process them."
@@ -46,6 +304,12 @@ class Command(CommandFromDjangoSettings):
             "Number of SQS messages to fetch at a time.",
             lambda batch_size: 0 < batch_size <= 10,
         ),
+        SettingToLocal(
+            "PROCESS_EMAIL_CONCURRENCY",
+            "concurrency",
+            "Number of messages in a batch to process at the same time.",
+            lambda concurrency: 0 < concurrency <= 10,
+        ),
         SettingToLocal(
             "PROCESS_EMAIL_WAIT_SECONDS",
             "wait_seconds",
@@ -79,6 +343,33 @@ class Command(CommandFromDjangoSettings):
             "Maximum time to process before exiting, or None to run forever.",
             lambda max_seconds: max_seconds is None or max_seconds > 0.0,
         ),
+        SettingToLocal(
+            "PROCESS_EMAIL_PREFETCH_BATCHES",
+            "prefetch_batches",
+            (
+                "Number of batches to receive ahead of processing, or 0 to"
+                " receive only after the current batch is processed."
+            ),
+            lambda prefetch_batches: 0 <= prefetch_batches <= 10,
+        ),
+        SettingToLocal(
+            "PROCESS_EMAIL_PROFILE_DIR",
+            "profile_dir",
+            "Directory for profiles of slow messages, or None to not profile.",
+            lambda profile_dir: profile_dir is None or bool(profile_dir),
+        ),
+        SettingToLocal(
+            "PROCESS_EMAIL_PROFILE_SECONDS",
+            "profile_seconds",
+            "Processing time in seconds before a message profile is saved.",
+            lambda profile_seconds: profile_seconds > 0.0,
+        ),
+        SettingToLocal(
+            "PROCESS_EMAIL_PROFILE_MAX_FILES",
+            "profile_max_files",
+            "Maximum number of message profiles to keep.",
+            lambda profile_max_files: profile_max_files > 0,
+        ),
         SettingToLocal(
             "AWS_REGION",
             "aws_region",
@@ -101,34 +392,60 @@ class Command(CommandFromDjangoSettings):
 
     # Added by CommandFromDjangoSettings.init_from_settings
     batch_size: int
+    concurrency: int
     wait_seconds: int
     visibility_seconds: int
     healthcheck_path: str
     delete_failed_messages: bool
     max_seconds: float | None
+    prefetch_batches: int
+    profile_dir: str | None
+    profile_seconds: float
+    profile_max_files: int
     aws_region: str
     sqs_url: str
     verbosity: int
 
-    def handle(self, verbosity, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes. If more than 1, run as a supervisor.",
+        )
+
+    def handle(self, verbosity, processes=1, *args, **kwargs):
         """Handle call from command line (called by BaseCommand)"""
         self.init_from_settings(verbosity)
         self.init_locals()
+        if processes < 1:
+            raise CommandError(f"--processes has invalid value {processes!r}.")
         logger.info(
             "Starting process_emails_from_sqs",
             extra={
                 "batch_size": self.batch_size,
+                "concurrency": self.concurrency,
                 "wait_seconds": self.wait_seconds,
                 "visibility_seconds": self.visibility_seconds,
                 "healthcheck_path": self.healthcheck_path,
                 "delete_failed_messages": self.delete_failed_messages,
                 "max_seconds": self.max_seconds,
+                "prefetch_batches": self.prefetch_batches,
+                "profile_dir": self.profile_dir,
+                "profile_seconds": self.profile_seconds,
+                "profile_max_files": self.profile_max_files,
                 "aws_region": self.aws_region,
                 "sqs_url": self.sqs_url,
                 "verbosity": self.verbosity,
+                "processes": processes,
             },
         )
 
+        if processes > 1:
+            process_data = self.supervise_workers(processes)
+            logger.info("Exiting process_emails_from_sqs", extra=process_data)
+            return
+
         try:
             self.queue = self.create_client()
         except ClientError as e:
@@ -149,6 +466,141 @@ class Command(CommandFromDjangoSettings):
         self.queue_count = None
         self.queue_count_delayed = None
         self.queue_count_not_visible = None
+        self.healthcheck_lock = threading.Lock()
+        self.prefetcher = None
+        self.stack_sampler = None
+
+    def supervise_workers(self, processes):
+        """
+        Run worker processes until they exit or a halt is requested.
+
+        A worker that exits with an error is restarted. On SIGTERM or Ctrl-C, SIGTERM
+        is sent to the workers, and the supervisor waits for them to exit.
+
+        Return is a dict suitable for logging context, with these keys:
+        * exit_on: Why processing exited - "interrupt", "sigterm", "workers_exited"
+        * processes: The number of worker processes
+        * restarts: The number of times a worker was restarted
+        * total_s: The total execution time, in seconds with millisecond precision
+        """
+        self.start_time = time.monotonic()
+        for num in range(processes):
+            try:
+                os.remove(self.worker_healthcheck_path(num))
+            except FileNotFoundError:
+                pass
+
+        # Workers should not share the parent's database connections
+        connections.close_all()
+        exit_on = "workers_exited"
+        restarts = 0
+        stopping = False
+        previous_handler = signal.signal(signal.SIGTERM, self.request_halt)
+        try:
+            workers = {self.start_worker(num): num for num in range(processes)}
+            while workers:
+                try:
+                    self.write_supervisor_healthcheck(processes)
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                    if pid == 0:
+                        time.sleep(1)
+                    else:
+                        num = workers.pop(pid)
+                        exit_code = os.waitstatus_to_exitcode(status)
+                        if exit_code != 0 and not self.halt_requested:
+                            logger.error(
+                                "Worker process failed, restarting",
+                                extra={
+                                    "worker": num,
+                                    "pid": pid,
+                                    "exit_code": exit_code,
+                                },
+                            )
+                            workers[self.start_worker(num)] = num
+                            restarts += 1
+                except KeyboardInterrupt:
+                    self.halt_requested = True
+                    exit_on = "interrupt"
+                if self.halt_requested and not stopping:
+                    stopping = True
+                    if exit_on != "interrupt":
+                        exit_on = "sigterm"
+                    for pid in workers:
+                        os.kill(pid, signal.SIGTERM)
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+        return {
+            "exit_on": exit_on,
+            "processes": processes,
+            "restarts": restarts,
+            "total_s": round(time.monotonic() - self.start_time, 3),
+        }
+
+    def request_halt(self, signum, frame):
+        """Handle SIGTERM by stopping after the current cycle."""
+        self.halt_requested = True
+
+    def start_worker(self, num):
+        """
+        Fork a worker process, which processes the queue until it exits.
+
+        Returns the worker's process ID. The worker inherits the SIGTERM handler, so
+        it stops after the current cycle when the supervisor forwards SIGTERM.
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+
+        exit_code = 1
+        try:
+            self.healthcheck_path = self.worker_healthcheck_path(num)
+            self.queue = self.create_client()
+            process_data = self.process_queue()
+            logger.info("Exiting worker process", extra={"worker": num} | process_data)
+            exit_code = 0
+        except BaseException:
+            logger.exception("Worker process error", extra={"worker": num})
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)
+
+    def worker_healthcheck_path(self, num):
+        """Return the path to a worker's healthcheck file."""
+        return f"{self.healthcheck_path}.worker{num}"
+
+    def write_supervisor_healthcheck(self, processes):
+        """
+        Combine the worker healthcheck files into the supervisor healthcheck file.
+
+        The timestamp is the oldest worker timestamp, so the healthcheck fails if any
+        worker stops updating. The counts are totaled across workers, and the queue
+        counts are from the most recent worker. If no worker has written a healthcheck
+        file yet, the supervisor healthcheck file is not written.
+        """
+        worker_data = []
+        for num in range(processes):
+            try:
+                with open(
+                    self.worker_healthcheck_path(num), "r", encoding="utf-8"
+                ) as worker_file:
+                    worker_data.append(json.load(worker_file))
+            except (OSError, ValueError):
+                continue
+        if not worker_data:
+            return
+
+        worker_data.sort(key=lambda data: datetime.fromisoformat(data["timestamp"]))
+        oldest, newest = worker_data[0], worker_data[-1]
+        data = {"timestamp": oldest["timestamp"]}
+        for key in ("cycles", "total_messages", "failed_messages", "pause_count"):
+            data[key] = sum(worker.get(key) or 0 for worker in worker_data)
+        for key in ("queue_count", "queue_count_delayed", "queue_count_not_visible"):
+            data[key] = newest.get(key)
+        data["processes"] = processes
+        data["workers_reporting"] = len(worker_data)
+        with open(self.healthcheck_path, "w", encoding="utf-8") as healthcheck_file:
+            json.dump(data, healthcheck_file)
 
     def create_client(self):
         """Create the SQS client."""
@@ -176,53 +628,81 @@ class Command(CommandFromDjangoSettings):
         self.failed_messages = 0
         self.pause_count = 0
         self.start_time = time.monotonic()
+        if self.prefetch_batches:
+            self.prefetcher = MessagePrefetcher(
+                self.create_client(),
+                batch_size=self.batch_size,
+                wait_seconds=self.wait_seconds,
+                visibility_seconds=self.visibility_seconds,
+                max_batches=self.prefetch_batches,
+            )
+            self.prefetcher.start()
+        if self.profile_dir:
+            self.stack_sampler = StackSampler()
+            self.stack_sampler.start()
+        try:
+            while not self.halt_requested:
+                try:
+                    cycle_data: dict[str, Any] = {
+                        "cycle_num": self.cycles,
+                        "cycle_s": 0.0,
+                    }
+                    cycle_data.update(self.refresh_and_emit_queue_count_metrics())
+                    self.write_healthcheck()
 
-        while not self.halt_requested:
-            try:
-                cycle_data = {
-                    "cycle_num": self.cycles,
-                    "cycle_s": 0.0,
-                }
-                cycle_data.update(self.refresh_and_emit_queue_count_metrics())
-                self.write_healthcheck()
+                    # Check if we should exit due to time limit
+                    if self.max_seconds is not None:
+                        elapsed = time.monotonic() - self.start_time
+                        if elapsed >= self.max_seconds:
+                            exit_on = "max_seconds"
+                            break
 
-                # Check if we should exit due to time limit
-                if self.max_seconds is not None:
-                    elapsed = time.monotonic() - self.start_time
-                    if elapsed >= self.max_seconds:
-                        exit_on = "max_seconds"
-                        break
-
-                # Request and process a chunk of messages
-                with Timer(logger=None) as cycle_timer:
-                    message_batch, cycle_data = self.poll_queue_for_messages()
-                    cycle_data.update(self.process_message_batch(message_batch))
-
-                # Collect data and log progress
-                self.total_messages += len(message_batch)
-                self.failed_messages += cycle_data.get("failed_count", 0)
-                self.pause_count += cycle_data.get("pause_count", 0)
-                cycle_data["message_total"] = self.total_messages
-                cycle_data["cycle_s"] = round(cycle_timer.last, 3)
-                logger.log(
-                    (
-                        logging.INFO
-                        if (message_batch or self.verbosity > 1)
-                        else logging.DEBUG
-                    ),
-                    (
-                        f"Cycle {self.cycles}: processed"
-                        f" {self.pluralize(len(message_batch), 'message')}"
-                    ),
-                    extra=cycle_data,
-                )
+                    # Swap in a new tracker index between batches
+                    tracker_index_version = refresh_tracker_index()
+
+                    # Request and process a chunk of messages
+                    with Timer(logger=None) as cycle_timer:
+                        message_batch, cycle_data = self.poll_queue_for_messages()
+                        cycle_data.update(self.process_message_batch(message_batch))
+                        counter_rows = flush_counters()
+                    if counter_rows:
+                        cycle_data["counter_rows"] = counter_rows
+                    if tracker_index_version:
+                        cycle_data["tracker_index_version"] = tracker_index_version
+
+                    # Collect data and log progress
+                    self.total_messages += len(message_batch)
+                    self.failed_messages += cycle_data.get("failed_count", 0)
+                    self.pause_count += cycle_data.get("pause_count", 0)
+                    cycle_data["message_total"] = self.total_messages
+                    cycle_data["cycle_s"] = round(cycle_timer.last, 3)
+                    logger.log(
+                        (
+                            logging.INFO
+                            if (message_batch or self.verbosity > 1)
+                            else logging.DEBUG
+                        ),
+                        (
+                            f"Cycle {self.cycles}: processed"
+                            f" {self.pluralize(len(message_batch), 'message')}"
+                        ),
+                        extra=cycle_data,
+                    )
 
-                self.cycles += 1
-                gc.collect()  # Force garbage collection of boto3 SQS client resources
+                    self.cycles += 1
+                    gc.collect()  # Force garbage collection of boto3 SQS client resources
 
-            except KeyboardInterrupt:
-                self.halt_requested = True
-                exit_on = "interrupt"
+                except KeyboardInterrupt:
+                    self.halt_requested = True
+                    exit_on = "interrupt"
+        finally:
+            if self.prefetcher:
+                self.prefetcher.stop()
+                self.prefetcher = None
+            if self.stack_sampler:
+                self.stack_sampler.stop()
+                self.stack_sampler = None
+            flush_counters()
 
         process_data = {
             "exit_on": exit_on,
@@ -283,30 +763,45 @@ class Command(CommandFromDjangoSettings):
     def poll_queue_for_messages(self):
         """Request a batch of messages, using the long-poll method.
 
+        If prefetching, the batch is taken from the prefetch buffer, waiting up to
+        wait_seconds for one to be received.
+
         Return is a tuple:
         * message_batch: a list of messages, which may be empty
         * data: A dict suitable for logging context, with these keys:
             - message_count: the number of messages
             - sqs_poll_s: The poll time, in seconds with millisecond precision
+            - prefetch_buffered: The batches left in the prefetch buffer,
+              omitted if not prefetching
         """
         with Timer(logger=None) as poll_timer:
-            message_batch = self.queue.receive_messages(
-                MaxNumberOfMessages=self.batch_size,
-                VisibilityTimeout=self.visibility_seconds,
-                WaitTimeSeconds=self.wait_seconds,
-            )
-        return (
-            message_batch,
-            {
-                "message_count": len(message_batch),
-                "sqs_poll_s": round(poll_timer.last, 3),
-            },
-        )
+            if self.prefetcher:
+                message_batch = self.prefetcher.get_batch(timeout=self.wait_seconds)
+            else:
+                message_batch = self.queue.receive_messages(
+                    MaxNumberOfMessages=self.batch_size,
+                    VisibilityTimeout=self.visibility_seconds,
+                    WaitTimeSeconds=self.wait_seconds,
+                )
+        poll_data = {
+            "message_count": len(message_batch),
+            "sqs_poll_s": round(poll_timer.last, 3),
+        }
+        if self.prefetcher:
+            poll_data["prefetch_buffered"] = self.prefetcher.buffered_batches()
+        return message_batch, poll_data
 
     def process_message_batch(self, message_batch):
         """
         Process a batch of messages.
 
+        If concurrency is greater than 1, the messages are processed on a thread
+        pool. The messages are logged in the original order, by the main thread,
+        as each is completed.
+
+        Processed messages are deleted in batches, when DELETE_FLUSH_SECONDS of
+        processing time has passed, and at the end of the batch.
+
         Arguments:
         * messages - a list of SQS messages, possibly empty
 
@@ -315,6 +810,7 @@ class Command(CommandFromDjangoSettings):
         * pause_count: How many pauses were taken for temporary errors, omitted if 0
         * pause_s: How long pauses took, omitted if no pauses
         * failed_count: How many messages failed to process, omitted if 0
+        * delete_failed_count: How many messages failed to delete, omitted if 0
 
         Times are in seconds, with millisecond precision
         """
@@ -324,20 +820,42 @@ class Command(CommandFromDjangoSettings):
         pause_time = 0.0
         pause_count = 0
         process_time = 0.0
-        for message in message_batch:
-            self.write_healthcheck()
-            with Timer(logger=None) as message_timer:
-                message_data = self.process_message(message)
+        to_delete = []
+        delete_failed_count = 0
+        unflushed_time = 0.0
+        max_workers = min(self.concurrency, len(message_batch))
+        if max_workers > 1:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="process_email"
+            )
+            results = executor.map(self.process_message_in_thread, message_batch)
+        else:
+            executor = None
+            results = map(self.time_process_message, message_batch)
+
+        try:
+            for message, (message_data, message_time) in zip(message_batch, results):
                 if not message_data["success"]:
                     failed_count += 1
                 if message_data["success"] or self.delete_failed_messages:
-                    message.delete()
+                    to_delete.append(message)
                 pause_time += message_data.get("pause_s", 0.0)
                 pause_count += message_data.get("pause_count", 0)
 
-            message_data["message_process_time_s"] = round(message_timer.last, 3)
-            process_time += message_timer.last
-            logger.log(logging.INFO, "Message processed", extra=message_data)
+                message_data["message_process_time_s"] = round(message_time, 3)
+                process_time += message_time
+                unflushed_time += message_time
+                logger.log(logging.INFO, "Message processed", extra=message_data)
+
+                if unflushed_time >= DELETE_FLUSH_SECONDS and to_delete:
+                    delete_failed_count += self.delete_messages(to_delete)
+                    to_delete = []
+                    unflushed_time = 0.0
+        finally:
+            if executor:
+                executor.shutdown()
+            if to_delete:
+                delete_failed_count += self.delete_messages(to_delete)
 
         batch_data = {"process_s": round((process_time - pause_time), 3)}
         if pause_count:
@@ -345,8 +863,126 @@ class Command(CommandFromDjangoSettings):
             batch_data["pause_s"] = round(pause_time, 3)
         if failed_count:
             batch_data["failed_count"] = failed_count
+        if delete_failed_count:
+            batch_data["delete_failed_count"] = delete_failed_count
         return batch_data
 
+    def delete_messages(self, messages):
+        """
+        Delete messages from the SQS queue, up to 10 per request.
+
+        Failures are logged, and the messages will be received again after the
+        visibility timeout.
+
+        Returns the number of messages that failed to delete.
+        """
+        failed_count = 0
+        for start in range(0, len(messages), 10):
+            chunk = messages[start : start + 10]
+            entries = [
+                {"Id": str(num), "ReceiptHandle": message.receipt_handle}
+                for num, message in enumerate(chunk)
+            ]
+            try:
+                response = self.queue.delete_messages(Entries=entries)
+            except ClientError as e:
+                logger.error("sqs_delete_error", extra=e.response["Error"])
+                failed_count += len(chunk)
+                continue
+            for failure in response.get("Failed", []):
+                logger.error("sqs_delete_error", extra=failure)
+                failed_count += 1
+        if failed_count:
+            incr_if_enabled("message_delete_from_sqs_error", failed_count)
+        return failed_count
+
+    def time_process_message(self, message):
+        """
+        Process an SQS message, timing the processing.
+
+        The time spent in each stage is emitted as histograms, and added to the
+        message data as stage_s. If profiling, a slow message's profile is saved,
+        and the path is added as profile_path.
+
+        Return is a tuple:
+        * message_data: The dict returned by process_message, plus details
+        * message_time: The processing time, in seconds
+        """
+        self.write_healthcheck()
+        sampling = (
+            self.stack_sampler.sample_thread()
+            if self.stack_sampler
+            else nullcontext(None)
+        )
+        with (
+            stage_timer() as timer,
+            sampling as stack_counts,
+            Timer(logger=None) as message_timer,
+        ):
+            message_data = self.process_message(message)
+        if timer.stages:
+            message_data["stage_s"] = timer.log_data()
+            timer.emit_metrics()
+        if stack_counts is not None and message_timer.last >= self.profile_seconds:
+            message_data["profile_path"] = self.write_profile(
+                message, message_timer.last, timer, stack_counts
+            )
+        return message_data, message_timer.last
+
+    def write_profile(self, message, message_time, timer, stack_counts):
+        """
+        Write the profile of a slow message, and remove the oldest profiles.
+
+        The profile includes the message ID and email details that are not
+        personal data, like the size and the number of MIME parts, so that the
+        email can be found for testing, but the profile can be shared.
+
+        Return is the path of the profile
+        """
+        assert self.profile_dir and self.stack_sampler
+        os.makedirs(self.profile_dir, exist_ok=True)
+        timestamp = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.profile_dir, f"{timestamp}-{message.message_id}.json")
+        profile = {
+            "sqs_message_id": message.message_id,
+            "message_process_time_s": round(message_time, 3),
+            "email_size": timer.email_size,
+            "email_details": timer.details,
+            "stage_s": timer.log_data(),
+            "sample_interval_s": self.stack_sampler.interval,
+            "sample_count": sum(stack_counts.values()),
+            "stacks": dict(stack_counts.most_common()),
+        }
+        with open(path, "w", encoding="utf-8") as profile_file:
+            json.dump(profile, profile_file)
+
+        profiles = sorted(
+            (
+                entry
+                for entry in os.scandir(self.profile_dir)
+                if entry.name.endswith(".json")
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in profiles[: -self.profile_max_files]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        return path
+
+    def process_message_in_thread(self, message):
+        """
+        Process an SQS message in a worker thread.
+
+        Django opens a database connection per thread, so close this thread's
+        connections when done, rather than leaving them for the garbage collector.
+        """
+        try:
+            return self.time_process_message(message)
+        finally:
+            connections.close_all()
+
     def process_message(self, message):
         """
         Process an SQS message, which may include sending an email.
@@ -377,7 +1013,8 @@ class Command(CommandFromDjangoSettings):
             )
             return results
         try:
-            verified_json_body = verify_from_sns(json_body)
+            with email_stage("sns_verify"):
+                verified_json_body = verify_from_sns(json_body)
         except (KeyError, OpenSSL.crypto.Error) as e:
             logger.error("Failed SNS verification", extra={"error": str(e)})
             results.update(
@@ -454,8 +1091,9 @@ class Command(CommandFromDjangoSettings):
                 "ApproximateNumberOfMessagesNotVisible"
             ],
         }
-        with open(self.healthcheck_path, "w", encoding="utf-8") as healthcheck_file:
-            json.dump(data, healthcheck_file)
+        with self.healthcheck_lock:
+            with open(self.healthcheck_path, "w", encoding="utf-8") as healthcheck_file:
+                json.dump(data, healthcheck_file)
 
     def pluralize(self, value, singular, plural=None):
         """Returns 's' suffix to make plural, like 's' in tasks"""
@@ -0,0 +1,270 @@
+"""
+EmailCorpus generates synthetic emails, and the SES notifications that deliver them.
+
+Each email is generated from the seed and its number, so a corpus is reproducible,
+and part of a corpus can be generated without generating the emails before it.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import format_datetime
+from random import Random
+from typing import Any, Iterator, Sequence
+from uuid import UUID
+import json
+
+from emails.utils import get_domains_from_settings, general_trackers, strict_trackers
+
+
+CORPUS_TOPIC_ARN = "arn:aws:sns:us-east-1:000000000000:email-corpus"
+CORPUS_BUCKET = "email-corpus"
+CORPUS_TIMESTAMP = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# The kinds of emails, chosen with equal weight
+KINDS = ("plain", "html", "alternative", "attachment", "bad_headers", "references")
+HTML_PARAGRAPHS = (5, 50, 500)
+TRACKER_DENSITIES = (0.0, 0.1, 0.5)
+ATTACHMENT_MAX_BYTES = 5_000_000
+REFERENCES_MAX = 200
+
+# Non-compliant headers, like those reported by emails.views._replace_headers
+BAD_HEADERS = (
+    ("Date", "Thu, 31 Foo 2024 25:61:00 +0000"),
+    ("From", "Norton I., Emperor of the United States <norton{num}@sf.example.com>"),
+    ("Message-ID", "<[{message_id}====@example.com]>"),
+    ("Reply-To", "<broken{num}@>"),
+)
+
+
+@dataclass
+class CorpusEmail:
+    """A generated email, as sent to SES."""
+
+    num: int
+    kind: str
+    message_id: str  # The SES message ID
+    from_address: str
+    to_address: str
+    headers: list[tuple[str, str]]  # The email headers, unfolded
+    raw: bytes
+
+    @property
+    def object_key(self) -> str:
+        """The S3 key, in a folder per ID prefix to limit folder sizes."""
+        return f"emails/{self.message_id[:2]}/{self.message_id}"
+
+
+class EmailCorpus:
+    """
+    Generate synthetic emails.
+
+    The kind of each email is one of:
+    * plain: a plain text body
+    * html: an HTML body
+    * alternative: plain text and HTML bodies
+    * attachment: plain text and HTML bodies, and a large attachment
+    * bad_headers: like alternative, with a non-compliant header
+    * references: like alternative, with a long References chain
+
+    The HTML links and images go to domains on the tracker lists, at a density
+    chosen from tracker_densities.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        kinds: Sequence[str] = KINDS,
+        tracker_densities: Sequence[float] = TRACKER_DENSITIES,
+        attachment_max_bytes: int = ATTACHMENT_MAX_BYTES,
+        references_max: int = REFERENCES_MAX,
+        recipients: Sequence[str] | None = None,
+        trackers: Sequence[str] | None = None,
+    ) -> None:
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown email kinds: {sorted(unknown)}")
+        self.seed = seed
+        self.kinds = tuple(kinds)
+        self.tracker_densities = tuple(tracker_densities)
+        self.attachment_max_bytes = attachment_max_bytes
+        self.references_max = references_max
+        if recipients is None:
+            domain = get_domains_from_settings()["MOZMAIL_DOMAIN"]
+            recipients = [f"corpus{num}@{domain}" for num in range(5)]
+        self.recipients = tuple(recipients)
+        if trackers is None:
+            trackers = sorted(general_trackers())[:100] + sorted(strict_trackers())[:20]
+        self.trackers = tuple(trackers) or ("tracker.example.com",)
+
+    def emails(self, count: int, start: int = 0) -> Iterator[CorpusEmail]:
+        for num in range(start, start + count):
+            yield self.email(num)
+
+    def email(self, num: int) -> CorpusEmail:
+        rng = Random(f"{self.seed}-{num}")
+        kind = rng.choice(self.kinds)
+        message_id = f"{rng.getrandbits(160):040x}"
+        from_address = f"sender{num}@example.com"
+        to_address = rng.choice(self.recipients)
+        headers = {
+            "Return-Path": f"<{from_address}>",
+            "From": f"Sender {num} <{from_address}>",
+            "To": to_address,
+            "Subject": f"Corpus email {num}",
+            "Date": format_datetime(CORPUS_TIMESTAMP + timedelta(seconds=num)),
+            "Message-ID": f"<{message_id}@example.com>",
+        }
+        if kind == "bad_headers":
+            name, template = rng.choice(BAD_HEADERS)
+            headers[name] = template.format(num=num, message_id=message_id)
+        references: list[str] = []
+        if kind == "references":
+            references = [
+                f"<ref{ref_num}.{message_id}@example.com>"
+                for ref_num in range(rng.randint(1, max(self.references_max, 1)))
+            ]
+            headers["In-Reply-To"] = references[-1]
+            headers["References"] = " ".join(references)
+
+        body = self._body(rng, kind, num)
+        # Replace the random boundaries, so the emails are reproducible
+        for part_num, part in enumerate(body.walk()):
+            if part.is_multipart():
+                part.set_boundary(f"corpus-{message_id}-{part_num}")
+
+        raw_headers = []
+        for name, value in headers.items():
+            if name == "References":
+                # Fold long chains, one ID per line
+                value = "\r\n ".join(references)
+            raw_headers.append(f"{name}: {value}\r\n".encode())
+        raw = b"".join(raw_headers) + body.as_bytes(policy=SMTP)
+        all_headers = list(headers.items())
+        all_headers.extend((name, str(value)) for name, value in body.items())
+        return CorpusEmail(
+            num=num,
+            kind=kind,
+            message_id=message_id,
+            from_address=from_address,
+            to_address=to_address,
+            headers=all_headers,
+            raw=raw,
+        )
+
+    def _body(self, rng: Random, kind: str, num: int) -> EmailMessage:
+        """Generate the MIME body, with only the content headers."""
+        paragraphs = rng.choice(HTML_PARAGRAPHS)
+        density = rng.choice(self.tracker_densities)
+        text = "".join(
+            f"Paragraph {para} of email {num}.\n" for para in range(paragraphs)
+        )
+        body = EmailMessage()
+        if kind == "plain":
+            body.set_content(text)
+        elif kind == "html":
+            body.set_content(self._html(rng, paragraphs, density), subtype="html")
+        else:
+            body.set_content(text)
+            body.add_alternative(self._html(rng, paragraphs, density), subtype="html")
+        if kind == "attachment":
+            size = rng.randint(
+                self.attachment_max_bytes // 10, self.attachment_max_bytes
+            )
+            body.add_attachment(
+                rng.randbytes(size),
+                maintype="application",
+                subtype="octet-stream",
+                filename=f"attachment-{num}.bin",
+            )
+        return body
+
+    def _html(self, rng: Random, paragraphs: int, density: float) -> str:
+        """Generate an HTML body, with a density of links and images to trackers."""
+        lines = ["<html><body>"]
+        for para in range(paragraphs):
+            if rng.random() < density:
+                domain = rng.choice(self.trackers)
+                lines.append(
+                    f'<p>Paragraph {para} <a href="https://{domain}/click?id={para}">'
+                    f'link</a><img src="https://{domain}/open/{para}.gif" width="1"'
+                    ' height="1"></p>'
+                )
+            else:
+                lines.append(
+                    f'<p>Paragraph {para} <a href="https://example.com/page/{para}">'
+                    "link</a></p>"
+                )
+        lines.append("</body></html>")
+        return "\n".join(lines)
+
+
+def ses_notification(
+    email: CorpusEmail, bucket: str | None = None, object_key: str | None = None
+) -> dict[str, Any]:
+    """
+    Get the SNS notification of an SES received email.
+
+    If bucket is set, the email is stored in S3, at object_key or the default key.
+    If not, the email is included in the notification.
+    """
+    header_values = dict(email.headers)
+    message_json: dict[str, Any] = {
+        "notificationType": "Received",
+        "mail": {
+            "timestamp": CORPUS_TIMESTAMP.isoformat(),
+            "source": email.from_address,
+            "messageId": email.message_id,
+            "destination": [email.to_address],
+            "headersTruncated": False,
+            "headers": [
+                {"name": name, "value": value} for name, value in email.headers
+            ],
+            "commonHeaders": {
+                "returnPath": email.from_address,
+                "from": [header_values["From"]],
+                "date": header_values["Date"],
+                "to": [email.to_address],
+                "messageId": header_values["Message-ID"],
+                "subject": header_values["Subject"],
+            },
+        },
+        "receipt": {
+            "timestamp": CORPUS_TIMESTAMP.isoformat(),
+            "processingTimeMillis": 100,
+            "recipients": [email.to_address],
+            "spamVerdict": {"status": "PASS"},
+            "virusVerdict": {"status": "PASS"},
+            "spfVerdict": {"status": "PASS"},
+            "dkimVerdict": {"status": "PASS"},
+            "dmarcVerdict": {"status": "PASS"},
+        },
+    }
+    if bucket:
+        message_json["receipt"]["action"] = {
+            "type": "S3",
+            "topicArn": CORPUS_TOPIC_ARN,
+            "bucketName": bucket,
+            "objectKeyPrefix": "emails",
+            "objectKey": object_key or email.object_key,
+        }
+    else:
+        message_json["receipt"]["action"] = {
+            "type": "SNS",
+            "topicArn": CORPUS_TOPIC_ARN,
+            "encoding": "UTF8",
+        }
+        message_json["content"] = email.raw.decode()
+    return {
+        "Type": "Notification",
+        "MessageId": str(UUID(email.message_id[:32], version=4)),
+        "TopicArn": CORPUS_TOPIC_ARN,
+        "Subject": "Amazon SES Email Receipt Notification",
+        "Message": json.dumps(message_json),
+        "Timestamp": CORPUS_TIMESTAMP.isoformat(),
+        "SignatureVersion": "1",
+        "Signature": "",
+        "SigningCertURL": "",
+        "UnsubscribeURL": "",
+    }
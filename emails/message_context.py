@@ -0,0 +1,130 @@
+"""
+Share the rows loaded while processing an email, and batch its database writes.
+
+Processing an email can need the same rows more than once. For example, the Reply
+for an In-Reply-To header is loaded to check if a reply is allowed, and again to
+send the reply. message_context() starts a MessageContext for one email, in the
+current thread or task, like emails.utils.stage_timer:
+
+* load and load_many return the rows loaded earlier for the same keys, and only
+  query for the others. Rows that do not exist are remembered as well.
+* defer_write queues a write. The writes run in one transaction when the email is
+  processed, and are dropped if processing raises an exception. The email may have
+  been sent by then, so a failed transaction is logged rather than raised. Writes
+  that later emails depend on, like the Reply record, should not be deferred.
+
+Without a context, such as in tests of a single function, rows are loaded each time,
+and writes run at once.
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Hashable, Iterator, TypeVar
+import logging
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, transaction
+
+from .utils import email_stage
+
+logger = logging.getLogger("events")
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class MessageContext:
+    """The rows loaded, and the writes queued, while processing one email."""
+
+    def __init__(self) -> None:
+        self.rows: dict[Hashable, Any] = {}
+        self.errors: dict[Hashable, ObjectDoesNotExist] = {}
+        self.writes: list[Callable[[], object]] = []
+
+    def load(self, key: Hashable, loader: Callable[[], T]) -> T:
+        if key in self.errors:
+            raise self.errors[key]
+        if key not in self.rows:
+            try:
+                self.rows[key] = loader()
+            except ObjectDoesNotExist as error:
+                self.errors[key] = error
+                raise
+        row: T = self.rows[key]
+        return row
+
+    def load_many(
+        self, keys: list[K], loader: Callable[[list[K]], dict[K, T]]
+    ) -> dict[K, T | None]:
+        if new_keys := [key for key in keys if key not in self.rows]:
+            found = loader(new_keys)
+            for key in new_keys:
+                self.rows[key] = found.get(key)
+        return {key: self.rows[key] for key in keys}
+
+    def flush(self) -> None:
+        """Run the queued writes in one transaction, logging a failure."""
+        writes, self.writes = self.writes, []
+        if not writes:
+            return
+        try:
+            with email_stage("db_write"), transaction.atomic():
+                for write in writes:
+                    write()
+        except DatabaseError:
+            logger.exception("message_context_writes_failed")
+
+
+_context: ContextVar[MessageContext | None] = ContextVar(
+    "message_context", default=None
+)
+
+
+@contextmanager
+def message_context() -> Iterator[MessageContext]:
+    """Share rows and batch writes while processing an email."""
+    context = MessageContext()
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+    context.flush()
+
+
+def load(key: Hashable, loader: Callable[[], T]) -> T:
+    """
+    Load a row, or get the row loaded for the key earlier.
+
+    The loader can raise an ObjectDoesNotExist, which is raised again for the key.
+    """
+    context = _context.get()
+    if context is None:
+        return loader()
+    return context.load(key, loader)
+
+
+def load_many(
+    keys: list[K], loader: Callable[[list[K]], dict[K, T]]
+) -> dict[K, T | None]:
+    """
+    Load rows, or get the rows loaded for the keys earlier.
+
+    The loader gets the keys not loaded yet, and returns the rows found by key. The
+    result has None for the keys without rows.
+    """
+    context = _context.get()
+    if context is None:
+        found = loader(keys)
+        return {key: found.get(key) for key in keys}
+    return context.load_many(keys, loader)
+
+
+def defer_write(write: Callable[[], object]) -> None:
+    """Run a write when the email is processed, or now without a context."""
+    context = _context.get()
+    if context is None:
+        write()
+    else:
+        context.writes.append(write)
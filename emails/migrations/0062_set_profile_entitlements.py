@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import migrations
+
+# Copied from emails.models, so that this migration does not change with it
+PREMIUM_DOMAINS = ["mozilla.com", "getpocket.com", "mozillafoundation.org"]
+BATCH_SIZE = 1000
+
+
+def set_entitlements(apps, schema_editor):
+    """
+    Set the entitlements of existing profiles from their Mozilla account data.
+
+    This is the logic of Profile.update_entitlements. Without it, every existing
+    subscriber is treated as a free user until the backfill_profile_entitlements
+    command runs.
+    """
+    Profile = apps.get_model("emails", "Profile")
+    SocialAccount = apps.get_model("socialaccount", "SocialAccount")
+    accounts = (
+        SocialAccount.objects.filter(provider="fxa")
+        .order_by("id")
+        .values_list("id", "user_id", "user__email", "extra_data")
+    )
+    last_id = 0
+    while batch := list(accounts.filter(id__gt=last_id)[:BATCH_SIZE]):
+        last_id = batch[-1][0]
+        user_ids_by_entitlements: dict[tuple[bool, bool, bool], list[int]] = {}
+        for _, user_id, email, extra_data in batch:
+            subscriptions = (extra_data or {}).get("subscriptions", [])
+            entitlements = (
+                any(email.endswith(f"@{domain}") for domain in PREMIUM_DOMAINS)
+                or any(
+                    sub in subscriptions
+                    for sub in settings.SUBSCRIPTIONS_WITH_UNLIMITED
+                ),
+                any(sub in subscriptions for sub in settings.SUBSCRIPTIONS_WITH_PHONE),
+                any(sub in subscriptions for sub in settings.SUBSCRIPTIONS_WITH_VPN),
+            )
+            if any(entitlements):
+                user_ids_by_entitlements.setdefault(entitlements, []).append(user_id)
+        for (premium, phone, vpn), user_ids in user_ids_by_entitlements.items():
+            Profile.objects.filter(user_id__in=user_ids).update(
+                premium_entitlement=premium,
+                phone_entitlement=phone,
+                vpn_entitlement=vpn,
+            )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("emails", "0061_profile_entitlements"),
+        ("socialaccount", "0006_alter_socialaccount_extra_data"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            code=set_entitlements,
+            reverse_code=migrations.RunPython.noop,
+            elidable=True,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 09:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emails", "0062_set_profile_entitlements"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="abusemetrics",
+            name="first_recorded",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AlterField(
+            model_name="abusemetrics",
+            name="last_recorded",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
@@ -12,8 +12,10 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import BadRequest
 from django.core.validators import MinLengthValidator
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.dispatch import receiver
+from django.utils import timezone as django_timezone
 from django.utils.translation.trans_real import (
     parse_accept_lang_header,
     get_supported_language_variant,
@@ -31,6 +33,7 @@ from privaterelay.utils import (
 )
 
 from .apps import emails_config
+from .counters import add_pending_counts
 from .utils import get_domains_from_settings, incr_if_enabled
 
 if settings.PHONES_ENABLED:
@@ -46,6 +49,30 @@ DOMAIN_CHOICES = [(1, "RELAY_FIREFOX_DOMAIN"), (2, "MOZMAIL_DOMAIN")]
 PREMIUM_DOMAINS = ["mozilla.com", "getpocket.com", "mozillafoundation.org"]
 
 
+def account_is_flagged(last_account_flagged: datetime | None) -> bool:
+    """Return True if an account flagged at this time is still paused."""
+    if not last_account_flagged:
+        return False
+    account_premium_feature_resumed = last_account_flagged + timedelta(
+        days=settings.PREMIUM_FEATURE_PAUSED_DAYS
+    )
+    if datetime.now(timezone.utc) > account_premium_feature_resumed:
+        # premium feature has been resumed
+        return False
+    # user was flagged and the premium feature pause period is not yet over
+    return True
+
+
+def bounce_is_recent(last_bounce: datetime, bounce_type: str) -> bool:
+    """Return True if a "hard" or "soft" bounce at this time still pauses emails."""
+    if bounce_type == "hard":
+        allowed_days = settings.HARD_BOUNCE_ALLOWED_DAYS
+    else:
+        allowed_days = settings.SOFT_BOUNCE_ALLOWED_DAYS
+    last_bounce_allowed = datetime.now(timezone.utc) - timedelta(days=allowed_days)
+    return last_bounce > last_bounce_allowed
+
+
 def valid_available_subdomain(subdomain, *args, **kwargs):
     if not subdomain:
         raise CannotMakeSubdomainException("error-subdomain-cannot-be-empty-or-null")
@@ -131,6 +158,12 @@ class Profile(models.Model):
     created_by = models.CharField(blank=True, null=True, max_length=63)
     sent_welcome_email = models.BooleanField(default=False)
     last_engagement = models.DateTimeField(blank=True, null=True, db_index=True)
+    # Entitlements from the Mozilla account, set by update_entitlements()
+    premium_entitlement = models.BooleanField(default=False, db_index=True)
+    phone_entitlement = models.BooleanField(default=False, db_index=True)
+    vpn_entitlement = models.BooleanField(default=False)
+
+    ENTITLEMENT_FIELDS = ("premium_entitlement", "phone_entitlement", "vpn_entitlement")
 
     def __str__(self):
         return "%s Profile" % self.user
@@ -230,20 +263,14 @@ class Profile(models.Model):
         ra_count: int = self.relay_addresses.count()
         return ra_count >= settings.MAX_NUM_FREE_ALIASES
 
-    def check_bounce_pause(self):
+    def check_bounce_pause(self) -> BounceStatus:
         if self.last_hard_bounce:
-            last_hard_bounce_allowed = datetime.now(timezone.utc) - timedelta(
-                days=settings.HARD_BOUNCE_ALLOWED_DAYS
-            )
-            if self.last_hard_bounce > last_hard_bounce_allowed:
+            if bounce_is_recent(self.last_hard_bounce, "hard"):
                 return BounceStatus(True, "hard")
             self.last_hard_bounce = None
             self.save()
         if self.last_soft_bounce:
-            last_soft_bounce_allowed = datetime.now(timezone.utc) - timedelta(
-                days=settings.SOFT_BOUNCE_ALLOWED_DAYS
-            )
-            if self.last_soft_bounce > last_soft_bounce_allowed:
+            if bounce_is_recent(self.last_soft_bounce, "soft"):
                 return BounceStatus(True, "soft")
             self.last_soft_bounce = None
             self.save()
@@ -308,59 +335,77 @@ class Profile(models.Model):
         assert self.subdomain
         return f"@{self.subdomain}.{settings.MOZMAIL_DOMAIN}"
 
+    def update_entitlements(self, fxa: SocialAccount | None, save: bool = True) -> bool:
+        """
+        Set the entitlements from the Mozilla account data, or clear them without one.
+
+        Return True if an entitlement changed, and save the changes if save is True.
+        """
+        entitlements = dict.fromkeys(self.ENTITLEMENT_FIELDS, False)
+        if fxa:
+            # FIXME: as we don't have all the tiers defined we are over-defining
+            # premium to mark the user as a premium user as well
+            subscriptions = fxa.extra_data.get("subscriptions", [])
+            entitlements["premium_entitlement"] = any(
+                self.user.email.endswith(f"@{premium_domain}")
+                for premium_domain in PREMIUM_DOMAINS
+            ) or any(
+                sub in subscriptions for sub in settings.SUBSCRIPTIONS_WITH_UNLIMITED
+            )
+            entitlements["phone_entitlement"] = any(
+                sub in subscriptions for sub in settings.SUBSCRIPTIONS_WITH_PHONE
+            )
+            entitlements["vpn_entitlement"] = any(
+                sub in subscriptions for sub in settings.SUBSCRIPTIONS_WITH_VPN
+            )
+        changed = [
+            name for name, value in entitlements.items() if getattr(self, name) != value
+        ]
+        for name in changed:
+            setattr(self, name, entitlements[name])
+        if changed and save:
+            self.save(update_fields=changed)
+        return bool(changed)
+
     @property
     def has_premium(self) -> bool:
-        # FIXME: as we don't have all the tiers defined we are over-defining
-        # this to mark the user as a premium user as well
-        if not self.fxa:
-            return False
-        for premium_domain in PREMIUM_DOMAINS:
-            if self.user.email.endswith(f"@{premium_domain}"):
-                return True
-        user_subscriptions = self.fxa.extra_data.get("subscriptions", [])
-        for sub in settings.SUBSCRIPTIONS_WITH_UNLIMITED:
-            if sub in user_subscriptions:
-                return True
-        return False
+        return self.premium_entitlement
 
     @property
     def has_phone(self) -> bool:
-        if not self.fxa:
-            return False
         if settings.RELAY_CHANNEL != "prod" and not settings.IN_PYTEST:
             if not flag_is_active_in_task("phones", self.user):
                 return False
-        if flag_is_active_in_task("free_phones", self.user):
+        if self.phone_entitlement:
             return True
-        user_subscriptions = self.fxa.extra_data.get("subscriptions", [])
-        for sub in settings.SUBSCRIPTIONS_WITH_PHONE:
-            if sub in user_subscriptions:
-                return True
-        return False
+        return self.fxa is not None and flag_is_active_in_task("free_phones", self.user)
 
     @property
-    def has_vpn(self):
-        if not self.fxa:
-            return False
-        user_subscriptions = self.fxa.extra_data.get("subscriptions", [])
-        for sub in settings.SUBSCRIPTIONS_WITH_VPN:
-            if sub in user_subscriptions:
-                return True
-        return False
+    def has_vpn(self) -> bool:
+        return self.vpn_entitlement
+
+    def _addresses_with_pending_counts(self) -> list[RelayAddress | DomainAddress]:
+        """Get the user's addresses, with the pending counts not yet saved."""
+        addresses = [*self.relay_addresses, *self.domain_addresses]
+        add_pending_counts(addresses)
+        return addresses
 
     @property
     def emails_forwarded(self):
         return (
-            sum(ra.num_forwarded for ra in self.relay_addresses)
-            + sum(da.num_forwarded for da in self.domain_addresses)
+            sum(
+                address.num_forwarded
+                for address in self._addresses_with_pending_counts()
+            )
             + self.num_email_forwarded_in_deleted_address
         )
 
     @property
     def emails_blocked(self):
         return (
-            sum(ra.num_blocked for ra in self.relay_addresses)
-            + sum(da.num_blocked for da in self.domain_addresses)
+            sum(
+                address.num_blocked for address in self._addresses_with_pending_counts()
+            )
             + self.num_email_blocked_in_deleted_address
         )
 
@@ -380,13 +425,10 @@ class Profile(models.Model):
 
     @property
     def level_one_trackers_blocked(self):
-        return (
-            sum(ra.num_level_one_trackers_blocked or 0 for ra in self.relay_addresses)
-            + sum(
-                da.num_level_one_trackers_blocked or 0 for da in self.domain_addresses
-            )
-            + (self.num_level_one_trackers_blocked_in_deleted_address or 0)
-        )
+        return sum(
+            address.num_level_one_trackers_blocked or 0
+            for address in self._addresses_with_pending_counts()
+        ) + (self.num_level_one_trackers_blocked_in_deleted_address or 0)
 
     @property
     def joined_before_premium_release(self):
@@ -439,33 +481,22 @@ class Profile(models.Model):
         email_forwarded=False,
         forwarded_email_size=0,
     ) -> datetime | None:
-        # TODO MPP-3720: This should be wrapped in atomic or select_for_update to ensure
-        # race conditions are properly handled.
-
         # look for abuse metrics created on the same UTC date, regardless of time.
+        # Old metrics are deleted by the delete_old_abuse_metrics command.
         midnight_utc_today = datetime.combine(
             datetime.now(timezone.utc).date(), datetime.min.time()
         ).astimezone(timezone.utc)
-        midnight_utc_tomorow = midnight_utc_today + timedelta(days=1)
-        abuse_metric = self.user.abusemetrics_set.filter(
-            first_recorded__gte=midnight_utc_today,
-            first_recorded__lt=midnight_utc_tomorow,
-        ).first()
-        if not abuse_metric:
-            abuse_metric = AbuseMetrics.objects.create(user=self.user)
-            AbuseMetrics.objects.filter(first_recorded__lt=midnight_utc_today).delete()
-
-        # increment the abuse metric
-        if address_created:
-            abuse_metric.num_address_created_per_day += 1
-        if replied:
-            abuse_metric.num_replies_per_day += 1
-        if email_forwarded:
-            abuse_metric.num_email_forwarded_per_day += 1
-        if forwarded_email_size > 0:
-            abuse_metric.forwarded_email_size_per_day += forwarded_email_size
-        abuse_metric.last_recorded = datetime.now(timezone.utc)
-        abuse_metric.save()
+        abuse_metric = AbuseMetrics.increment_for_day(
+            self.user_id,
+            start=midnight_utc_today,
+            now=datetime.now(timezone.utc),
+            increments={
+                "num_address_created_per_day": int(address_created),
+                "num_replies_per_day": int(replied),
+                "num_email_forwarded_per_day": int(email_forwarded),
+                "forwarded_email_size_per_day": max(forwarded_email_size, 0),
+            },
+        )
 
         # check user should be flagged for abuse
         hit_max_create = False
@@ -509,16 +540,7 @@ class Profile(models.Model):
 
     @property
     def is_flagged(self):
-        if not self.last_account_flagged:
-            return False
-        account_premium_feature_resumed = self.last_account_flagged + timedelta(
-            days=settings.PREMIUM_FEATURE_PAUSED_DAYS
-        )
-        if datetime.now(timezone.utc) > account_premium_feature_resumed:
-            # premium feature has been resumed
-            return False
-        # user was flagged and the premium feature pause period is not yet over
-        return True
+        return account_is_flagged(self.last_account_flagged)
 
     @property
     def metrics_enabled(self) -> bool:
@@ -711,6 +733,7 @@ class RelayAddress(models.Model):
 
     def delete(self, *args, **kwargs):
         # TODO: create hard bounce receipt rule in AWS for the address
+        add_pending_counts([self])
         deleted_address = DeletedAddress.objects.create(
             address_hash=address_hash(self.address, domain=self.domain_value),
             num_forwarded=self.num_forwarded,
@@ -940,6 +963,7 @@ class DomainAddress(models.Model):
 
     def delete(self, *args, **kwargs):
         # TODO: create hard bounce receipt rule in AWS for the address
+        add_pending_counts([self])
         deleted_address = DeletedAddress.objects.create(
             address_hash=address_hash(
                 self.address, self.user_profile.subdomain, self.domain_value
@@ -1014,8 +1038,9 @@ class Reply(models.Model):
 
 class AbuseMetrics(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    first_recorded = models.DateTimeField(auto_now_add=True, db_index=True)
-    last_recorded = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Not auto_now_add, which would replace the start of the day on insert
+    first_recorded = models.DateTimeField(default=django_timezone.now, db_index=True)
+    last_recorded = models.DateTimeField(default=django_timezone.now, db_index=True)
     num_address_created_per_day = models.PositiveSmallIntegerField(default=0)
     num_replies_per_day = models.PositiveSmallIntegerField(default=0)
     # Values from 0 to 32767 are safe in all databases supported by Django.
@@ -1025,3 +1050,55 @@ class AbuseMetrics(models.Model):
 
     class Meta:
         unique_together = ["user", "first_recorded"]
+
+    COUNTER_FIELDS = (
+        "num_address_created_per_day",
+        "num_replies_per_day",
+        "num_email_forwarded_per_day",
+        "forwarded_email_size_per_day",
+    )
+
+    @classmethod
+    def increment_for_day(
+        cls,
+        user_id: int,
+        start: datetime,
+        now: datetime,
+        increments: dict[str, int],
+    ) -> AbuseMetrics:
+        """
+        Add to the metrics of a user for the day starting at start.
+
+        The counters of the day's row are updated with F() expressions, so
+        concurrent events of a day do not overwrite each other. If there is no row
+        yet, one is inserted with first_recorded set to start. When concurrent first
+        events of a day both insert, the unique key on user and first_recorded
+        rejects the second row, and that event updates the first one instead.
+        Returns the metrics with the new totals.
+        """
+        day = cls.objects.filter(
+            user_id=user_id,
+            first_recorded__gte=start,
+            first_recorded__lt=start + timedelta(days=1),
+        )
+        totals = {
+            name: F(name) + increments.get(name, 0) for name in cls.COUNTER_FIELDS
+        }
+        with transaction.atomic(savepoint=False):
+            if not day.update(last_recorded=now, **totals):
+                try:
+                    with transaction.atomic():
+                        return cls.objects.create(
+                            user_id=user_id,
+                            first_recorded=start,
+                            last_recorded=now,
+                            **{
+                                name: increments.get(name, 0)
+                                for name in cls.COUNTER_FIELDS
+                            },
+                        )
+                except IntegrityError:
+                    day.update(last_recorded=now, **totals)
+            metrics = day.order_by("id").first()
+        assert metrics is not None
+        return metrics
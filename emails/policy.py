@@ -29,7 +29,8 @@ from email.policy import EmailPolicy
 
 from email import errors
 
-from typing import cast, TYPE_CHECKING
+from functools import cached_property
+from typing import cast, Any, TYPE_CHECKING
 
 if TYPE_CHECKING:
     # _HeaderParser is a protocol from mypy's typeshed
@@ -67,20 +68,69 @@ class RelayMessageIDHeader(PythonMessageIDHeader):
 
 
 class RelayHeaderRegistry(PythonHeaderRegistry):
-    """Extend the HeaderRegistry to store the unstructured header."""
+    """
+    Extend the HeaderRegistry to store the unstructured header.
 
-    def __call__(self, name: str, value: str) -> BaseHeader:
-        """Add the unstructured header as .as_unstructured."""
-        header_instance = super().__call__(name, value)
-        as_unstructured_cls = type(
+    The header classes are created once per parser class and reused, rather than
+    created for each header. The unstructured header is parsed the first time
+    .as_unstructured is read, which is usually only for headers with defects.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._header_classes: dict[type, type[BaseHeader]] = {}
+        self._unstructured_class = type(
             "_UnstructuredHeader", (UnstructuredHeader, self.base_class), {}
         )
-        as_unstructured = as_unstructured_cls(name, value)
+
+    def __getitem__(self, name: str) -> type[BaseHeader]:
+        """Get the header class for the name, with a lazy .as_unstructured."""
+        return self._header_class(self.registry.get(name.lower(), self.default_class))
+
+    def _header_class(self, cls: type) -> type[BaseHeader]:
+        """Get the header class for a parser class, creating it on first use."""
+        try:
+            return self._header_classes[cls]
+        except KeyError:
+            pass
+        unstructured_class = self._unstructured_class
+
+        def as_unstructured(header: BaseHeader) -> BaseHeader:
+            return cast(
+                BaseHeader,
+                unstructured_class(header.name, getattr(header, "_raw_value")),
+            )
+
+        def __reduce__(header: BaseHeader) -> tuple[Any, ...]:
+            # BaseHeader.__reduce__ recreates a class from the bases, without
+            # .as_unstructured, so copies and pickles get it from the registry
+            return (_reconstruct_header, (cls, str(header)), header.__dict__)
+
+        header_class = type(
+            "_" + cls.__name__,
+            (cls, self.base_class),
+            {
+                "as_unstructured": cached_property(as_unstructured),
+                "__reduce__": __reduce__,
+            },
+        )
+        self._header_classes[cls] = header_class
+        return header_class
+
+    def __call__(self, name: str, value: str) -> BaseHeader:
+        """Create the header, keeping the value for .as_unstructured."""
+        header_instance = self[name](name, value)
         # Avoid mypy attr-defined error for setting a dynamic attribute
-        setattr(header_instance, "as_unstructured", as_unstructured)
+        setattr(header_instance, "_raw_value", value)
         return header_instance
 
 
+def _reconstruct_header(parser_class: type, value: str) -> BaseHeader:
+    """Recreate a copied or unpickled header with the Relay header class."""
+    header_class = relay_header_factory._header_class(parser_class)
+    return cast(BaseHeader, getattr(header_class, "_reconstruct")(value))
+
+
 relay_header_factory = RelayHeaderRegistry()
 relay_header_factory.registry["message-id"] = cast(
     type["_HeaderParser"], RelayMessageIDHeader
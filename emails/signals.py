@@ -3,10 +3,13 @@ import logging
 
 from django.contrib.auth.models import User
 
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from emails.models import Profile
+from allauth.socialaccount.models import SocialAccount
+
+from emails import address_cache, address_filter
+from emails.models import DomainAddress, Profile, RelayAddress
 from emails.utils import incr_if_enabled, set_user_group
 
 
@@ -45,3 +48,112 @@ def measure_feature_usage(sender, instance, **kwargs):
                 "hashed_uid": sha256(instance.fxa.uid.encode("utf-8")).hexdigest(),
             },
         )
+
+
+# Fields in the cached forwarding state of addresses and their owners
+ADDRESS_CACHE_FIELDS = {"user", "enabled", "block_list_emails"}
+PROFILE_CACHE_FIELDS = {
+    "subdomain",
+    "auto_block_spam",
+    "remove_level_one_email_trackers",
+    "last_account_flagged",
+    "last_hard_bounce",
+    "last_soft_bounce",
+}
+USER_CACHE_FIELDS = {"email", "is_staff", "is_superuser"}
+
+
+def _address_cache_key_parts(
+    instance: RelayAddress | DomainAddress,
+) -> tuple[str, str] | None:
+    """Get the local and domain parts of an address, or None if unknown."""
+    if isinstance(instance, RelayAddress):
+        return instance.address, instance.domain_value
+    subdomain = address_cache.cached_subdomain(instance.user_id)
+    if subdomain is None:
+        subdomain = (
+            Profile.objects.filter(user_id=instance.user_id)
+            .values_list("subdomain", flat=True)
+            .first()
+        )
+    if subdomain is None:
+        return None
+    return instance.address, f"{subdomain}.{instance.domain_value}"
+
+
+@receiver(post_save, sender=RelayAddress)
+def add_to_address_filter(sender, instance, created, **kwargs):
+    if created:
+        address_filter.record_new_address(instance.address, instance.domain_value)
+
+
+@receiver(post_save, sender=RelayAddress)
+@receiver(post_save, sender=DomainAddress)
+def update_address_cache(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not ADDRESS_CACHE_FIELDS & set(update_fields):
+        return
+    if parts := _address_cache_key_parts(instance):
+        address_cache.address_saved(*parts, instance)
+
+
+@receiver(post_delete, sender=RelayAddress)
+@receiver(post_delete, sender=DomainAddress)
+def forget_address_cache(sender, instance, **kwargs):
+    if parts := _address_cache_key_parts(instance):
+        address_cache.forget_address(*parts)
+
+
+@receiver(post_save, sender=Profile)
+def update_profile_owner_cache(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        address_cache.forget_owner(instance.user_id)
+    elif update_fields is None or PROFILE_CACHE_FIELDS & set(update_fields):
+        address_cache.owner_saved(
+            instance.user_id,
+            profile_id=instance.id,
+            **{name: getattr(instance, name) for name in PROFILE_CACHE_FIELDS},
+        )
+
+
+@receiver(post_save, sender=User)
+def update_user_owner_cache(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        address_cache.forget_owner(instance.id)
+    elif update_fields is None or USER_CACHE_FIELDS & set(update_fields):
+        address_cache.owner_saved(
+            instance.id, **{name: getattr(instance, name) for name in USER_CACHE_FIELDS}
+        )
+
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=User)
+def forget_owner_cache(sender, instance, **kwargs):
+    address_cache.forget_owner(
+        instance.user_id if isinstance(instance, Profile) else instance.id
+    )
+
+
+@receiver(post_save, sender=SocialAccount)
+def update_profile_entitlements(sender, instance, **kwargs):
+    if instance.provider != "fxa":
+        return
+    try:
+        profile = instance.user.profile
+    except Profile.DoesNotExist:
+        return
+    profile.update_entitlements(instance)
+
+
+@receiver(post_delete, sender=SocialAccount)
+def clear_profile_entitlements(sender, instance, **kwargs):
+    if instance.provider == "fxa":
+        Profile.objects.filter(user_id=instance.user_id).update(
+            **dict.fromkeys(Profile.ENTITLEMENT_FIELDS, False)
+        )
+
+
+@receiver(post_save, sender=SocialAccount)
+@receiver(post_delete, sender=SocialAccount)
+def forget_social_account_owner_cache(sender, instance, **kwargs):
+    # The language and premium status are from the Mozilla account data
+    address_cache.forget_owner(instance.user_id)
@@ -1,9 +1,12 @@
 # Inspired by django-bouncy utils:
 # https://github.com/organizerconnect/django-bouncy/blob/master/django_bouncy/utils.py
 
+from collections import OrderedDict
 import base64
 import logging
 import pem
+import threading
+import time
 from urllib.request import urlopen
 
 from OpenSSL import crypto
@@ -63,10 +66,15 @@ SUPPORTED_SNS_TYPES = [
     "Notification",
 ]
 
+# Loaded certificates, by SigningCertURL, with the monotonic time they expire
+CERT_CACHE_MAX_SIZE = 16
+CERT_CACHE_SECONDS = 60 * 60
+_cert_cache: OrderedDict[str, tuple[float, crypto.X509]] = OrderedDict()
+_cert_cache_lock = threading.Lock()
+
 
 def verify_from_sns(json_body):
-    pemfile = _grab_keyfile(json_body["SigningCertURL"])
-    cert = crypto.load_certificate(crypto.FILETYPE_PEM, pemfile)
+    cert = _get_certificate(json_body["SigningCertURL"])
     signature = base64.decodebytes(json_body["Signature"].encode("utf-8"))
 
     hash_format = _get_hash_format(json_body)
@@ -77,6 +85,31 @@ def verify_from_sns(json_body):
     return json_body
 
 
+def _get_certificate(cert_url: str) -> crypto.X509:
+    """
+    Get the loaded certificate for the URL.
+
+    Certificates are cached in-process for CERT_CACHE_SECONDS, up to
+    CERT_CACHE_MAX_SIZE URLs, dropping the least recently used. Otherwise, the PEM
+    file is loaded by _grab_keyfile, from the Django cache or the URL.
+    """
+    now = time.monotonic()
+    with _cert_cache_lock:
+        cached = _cert_cache.get(cert_url)
+        if cached and cached[0] > now:
+            _cert_cache.move_to_end(cert_url)
+            return cached[1]
+
+    pemfile = _grab_keyfile(cert_url)
+    cert = crypto.load_certificate(crypto.FILETYPE_PEM, pemfile)
+    with _cert_cache_lock:
+        _cert_cache[cert_url] = (now + CERT_CACHE_SECONDS, cert)
+        _cert_cache.move_to_end(cert_url)
+        while len(_cert_cache) > CERT_CACHE_MAX_SIZE:
+            _cert_cache.popitem(last=False)
+    return cert
+
+
 def _get_hash_format(json_body):
     message_type = json_body["Type"]
     if message_type == "Notification":
@@ -0,0 +1,38 @@
+"""Shared fixtures for emails tests"""
+
+from typing import Iterator
+
+from django.core.cache import cache
+
+import pytest
+
+from emails.counters import (
+    FLUSH_LOCK_KEY,
+    FLUSHED_KEY,
+    LOG_CURSOR_KEY,
+    LOG_GAP_KEY,
+    LOG_SEQ_KEY,
+    _dirty_key,
+    _fields,
+    _key,
+    _log_key,
+)
+
+
+def _forget_pending_counters() -> None:
+    log_keys = [_log_key(seq) for seq in range(1, cache.get(LOG_SEQ_KEY, 0) + 1)]
+    rows = cache.get_many(log_keys).values()
+    cache.delete_many(
+        [_key(label, pk, field) for label, pk in rows for field in _fields(label)]
+        + [_dirty_key(label, pk) for label, pk in rows]
+        + log_keys
+        + [LOG_SEQ_KEY, LOG_CURSOR_KEY, LOG_GAP_KEY, FLUSH_LOCK_KEY, FLUSHED_KEY]
+    )
+
+
+@pytest.fixture(autouse=True)
+def pending_counters() -> Iterator[None]:
+    """Forget the statistics that a test did not flush to the database."""
+    _forget_pending_counters()
+    yield
+    _forget_pending_counters()
@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from unittest.mock import patch
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from model_bakery import baker
+from rest_framework.test import APIClient
+
+from emails.counters import (
+    FLUSH_LOCK_KEY,
+    FLUSHED_KEY,
+    LOG_SEQ_KEY,
+    _key,
+    add_pending_counts,
+    flush_counters,
+    flush_counters_if_due,
+    increment,
+    set_latest,
+)
+from emails.models import DomainAddress, Profile, RelayAddress
+
+from .models_tests import make_free_test_user, make_premium_test_user
+
+
+@pytest.fixture
+def user(db) -> User:
+    return make_free_test_user()
+
+
+@pytest.fixture
+def relay_address(user: User) -> RelayAddress:
+    return baker.make(RelayAddress, user=user, num_forwarded=2)
+
+
+def test_increment_is_written_on_flush(relay_address: RelayAddress) -> None:
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    increment(RelayAddress, relay_address.id, "num_level_one_trackers_blocked", 3)
+    relay_address.refresh_from_db()
+    assert relay_address.num_forwarded == 2
+
+    assert flush_counters() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.num_forwarded == 4
+    assert relay_address.num_level_one_trackers_blocked == 3
+
+    # The flushed changes are not written again
+    assert flush_counters() == 0
+    increment(RelayAddress, relay_address.id, "num_blocked")
+    assert flush_counters() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.num_forwarded == 4
+    assert relay_address.num_blocked == 1
+
+
+def test_set_latest_keeps_later_timestamp(relay_address: RelayAddress) -> None:
+    now = datetime.now(timezone.utc)
+    profile = relay_address.user.profile
+    profile.last_engagement = now
+    profile.save()
+
+    set_latest(Profile, profile.id, "last_engagement", now - timedelta(minutes=5))
+    set_latest(RelayAddress, relay_address.id, "last_used_at", now)
+    assert flush_counters() == 2
+
+    profile.refresh_from_db()
+    assert profile.last_engagement == now
+    relay_address.refresh_from_db()
+    assert relay_address.last_used_at == now
+
+
+def test_set_latest_keeps_later_pending_timestamp(
+    relay_address: RelayAddress,
+) -> None:
+    now = datetime.now(timezone.utc)
+    set_latest(RelayAddress, relay_address.id, "last_used_at", now)
+    set_latest(
+        RelayAddress, relay_address.id, "last_used_at", now - timedelta(minutes=5)
+    )
+    assert cache.get(_key("emails.relayaddress", relay_address.id, "last_used_at")) == (
+        now.timestamp()
+    )
+
+
+def test_flush_skips_while_another_process_flushes(
+    relay_address: RelayAddress,
+) -> None:
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    cache.set(FLUSH_LOCK_KEY, True)
+    try:
+        assert flush_counters() == 0
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    assert flush_counters() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.num_forwarded == 3
+
+
+def test_flush_keeps_timestamp_set_during_flush(relay_address: RelayAddress) -> None:
+    now = datetime.now(timezone.utc)
+    set_latest(RelayAddress, relay_address.id, "last_used_at", now)
+    later = now + timedelta(seconds=1)
+    atomic = transaction.atomic
+
+    @contextmanager
+    def set_later_in_atomic() -> Iterator[None]:
+        set_latest(RelayAddress, relay_address.id, "last_used_at", later)
+        with atomic():
+            yield
+
+    with patch("emails.counters.transaction.atomic", set_later_in_atomic):
+        assert flush_counters() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.last_used_at == now
+
+    assert flush_counters() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.last_used_at == later
+
+
+def test_flush_skips_missing_log_entry_on_second_flush(
+    user: User, caplog: pytest.LogCaptureFixture
+) -> None:
+    first, second = baker.make(RelayAddress, user=user, _quantity=2)
+    increment(RelayAddress, first.id, "num_forwarded")
+    # A log entry that is numbered, but not written yet
+    cache.incr(LOG_SEQ_KEY)
+    increment(RelayAddress, second.id, "num_forwarded")
+
+    assert flush_counters() == 1
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.num_forwarded, second.num_forwarded) == (1, 0)
+    assert caplog.records == []
+
+    assert flush_counters() == 1
+    second.refresh_from_db()
+    assert second.num_forwarded == 1
+    assert [rec.msg for rec in caplog.records] == ["counter_log_entry_missing"]
+
+
+def test_flush_counters_if_due(relay_address: RelayAddress) -> None:
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    assert flush_counters_if_due() == 1
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    # Flushed recently, so left for the next flush
+    assert flush_counters_if_due() == 0
+    cache.delete(FLUSHED_KEY)
+    assert flush_counters_if_due() == 1
+    relay_address.refresh_from_db()
+    assert relay_address.num_forwarded == 4
+
+
+def test_add_pending_counts(relay_address: RelayAddress) -> None:
+    now = datetime.now(timezone.utc)
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    set_latest(RelayAddress, relay_address.id, "last_used_at", now)
+
+    add_pending_counts([relay_address])
+    assert relay_address.num_forwarded == 3
+    assert relay_address.last_used_at == now
+    # Pending counts are only added once
+    add_pending_counts([relay_address])
+    assert relay_address.num_forwarded == 3
+
+
+def test_profile_stats_include_pending_counts(db) -> None:
+    user = make_premium_test_user()
+    user.profile.subdomain = "premium"
+    user.profile.save()
+    relay_address = baker.make(RelayAddress, user=user, num_forwarded=2)
+    domain_address = baker.make(DomainAddress, user=user, address="shop")
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    increment(DomainAddress, domain_address.id, "num_blocked", 2)
+
+    profile = Profile.objects.get(user=user)
+    assert profile.emails_forwarded == 3
+    assert profile.emails_blocked == 2
+
+
+def test_api_shows_pending_counts(relay_address: RelayAddress) -> None:
+    increment(RelayAddress, relay_address.id, "num_forwarded")
+    client = APIClient()
+    client.force_authenticate(user=relay_address.user)
+
+    response = client.get("/api/v1/relayaddresses/")
+    assert response.status_code == 200
+    assert [address["num_forwarded"] for address in response.json()] == [3]
+
+    response = client.get(f"/api/v1/relayaddresses/{relay_address.id}/")
+    assert response.json()["num_forwarded"] == 3
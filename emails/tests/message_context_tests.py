@@ -0,0 +1,77 @@
+from unittest.mock import Mock
+
+from django.db import DatabaseError
+
+import pytest
+
+from emails.message_context import defer_write, load, load_many, message_context
+from emails.models import Reply
+
+
+def test_load_without_context_loads_each_time() -> None:
+    loader = Mock(return_value="row")
+    assert load("key", loader) == "row"
+    assert load("key", loader) == "row"
+    assert loader.call_count == 2
+
+
+def test_load_reuses_rows_and_missing_rows() -> None:
+    loader = Mock(return_value="row")
+    missing_loader = Mock(side_effect=Reply.DoesNotExist())
+    with message_context():
+        assert load("key", loader) == "row"
+        assert load("key", loader) == "row"
+        for _ in range(2):
+            with pytest.raises(Reply.DoesNotExist):
+                load("missing", missing_loader)
+    loader.assert_called_once_with()
+    missing_loader.assert_called_once_with()
+
+
+def test_load_many_loads_new_keys() -> None:
+    loader = Mock(side_effect=lambda keys: {key: key.upper() for key in keys if key})
+    with message_context():
+        assert load_many(["a", "b"], loader) == {"a": "A", "b": "B"}
+        assert load_many(["b", "c", ""], loader) == {"b": "B", "c": "C", "": None}
+        assert load_many(["", "a"], loader) == {"": None, "a": "A"}
+    assert [call.args for call in loader.call_args_list] == [
+        (["a", "b"],),
+        (["c", ""],),
+    ]
+
+
+@pytest.mark.django_db
+def test_writes_run_when_message_is_processed() -> None:
+    write = Mock()
+    with message_context():
+        defer_write(write)
+        defer_write(write)
+        write.assert_not_called()
+    assert write.call_count == 2
+
+
+def test_writes_dropped_on_error() -> None:
+    write = Mock()
+    with pytest.raises(ValueError):
+        with message_context():
+            defer_write(write)
+            raise ValueError()
+    write.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_failed_writes_logged(caplog: pytest.LogCaptureFixture) -> None:
+    write = Mock()
+    with message_context():
+        defer_write(Mock(side_effect=DatabaseError("down")))
+        defer_write(write)
+    write.assert_not_called()
+    assert "message_context_writes_failed" in [
+        record.getMessage() for record in caplog.records
+    ]
+
+
+def test_write_without_context_runs_now() -> None:
+    write = Mock()
+    defer_write(write)
+    write.assert_called_once_with()
@@ -0,0 +1,59 @@
+from importlib import import_module
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from emails.models import Profile
+
+from .models_tests import make_free_test_user, make_premium_test_user
+
+COMMAND_NAME = "backfill_profile_entitlements"
+
+
+@pytest.mark.django_db
+def test_sets_entitlements_from_mozilla_account() -> None:
+    premium_user = make_premium_test_user()
+    free_user = make_free_test_user()
+    # Like profiles saved before the entitlement columns
+    Profile.objects.filter(user=premium_user).update(premium_entitlement=False)
+    Profile.objects.filter(user=free_user).update(vpn_entitlement=True)
+
+    stdout = StringIO()
+    with patch("emails.address_cache.forget_owner") as mocked_forget_owner:
+        call_command(COMMAND_NAME, "--batch-size", "1", stdout=stdout)
+    assert sorted(call.args[0] for call in mocked_forget_owner.call_args_list) == (
+        sorted([premium_user.id, free_user.id])
+    )
+    assert stdout.getvalue() == "Updated the entitlements of 2 of 2 profiles.\n"
+    premium_profile = Profile.objects.get(user=premium_user)
+    assert premium_profile.premium_entitlement
+    assert premium_profile.has_premium
+    free_profile = Profile.objects.get(user=free_user)
+    assert not free_profile.vpn_entitlement
+    assert not free_profile.has_premium
+
+
+@pytest.mark.django_db
+def test_migration_sets_entitlements_of_existing_profiles() -> None:
+    premium_user = make_premium_test_user()
+    staff_user = make_free_test_user("staff@mozilla.com")
+    free_user = make_free_test_user()
+    # Like profiles saved before the entitlement columns
+    Profile.objects.update(premium_entitlement=False)
+
+    migration = import_module("emails.migrations.0062_set_profile_entitlements")
+    migration.set_entitlements(apps, None)
+
+    assert Profile.objects.get(user=premium_user).premium_entitlement
+    assert Profile.objects.get(user=staff_user).premium_entitlement
+    assert not Profile.objects.get(user=free_user).premium_entitlement
+
+
+def test_invalid_batch_size() -> None:
+    with pytest.raises(CommandError, match="at least 1"):
+        call_command(COMMAND_NAME, "--batch-size", "0")
@@ -0,0 +1,131 @@
+from io import StringIO
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import patch
+import json
+
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from emails.address_cache import get_snapshot
+from emails.management.commands.benchmark_email_forwarding import (
+    LocalS3Client,
+    percentiles,
+    synthetic_notifications,
+)
+from emails.models import RelayAddress
+from emails.tests.views_tests import EMAIL_INCOMING, EMAIL_SNS_BODIES
+from emails.utils import get_domains_from_settings, TrackerIndex
+
+COMMAND_NAME = "benchmark_email_forwarding"
+
+
+@pytest.fixture(autouse=True)
+def mock_tracker_index() -> Iterator[None]:
+    index = TrackerIndex(["tracker.example.com"], ["strict.example.com"])
+    with patch("emails.utils._tracker_index", index):
+        yield
+
+
+@pytest.mark.django_db
+def test_synthetic_emails(tmp_path: Path) -> None:
+    output = tmp_path / "results.json"
+    call_command(
+        COMMAND_NAME, "--count", "8", "--output", str(output), stdout=StringIO()
+    )
+    results = json.loads(output.read_text())
+    assert results["messages"] == 8
+    assert results["statuses"] == {"200": 8}
+    assert results["emails_sent"] == 8
+    assert results["messages_per_s"] > 0
+    assert results["peak_rss_mb"] > 0
+    assert {
+        "address_lookup",
+        "mime_parse",
+        "header_replace",
+        "ses_send",
+        "db_write",
+    } <= set(results["stages"])
+    assert results["stages"]["ses_send"]["count"] == 8
+    assert RelayAddress.objects.count() == 0
+    mozmail_domain = get_domains_from_settings()["MOZMAIL_DOMAIN"]
+    assert get_snapshot("corpus0", mozmail_domain) is None
+
+
+@pytest.mark.django_db
+def test_corpus_compared_to_baseline(tmp_path: Path) -> None:
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text(
+        json.dumps(EMAIL_SNS_BODIES["single_recipient"])
+        + "\n"
+        + json.dumps(EMAIL_SNS_BODIES["s3_stored"])
+        + "\n"
+    )
+    s3_object = tmp_path / "s3" / "test-bucket" / "emails" / "objectkey123"
+    s3_object.parent.mkdir(parents=True)
+    s3_object.write_text(EMAIL_INCOMING["plain_text"])
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(
+        json.dumps(
+            {
+                "messages_per_s": 1.0,
+                "message": {"p50_ms": 1000.0},
+                "stages": {"mime_parse": {"p50_ms": 1000.0}},
+            }
+        )
+    )
+    stdout = StringIO()
+
+    call_command(
+        COMMAND_NAME,
+        "--corpus",
+        str(corpus),
+        "--s3-dir",
+        str(tmp_path / "s3"),
+        "--repeat",
+        "2",
+        "--baseline",
+        str(baseline),
+        stdout=stdout,
+    )
+    lines = stdout.getvalue().splitlines()
+    assert lines[0] == "Messages: 4, statuses: {'200': 4}, emails sent: 4"
+    assert lines[1].startswith("Throughput: ") and lines[1].endswith("%)")
+    mime_parse = next(line for line in lines if line.startswith("mime_parse"))
+    assert "(-" in mime_parse
+    assert RelayAddress.objects.count() == 0
+
+
+def test_missing_corpus(tmp_path: Path) -> None:
+    with pytest.raises(CommandError, match="not found"):
+        call_command(COMMAND_NAME, "--corpus", str(tmp_path / "missing.jsonl"))
+
+
+def test_synthetic_notifications_reproducible() -> None:
+    first_s3, second_s3 = LocalS3Client(), LocalS3Client()
+    first = list(synthetic_notifications(12, 42, first_s3))
+    assert first == list(synthetic_notifications(12, 42, second_s3))
+    assert first_s3.objects == second_s3.objects
+    assert first != list(synthetic_notifications(12, 43, LocalS3Client()))
+    message_jsons = [json.loads(json.loads(body)["Message"]) for body in first]
+    in_s3 = [msg for msg in message_jsons if msg["receipt"]["action"]["type"] == "S3"]
+    assert len(in_s3) == len(first_s3.objects)
+    assert all("content" not in msg for msg in in_s3)
+
+
+def test_percentiles() -> None:
+    times = [num / 1000 for num in range(1, 101)]
+    assert percentiles(times) == {
+        "p50_ms": 50.0,
+        "p95_ms": 95.0,
+        "p99_ms": 99.0,
+        "max_ms": 100.0,
+    }
+    assert percentiles([0.002]) == {
+        "p50_ms": 2.0,
+        "p95_ms": 2.0,
+        "p99_ms": 2.0,
+        "max_ms": 2.0,
+    }
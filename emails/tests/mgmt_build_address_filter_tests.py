@@ -0,0 +1,139 @@
+from io import StringIO
+from typing import Any, Iterator
+from unittest.mock import patch
+import time
+
+import pytest
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+
+from model_bakery import baker
+
+from emails.address_filter import (
+    FILTER_BUILT_AT_KEY,
+    NEW_ADDRESS_KEY_PREFIX,
+    BloomFilter,
+    LoadedFilter,
+    might_exist,
+)
+from emails.models import RelayAddress
+from emails.utils import get_domains_from_settings
+
+from .models_tests import make_free_test_user
+
+COMMAND_NAME = "build_address_filter"
+
+
+@pytest.fixture(autouse=True)
+def empty_address_filter() -> Iterator[None]:
+    cache.clear()
+    with patch("emails.address_filter._loaded", LoadedFilter()):
+        yield
+    cache.clear()
+
+
+@pytest.fixture
+def relay_address(db) -> RelayAddress:
+    return baker.make(RelayAddress, user=make_free_test_user(), address="live123")
+
+
+def test_bloom_filter() -> None:
+    bloom = BloomFilter.for_capacity(1000, 0.01)
+    assert bloom.num_hashes == 7
+    items = [f"address{num}@test.com" for num in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    others = [f"other{num}@test.com" for num in range(10_000)]
+    false_positives = sum(1 for item in others if item in bloom)
+    assert false_positives < 200
+
+    copy = BloomFilter(bloom.num_bits, bloom.num_hashes, bytes(bloom.bits))
+    assert all(item in copy for item in items)
+
+
+@pytest.mark.django_db
+def test_without_filter_all_addresses_might_exist() -> None:
+    assert might_exist("unknown", "test.com")
+
+
+def test_build_address_filter(relay_address: RelayAddress) -> None:
+    domain = relay_address.domain_value
+    stdout = StringIO()
+    call_command(COMMAND_NAME, stdout=stdout)
+    assert stdout.getvalue().startswith("Built the address filter in ")
+    assert might_exist("live123", domain)
+    assert might_exist("Live123", domain.upper())
+    assert not might_exist("unknown", domain)
+
+
+def test_new_address_might_exist(relay_address: RelayAddress) -> None:
+    call_command(COMMAND_NAME, stdout=StringIO())
+    domain = get_domains_from_settings()["MOZMAIL_DOMAIN"]
+    assert not might_exist("new456", domain)
+    baker.make(RelayAddress, user=relay_address.user, address="new456")
+    assert might_exist("new456", domain)
+
+
+def test_cache_error_when_checking_address(relay_address: RelayAddress) -> None:
+    call_command(COMMAND_NAME, stdout=StringIO())
+    domain = relay_address.domain_value
+    assert not might_exist("unknown", domain)
+    with patch(
+        "emails.address_filter.cache.get_many", side_effect=ConnectionError("down")
+    ):
+        assert might_exist("unknown", domain)
+
+
+def test_lost_cache_entries_when_checking_address(
+    relay_address: RelayAddress,
+) -> None:
+    call_command(COMMAND_NAME, stdout=StringIO())
+    domain = relay_address.domain_value
+    assert not might_exist("unknown", domain)
+    # As if the cache was cleared, with the new addresses
+    cache.delete(FILTER_BUILT_AT_KEY)
+    assert might_exist("unknown", domain)
+
+
+def test_cache_error_when_recording_new_address(relay_address: RelayAddress) -> None:
+    call_command(COMMAND_NAME, stdout=StringIO())
+    domain = get_domains_from_settings()["MOZMAIL_DOMAIN"]
+    assert not might_exist("new456", domain)
+    cache_set = cache.set
+
+    def fail_to_record(key: str, *args: Any) -> None:
+        if key.startswith(NEW_ADDRESS_KEY_PREFIX):
+            raise ConnectionError("down")
+        cache_set(key, *args)
+
+    with patch("emails.address_filter.cache.set", side_effect=fail_to_record):
+        baker.make(RelayAddress, user=relay_address.user, address="new456")
+    assert cache.get(FILTER_BUILT_AT_KEY) is None
+    assert might_exist("new456", domain)
+
+
+def test_expired_filter_is_not_used(relay_address: RelayAddress) -> None:
+    call_command(COMMAND_NAME, stdout=StringIO())
+    domain = relay_address.domain_value
+    assert not might_exist("unknown", domain)
+    with patch("emails.address_filter.time.time", return_value=time.time() + 90000):
+        assert might_exist("unknown", domain)
+
+
+@override_settings(ADDRESS_FILTER_REFRESH_SECONDS=600)
+def test_rebuilt_filter_is_loaded_after_refresh(relay_address: RelayAddress) -> None:
+    assert might_exist("unknown", relay_address.domain_value)
+    call_command(COMMAND_NAME, stdout=StringIO())
+    assert might_exist("unknown", relay_address.domain_value)
+    refresh_time = time.monotonic() + 601
+    with patch("emails.address_filter.time.monotonic", return_value=refresh_time):
+        assert not might_exist("unknown", relay_address.domain_value)
+
+
+def test_invalid_error_rate() -> None:
+    with pytest.raises(CommandError, match="between 0 and 1"):
+        call_command(COMMAND_NAME, "--error-rate", "1.5")
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from model_bakery import baker
+
+from emails.models import AbuseMetrics
+
+from .models_tests import make_free_test_user
+
+COMMAND_NAME = "delete_old_abuse_metrics"
+
+
+@pytest.mark.django_db
+def test_deletes_metrics_of_previous_days() -> None:
+    user = make_free_test_user()
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date(), datetime.min.time(), timezone.utc)
+    for days in (1, 2, 3):
+        metrics = baker.make(AbuseMetrics, user=user)
+        # first_recorded is set on create, so override it after
+        metrics.first_recorded = midnight - timedelta(days=days)
+        metrics.save()
+    today = baker.make(AbuseMetrics, user=user)
+
+    stdout = StringIO()
+    call_command(COMMAND_NAME, "--batch-size", "2", stdout=stdout)
+    assert stdout.getvalue().startswith("Deleted 3 abuse metrics recorded before ")
+    assert list(AbuseMetrics.objects.all()) == [today]
+
+
+def test_invalid_batch_size() -> None:
+    with pytest.raises(CommandError, match="at least 1"):
+        call_command(COMMAND_NAME, "--batch-size", "0")
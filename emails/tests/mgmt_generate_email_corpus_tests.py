@@ -0,0 +1,106 @@
+from email.message import EmailMessage
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import patch
+import json
+
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from emails.management.email_corpus import CORPUS_BUCKET, EmailCorpus, KINDS
+from emails.utils import parse_email_file, TrackerIndex
+
+COMMAND_NAME = "generate_email_corpus"
+
+
+@pytest.fixture(autouse=True)
+def mock_tracker_index() -> Iterator[None]:
+    index = TrackerIndex(["tracker.example.com"], ["strict.example.com"])
+    with patch("emails.utils._tracker_index", index):
+        yield
+
+
+def read_jsonl(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_generate_corpus(tmp_path: Path) -> None:
+    call_command(
+        COMMAND_NAME,
+        str(tmp_path),
+        "--count",
+        "30",
+        "--attachment-max-bytes",
+        "20000",
+        stdout=StringIO(),
+    )
+    content_notifications = read_jsonl(tmp_path / "notifications-content.jsonl")
+    s3_notifications = read_jsonl(tmp_path / "notifications-s3.jsonl")
+    assert len(content_notifications) == len(s3_notifications) == 30
+
+    for content_notification, s3_notification in zip(
+        content_notifications, s3_notifications
+    ):
+        assert content_notification["Type"] == "Notification"
+        content_json = json.loads(content_notification["Message"])
+        s3_json = json.loads(s3_notification["Message"])
+        assert content_json["mail"] == s3_json["mail"]
+        assert content_json["receipt"]["action"]["type"] == "SNS"
+        action = s3_json["receipt"]["action"]
+        assert action["type"] == "S3"
+        assert action["bucketName"] == CORPUS_BUCKET
+        assert "content" not in s3_json
+        s3_object = tmp_path / "s3" / CORPUS_BUCKET / action["objectKey"]
+        assert s3_object.read_bytes() == content_json["content"].encode()
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert manifest["count"] == 30
+    assert sum(manifest["kind_counts"].values()) == 30
+    assert set(manifest["kind_counts"]) == set(KINDS)
+
+
+def test_unknown_kind(tmp_path: Path) -> None:
+    with pytest.raises(CommandError, match="Unknown email kinds"):
+        call_command(COMMAND_NAME, str(tmp_path), "--kinds", "plain,spam")
+
+
+def test_corpus_reproducible() -> None:
+    corpus = EmailCorpus(seed=1, attachment_max_bytes=1000)
+    emails = list(corpus.emails(10))
+    assert emails == list(EmailCorpus(seed=1, attachment_max_bytes=1000).emails(10))
+    assert emails[5:] == list(corpus.emails(5, start=5))
+    assert emails != list(EmailCorpus(seed=2, attachment_max_bytes=1000).emails(10))
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_corpus_email_kinds(kind: str) -> None:
+    corpus = EmailCorpus(
+        kinds=[kind],
+        tracker_densities=[1.0],
+        attachment_max_bytes=1000,
+        references_max=50,
+    )
+    for corpus_email in corpus.emails(8):
+        assert corpus_email.kind == kind
+        email = parse_email_file(BytesIO(corpus_email.raw))
+        assert email["To"] == corpus_email.to_address
+        html = email.get_body("html")
+        text = email.get_body("plain")
+        assert (html is None) == (kind == "plain")
+        assert (text is None) == (kind == "html")
+        if html is not None:
+            assert isinstance(html, EmailMessage)
+            assert "/click?id=" in html.get_content()
+        attachments = list(email.iter_attachments())
+        assert len(attachments) == (1 if kind == "attachment" else 0)
+        defects = [name for name in email.keys() if email[name].defects]
+        assert bool(defects) == (kind == "bad_headers")
+        if kind == "references":
+            references = email["References"].split()
+            assert 1 <= len(references) <= 50
+            assert email["In-Reply-To"] == references[-1]
+        else:
+            assert "References" not in email
@@ -1,8 +1,12 @@
 from datetime import datetime, timezone
 from typing import Any, Generator, TYPE_CHECKING
-from unittest.mock import patch, Mock
+from unittest.mock import call, patch, Mock
 from uuid import uuid4
 import json
+import os
+import signal
+import threading
+import time
 
 from botocore.exceptions import ClientError
 from markus.testing import MetricsMock
@@ -12,7 +16,14 @@ import OpenSSL
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
+from emails.management.commands.process_emails_from_sqs import (
+    Command,
+    MessagePrefetcher,
+    PrefetchedBatch,
+    StackSampler,
+)
 from emails.tests.views_tests import EMAIL_SNS_BODIES
+from emails.utils import email_stage, set_stage_details, set_stage_email_size
 from privaterelay.tests.utils import log_extra
 
 if TYPE_CHECKING:
@@ -78,6 +89,14 @@ def mock_sns_inbound_logic():
         yield mock_sns_inbound_logic
 
 
+@pytest.fixture(autouse=True)
+def mock_refresh_tracker_index():
+    """Mock refresh_tracker_index() to keep the current index"""
+    with patch(f"{MOCK_BASE}.refresh_tracker_index") as mock_refresh:
+        mock_refresh.return_value = None
+        yield mock_refresh
+
+
 @pytest.fixture(autouse=True)
 def test_settings(settings, tmp_path):
     """Override settings for tests."""
@@ -88,9 +107,14 @@ def test_settings(settings, tmp_path):
         "https://sqs.us-east-1.amazonaws.example.com/111222333/queue-name"
     )
     settings.PROCESS_EMAIL_BATCH_SIZE = 10
+    settings.PROCESS_EMAIL_CONCURRENCY = 1
     settings.PROCESS_EMAIL_DELETE_FAILED_MESSAGES = False
     settings.PROCESS_EMAIL_HEALTHCHECK_PATH = str(tmp_path / "healthcheck.json")
     settings.PROCESS_EMAIL_MAX_SECONDS = 3
+    settings.PROCESS_EMAIL_PREFETCH_BATCHES = 0
+    settings.PROCESS_EMAIL_PROFILE_DIR = None
+    settings.PROCESS_EMAIL_PROFILE_MAX_FILES = 20
+    settings.PROCESS_EMAIL_PROFILE_SECONDS = 10.0
     settings.PROCESS_EMAIL_VERBOSITY = 2
     settings.PROCESS_EMAIL_VISIBILITY_SECONDS = 120
     settings.PROCESS_EMAIL_WAIT_SECONDS = 5
@@ -122,7 +146,15 @@ def fake_queue(*message_lists):
     Arguments:
     message_lists: A list of lists of messages, None if no messages
     """
-    queue = Mock(spec_set=("receive_messages", "load", "attributes"))
+    queue = Mock(
+        spec_set=(
+            "receive_messages",
+            "load",
+            "attributes",
+            "change_message_visibility_batch",
+            "delete_messages",
+        )
+    )
     queue.attributes = {
         "ApproximateNumberOfMessages": 1,
         "ApproximateNumberOfMessagesDelayed": 2,
@@ -132,9 +164,21 @@ def fake_queue(*message_lists):
         queue.receive_messages.side_effect = message_lists
     else:
         queue.receive_messages.return_value = []
+    queue.delete_messages.side_effect = lambda Entries: {
+        "Successful": [{"Id": entry["Id"]} for entry in Entries]
+    }
     return queue
 
 
+def deleted_receipt_handles(queue):
+    """Get the receipt handles of messages deleted with queue.delete_messages()"""
+    return [
+        entry["ReceiptHandle"]
+        for call in queue.delete_messages.call_args_list
+        for entry in call.kwargs["Entries"]
+    ]
+
+
 def fake_sqs_message(body):
     """
     Create a fake SQS message
@@ -142,13 +186,13 @@ def fake_sqs_message(body):
     Only includes some attributes. For full spec, see:
     https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sqs.html#message
     """
-    msg = Mock(spec_set=("queue_url", "receipt_handle", "body", "message_id", "delete"))
+    msg = Mock(spec_set=("queue_url", "receipt_handle", "body", "message_id"))
     msg.queue_url = (
         "https://sqs.us-east-1.amazonaws.example.com/123456789012/queue-name"
     )
     msg.receipt_handle = uuid4()
     msg.body = body
-    msg.message_id = uuid4()
+    msg.message_id = str(uuid4())
     return msg
 
 
@@ -178,9 +222,15 @@ def test_no_messages(caplog, test_settings):
     assert log_extra(rec1) == {
         "aws_region": "us-east-1",
         "batch_size": 10,
+        "concurrency": 1,
         "delete_failed_messages": False,
         "healthcheck_path": test_settings.PROCESS_EMAIL_HEALTHCHECK_PATH,
         "max_seconds": 3,
+        "prefetch_batches": 0,
+        "processes": 1,
+        "profile_dir": None,
+        "profile_max_files": 20,
+        "profile_seconds": 10.0,
         "sqs_url": "https://sqs.us-east-1.amazonaws.example.com/111222333/queue-name",
         "verbosity": 2,
         "visibility_seconds": 120,
@@ -236,9 +286,11 @@ def test_one_message(
     assert set(msg_extra.keys()) == {
         "message_process_time_s",
         "sqs_message_id",
+        "stage_s",
         "success",
     }
     assert msg_extra["success"]
+    assert list(msg_extra["stage_s"]) == ["sns_verify"]
 
     assert summary_from_exit_log(caplog)["total_messages"] == 1
 
@@ -250,6 +302,351 @@ def test_one_message(
     )
 
 
+def test_tracker_index_refreshed_between_batches(
+    mock_refresh_tracker_index, caplog
+) -> None:
+    """The tracker index is refreshed before each batch, and new versions logged."""
+    mock_refresh_tracker_index.side_effect = ["abc123", None]
+    call_command(COMMAND_NAME)
+
+    assert mock_refresh_tracker_index.call_count == 2
+    cycle0_log, cycle1_log = caplog.records[1:3]
+    assert cycle0_log.getMessage() == "Cycle 0: processed 0 messages"
+    assert log_extra(cycle0_log)["tracker_index_version"] == "abc123"
+    assert cycle1_log.getMessage() == "Cycle 1: processed 0 messages"
+    assert "tracker_index_version" not in log_extra(cycle1_log)
+
+
+def test_stage_times_logged_and_emitted(
+    mock_sns_inbound_logic, mock_sqs_client, caplog, test_settings
+) -> None:
+    """The time in each stage is logged and emitted, tagged by email size."""
+    test_settings.STATSD_ENABLED = True
+
+    def sns_inbound_logic(topic_arn, message_type, json_body):
+        set_stage_email_size(50_000)
+        with email_stage("ses_send"):
+            pass
+
+    mock_sns_inbound_logic.side_effect = sns_inbound_logic
+    msg = fake_sqs_message(json.dumps(TEST_SNS_MESSAGE))
+    mock_sqs_client.return_value = fake_queue([msg], [])
+    with MetricsMock() as mm:
+        call_command(COMMAND_NAME)
+
+    msg_log = caplog.records[1]
+    assert msg_log.getMessage() == "Message processed"
+    assert list(log_extra(msg_log)["stage_s"]) == ["sns_verify", "ses_send"]
+    for stage in ("sns_verify", "ses_send"):
+        mm.assert_histogram_once(
+            f"fx.private.relay.email_stage.{stage}", tags=["email_size:10kb_100kb"]
+        )
+
+
+def test_concurrent_messages(
+    mock_sns_inbound_logic, mock_sqs_client, caplog, test_settings
+):
+    """With concurrency, the command processes a batch on a thread pool."""
+    test_settings.PROCESS_EMAIL_CONCURRENCY = 3
+    internal_error = make_client_error(code="InternalError")
+    thread_names = set()
+
+    def inbound_logic(topic_arn, message_type, json_body):
+        thread_names.add(threading.current_thread().name)
+        if json_body["MessageId"] == "bad":
+            raise internal_error
+
+    mock_sns_inbound_logic.side_effect = inbound_logic
+    messages = [
+        fake_sqs_message(json.dumps(TEST_SNS_MESSAGE | {"MessageId": msg_id}))
+        for msg_id in ("good1", "bad", "good2", "good3")
+    ]
+    mock_sqs_client.return_value = fake_queue(messages, [])
+    with patch(f"{MOCK_BASE}.connections.close_all") as mock_close_all:
+        call_command(COMMAND_NAME)
+
+    assert mock_sns_inbound_logic.call_count == 4
+    assert mock_close_all.call_count == 4
+    assert all(name.startswith("process_email") for name in thread_names)
+    msg_logs = [
+        rec for rec in caplog.records if rec.getMessage() == "Message processed"
+    ]
+    assert [log_extra(rec)["sqs_message_id"] for rec in msg_logs] == [
+        msg.message_id for msg in messages
+    ]
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == [
+        msg.receipt_handle for msg in messages if msg is not messages[1]
+    ]
+    summary = summary_from_exit_log(caplog)
+    assert summary["total_messages"] == 4
+    assert summary["failed_messages"] == 1
+
+
+def fake_long_poll(*message_lists):
+    """
+    Return a receive_messages side effect that returns the message lists, then
+    waits briefly and returns empty lists, like a long poll of an empty queue.
+    """
+    remaining = list(message_lists)
+    poll_done = threading.Event()
+
+    def receive_messages(**kwargs):
+        if remaining:
+            return remaining.pop(0)
+        poll_done.wait(0.05)
+        return []
+
+    return receive_messages
+
+
+def test_prefetch_messages(mock_sqs_client, caplog, test_settings):
+    """With prefetching, the command processes messages received in the background."""
+    test_settings.PROCESS_EMAIL_PREFETCH_BATCHES = 1
+    test_settings.PROCESS_EMAIL_MAX_SECONDS = 10
+    test_settings.PROCESS_EMAIL_WAIT_SECONDS = 1
+    msg = fake_sqs_message(json.dumps(TEST_SNS_MESSAGE))
+    queue = fake_queue()
+    queue.receive_messages.side_effect = fake_long_poll([msg])
+    mock_sqs_client.return_value = queue
+    call_command(COMMAND_NAME)
+
+    cycle_log = caplog.records[2]
+    assert cycle_log.getMessage() == "Cycle 0: processed 1 message"
+    assert log_extra(cycle_log)["prefetch_buffered"] == 0
+    assert summary_from_exit_log(caplog)["total_messages"] == 1
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == [msg.receipt_handle]
+    queue.change_message_visibility_batch.assert_not_called()
+
+
+def test_prefetcher_get_batch() -> None:
+    """MessagePrefetcher returns batches in the order they were received."""
+    msg1, msg2 = fake_sqs_message("one"), fake_sqs_message("two")
+    queue = fake_queue()
+    queue.receive_messages.side_effect = fake_long_poll([msg1], [msg2])
+    prefetcher = MessagePrefetcher(
+        queue, batch_size=10, wait_seconds=5, visibility_seconds=120, max_batches=2
+    )
+    prefetcher.start()
+    try:
+        assert prefetcher.get_batch(timeout=5) == [msg1]
+        assert prefetcher.get_batch(timeout=5) == [msg2]
+        assert prefetcher.get_batch(timeout=0.1) == []
+    finally:
+        prefetcher.stop()
+    queue.receive_messages.assert_called_with(
+        MaxNumberOfMessages=10, VisibilityTimeout=120, WaitTimeSeconds=5
+    )
+
+
+def test_prefetcher_stop_releases_buffered_messages() -> None:
+    """When stopped, MessagePrefetcher makes buffered messages visible again."""
+    msg1, msg2 = fake_sqs_message("one"), fake_sqs_message("two")
+    queue = fake_queue()
+    queue.receive_messages.side_effect = fake_long_poll([msg1, msg2])
+    queue.change_message_visibility_batch.return_value = {"Successful": []}
+    prefetcher = MessagePrefetcher(
+        queue, batch_size=10, wait_seconds=5, visibility_seconds=120, max_batches=1
+    )
+    prefetcher.start()
+    buffered = threading.Event()
+    while prefetcher.buffered_batches() == 0:
+        buffered.wait(0.01)
+    prefetcher.stop()
+    queue.change_message_visibility_batch.assert_called_once_with(
+        Entries=[
+            {"Id": "0", "ReceiptHandle": msg1.receipt_handle, "VisibilityTimeout": 0},
+            {"Id": "1", "ReceiptHandle": msg2.receipt_handle, "VisibilityTimeout": 0},
+        ]
+    )
+    assert prefetcher.buffered_batches() == 0
+
+
+def test_prefetcher_refresh_visibility(caplog) -> None:
+    """MessagePrefetcher extends the visibility of batches waiting too long."""
+    old_msg, new_msg = fake_sqs_message("old"), fake_sqs_message("new")
+    queue = fake_queue()
+    queue.change_message_visibility_batch.return_value = {
+        "Successful": [],
+        "Failed": [{"Id": "0", "SenderFault": False, "Code": "InternalError"}],
+    }
+    prefetcher = MessagePrefetcher(
+        queue, batch_size=10, wait_seconds=5, visibility_seconds=120, max_batches=1
+    )
+    now = time.monotonic()
+    prefetcher.buffer.append(PrefetchedBatch([old_msg], now - 60))
+    prefetcher.buffer.append(PrefetchedBatch([new_msg], now))
+    prefetcher.refresh_visibility()
+    queue.change_message_visibility_batch.assert_called_once_with(
+        Entries=[
+            {
+                "Id": "0",
+                "ReceiptHandle": old_msg.receipt_handle,
+                "VisibilityTimeout": 120,
+            }
+        ]
+    )
+    assert prefetcher.buffer[0].refreshed_at > now
+    assert caplog.records[0].getMessage() == "sqs_visibility_error"
+
+
+def test_prefetcher_refresh_visibility_without_lock() -> None:
+    """MessagePrefetcher extends the visibility without blocking get_batch."""
+    msg = fake_sqs_message("old")
+    queue = fake_queue()
+    queue.receive_messages.side_effect = fake_long_poll([msg])
+    prefetcher = MessagePrefetcher(
+        queue, batch_size=10, wait_seconds=1, visibility_seconds=0.4, max_batches=1
+    )
+    refreshed = threading.Event()
+    blocked = []
+
+    def change_message_visibility_batch(Entries):
+        reader = threading.Thread(target=prefetcher.buffered_batches)
+        reader.start()
+        reader.join(timeout=1)
+        blocked.append(reader.is_alive())
+        refreshed.set()
+        return {"Successful": []}
+
+    queue.change_message_visibility_batch.side_effect = change_message_visibility_batch
+    prefetcher.start()
+    try:
+        assert refreshed.wait(timeout=5)
+    finally:
+        prefetcher.stop()
+    assert blocked and not any(blocked)
+
+
+def test_slow_message_profile_saved(
+    mock_sns_inbound_logic, mock_sqs_client, caplog, test_settings, tmp_path
+) -> None:
+    """When profiling, a slow message's profile is saved with email details."""
+    profile_dir = tmp_path / "profiles"
+    test_settings.PROCESS_EMAIL_PROFILE_DIR = str(profile_dir)
+
+    def slow_sns_inbound_logic(topic_arn, message_type, json_body):
+        set_stage_email_size(50_000)
+        set_stage_details(mime_parts=3)
+        with email_stage("html_convert"):
+            time.sleep(12)  # Mocked, increases monotonic clock
+
+    mock_sns_inbound_logic.side_effect = slow_sns_inbound_logic
+    msg = fake_sqs_message(json.dumps(TEST_SNS_MESSAGE))
+    mock_sqs_client.return_value = fake_queue([msg], [])
+    call_command(COMMAND_NAME)
+
+    msg_log = caplog.records[1]
+    assert msg_log.getMessage() == "Message processed"
+    profile_path = log_extra(msg_log)["profile_path"]
+    assert os.listdir(profile_dir) == [os.path.basename(profile_path)]
+    with open(profile_path) as profile_file:
+        profile = json.load(profile_file)
+    assert profile["sqs_message_id"] == msg.message_id
+    assert profile["message_process_time_s"] >= 12.0
+    assert profile["email_size"] == 50_000
+    assert profile["email_details"] == {"mime_parts": 3}
+    assert list(profile["stage_s"]) == ["sns_verify", "html_convert"]
+    assert profile["sample_count"] == sum(profile["stacks"].values())
+
+
+def test_profiles_limited_to_max_files(
+    mock_sns_inbound_logic, mock_sqs_client, caplog, test_settings, tmp_path
+) -> None:
+    """Only the newest profiles are kept, and fast messages are not saved."""
+    profile_dir = tmp_path / "profiles"
+    test_settings.PROCESS_EMAIL_PROFILE_DIR = str(profile_dir)
+    test_settings.PROCESS_EMAIL_PROFILE_MAX_FILES = 2
+    sleeps = iter([12, 12, 0, 12])
+    mock_sns_inbound_logic.side_effect = lambda *args: time.sleep(next(sleeps))
+    msgs = [fake_sqs_message(json.dumps(TEST_SNS_MESSAGE)) for _ in range(4)]
+    mock_sqs_client.return_value = fake_queue(msgs, [])
+    call_command(COMMAND_NAME)
+
+    msg_logs = [rec for rec in caplog.records if rec.msg == "Message processed"]
+    assert ["profile_path" in log_extra(rec) for rec in msg_logs] == [
+        True,
+        True,
+        False,
+        True,
+    ]
+    assert len(os.listdir(profile_dir)) == 2
+
+
+def test_stack_sampler_samples_registered_threads() -> None:
+    sampler = StackSampler()
+    with sampler.sample_thread() as counts:
+        sampler.sample()
+    sampler.sample()
+    assert sum(counts.values()) == 1
+    (stack,) = counts
+    frames = stack.split(";")
+    assert frames[-1].startswith("sample (")
+    assert frames[-2].startswith("test_stack_sampler_samples_registered_threads (")
+
+
+def test_delete_messages_in_batches(mock_sqs_client, caplog, test_settings):
+    """Processed messages are deleted with one request per batch."""
+    messages = [fake_sqs_message(json.dumps(TEST_SNS_MESSAGE)) for _ in range(3)]
+    mock_sqs_client.return_value = fake_queue(messages, [])
+    call_command(COMMAND_NAME)
+    queue = mock_sqs_client.return_value
+    queue.delete_messages.assert_called_once_with(
+        Entries=[
+            {"Id": str(num), "ReceiptHandle": msg.receipt_handle}
+            for num, msg in enumerate(messages)
+        ]
+    )
+    assert summary_from_exit_log(caplog)["total_messages"] == 3
+
+
+def test_delete_messages_flush_on_slow_batch(
+    mock_sns_inbound_logic, mock_sqs_client, caplog, test_settings
+):
+    """Deletes are sent before the end of the batch when processing is slow."""
+    messages = [fake_sqs_message(json.dumps(TEST_SNS_MESSAGE)) for _ in range(3)]
+    mock_sqs_client.return_value = fake_queue(messages, [])
+    mock_sns_inbound_logic.side_effect = lambda *args: time.sleep(6)
+    test_settings.PROCESS_EMAIL_MAX_SECONDS = 20
+    call_command(COMMAND_NAME)
+    queue = mock_sqs_client.return_value
+    assert [
+        len(call.kwargs["Entries"]) for call in queue.delete_messages.call_args_list
+    ] == [2, 1]
+
+
+def test_delete_messages_partial_failure(mock_sqs_client, caplog, test_settings):
+    """Messages that fail to delete are logged and counted."""
+    test_settings.STATSD_ENABLED = True
+    messages = [fake_sqs_message(json.dumps(TEST_SNS_MESSAGE)) for _ in range(2)]
+    queue = fake_queue(messages, [])
+    failure = {
+        "Id": "1",
+        "SenderFault": True,
+        "Code": "ReceiptHandleIsInvalid",
+        "Message": "The receipt handle has expired.",
+    }
+    queue.delete_messages.side_effect = None
+    queue.delete_messages.return_value = {
+        "Successful": [{"Id": "0"}],
+        "Failed": [failure],
+    }
+    mock_sqs_client.return_value = queue
+    with MetricsMock() as mm:
+        call_command(COMMAND_NAME)
+
+    error_logs = [
+        rec for rec in caplog.records if rec.getMessage() == "sqs_delete_error"
+    ]
+    assert len(error_logs) == 1
+    assert log_extra(error_logs[0]) == failure
+    cycle_log = next(
+        rec for rec in caplog.records if rec.getMessage().startswith("Cycle 0")
+    )
+    assert log_extra(cycle_log)["delete_failed_count"] == 1
+    assert summary_from_exit_log(caplog)["total_messages"] == 2
+    mm.assert_incr("fx.private.relay.message_delete_from_sqs_error", 1)
+
+
 def test_keyboard_interrupt(mock_sqs_client, caplog, test_settings):
     """The command halts on Ctrl-C."""
     test_settings.PROCESS_EMAIL_MAX_SECONDS = None
@@ -268,7 +665,7 @@ def test_no_body(mock_sqs_client, caplog):
     summary = summary_from_exit_log(caplog)
     assert summary["failed_messages"] == 1
     assert summary["cycles"] == 2
-    msg.delete.assert_not_called()
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == []
 
 
 def test_no_body_deleted(mock_sqs_client, caplog, test_settings):
@@ -280,7 +677,7 @@ def test_no_body_deleted(mock_sqs_client, caplog, test_settings):
     summary = summary_from_exit_log(caplog)
     assert summary["failed_messages"] == 1
     assert summary["cycles"] == 2
-    msg.delete.assert_called_once_with()
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == [msg.receipt_handle]
 
 
 def test_ses_temp_failure_retry(
@@ -301,7 +698,7 @@ def test_ses_temp_failure_retry(
     summary = summary_from_exit_log(caplog)
     assert summary["total_messages"] == 1
     assert summary["pause_count"] == 1
-    msg.delete.assert_called_once_with()
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == [msg.receipt_handle]
 
 
 def test_ses_temp_failure_twice(
@@ -320,7 +717,7 @@ def test_ses_temp_failure_twice(
     assert summary["total_messages"] == 1
     assert summary["failed_messages"] == 1
     assert summary["pause_count"] == 1
-    msg.delete.assert_not_called()
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == []
 
 
 def test_ses_generic_failure(mock_sns_inbound_logic, mock_sqs_client, caplog):
@@ -333,7 +730,7 @@ def test_ses_generic_failure(mock_sns_inbound_logic, mock_sqs_client, caplog):
     summary = summary_from_exit_log(caplog)
     assert summary["total_messages"] == 1
     assert summary["failed_messages"] == 1
-    msg.delete.assert_not_called()
+    assert deleted_receipt_handles(mock_sqs_client.return_value) == []
 
 
 def test_verify_from_sns_raises_openssl_error(
@@ -392,6 +789,102 @@ def test_writes_healthcheck_file(test_settings):
     assert 0.0 < duration < 0.5
 
 
+def test_processes_invalid() -> None:
+    """The command fails early on an invalid --processes value."""
+    with pytest.raises(CommandError) as err:
+        call_command(COMMAND_NAME, "--processes=0")
+    assert str(err.value) == "--processes has invalid value 0."
+
+
+def test_processes_supervisor(mock_sqs_client, caplog, test_settings) -> None:
+    """With --processes, workers are forked, restarted, and sent SIGTERM to stop."""
+    wait_results = iter([(101, 256), (0, 0), None, (102, 0), (103, 0)])
+
+    def mock_waitpid(pid: int, options: int) -> tuple[int, int]:
+        """Return the next worker exit, or simulate Ctrl-C for None."""
+        result = next(wait_results)
+        if result is None:
+            raise KeyboardInterrupt
+        return result
+
+    with (
+        patch(f"{MOCK_BASE}.os.fork", side_effect=[101, 102, 103]) as mock_fork,
+        patch(f"{MOCK_BASE}.os.waitpid", side_effect=mock_waitpid),
+        patch(f"{MOCK_BASE}.os.kill") as mock_kill,
+    ):
+        call_command(COMMAND_NAME, "--processes=2")
+
+    assert mock_fork.call_count == 3
+    assert mock_kill.call_args_list == [
+        call(102, signal.SIGTERM),
+        call(103, signal.SIGTERM),
+    ]
+    restart_log = next(
+        rec
+        for rec in caplog.records
+        if rec.getMessage() == "Worker process failed, restarting"
+    )
+    assert log_extra(restart_log) == {"worker": 0, "pid": 101, "exit_code": 1}
+    assert summary_from_exit_log(caplog) == {
+        "exit_on": "interrupt",
+        "processes": 2,
+        "restarts": 1,
+        "total_s": 2.0,
+    }
+    mock_sqs_client.assert_not_called()
+
+
+def test_processes_supervisor_healthcheck(test_settings) -> None:
+    """The supervisor combines the worker healthcheck files."""
+    healthcheck_path = test_settings.PROCESS_EMAIL_HEALTHCHECK_PATH
+    old_ts = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc).isoformat()
+    new_ts = datetime(2024, 1, 1, 12, 1, tzinfo=timezone.utc).isoformat()
+    worker_data = [
+        {
+            "timestamp": new_ts,
+            "cycles": 5,
+            "total_messages": 10,
+            "failed_messages": 1,
+            "pause_count": 0,
+            "queue_count": 4,
+            "queue_count_delayed": 5,
+            "queue_count_not_visible": 6,
+        },
+        {
+            "timestamp": old_ts,
+            "cycles": 3,
+            "total_messages": 7,
+            "failed_messages": 0,
+            "pause_count": 2,
+            "queue_count": 1,
+            "queue_count_delayed": 2,
+            "queue_count_not_visible": 3,
+        },
+    ]
+    for num, data in enumerate(worker_data):
+        with open(f"{healthcheck_path}.worker{num}", "w") as worker_file:
+            json.dump(data, worker_file)
+
+    command = Command()
+    command.healthcheck_path = healthcheck_path
+    command.write_supervisor_healthcheck(processes=3)
+
+    with open(healthcheck_path, "r", encoding="utf-8") as healthcheck_file:
+        content = json.load(healthcheck_file)
+    assert content == {
+        "timestamp": old_ts,
+        "cycles": 8,
+        "total_messages": 17,
+        "failed_messages": 1,
+        "pause_count": 2,
+        "queue_count": 4,
+        "queue_count_delayed": 5,
+        "queue_count_not_visible": 6,
+        "processes": 3,
+        "workers_reporting": 2,
+    }
+
+
 def test_command_sqs_client_error(mock_sqs_client, test_settings):
     """The command fails early on a client error."""
     mock_sqs_client.side_effect = make_client_error(code="InternalError")
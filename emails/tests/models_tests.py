@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta, timezone
 from hashlib import sha256
+from typing import Any
 import random
 from unittest import skip
 from unittest.mock import patch, Mock
@@ -7,6 +8,7 @@ from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import QuerySet
 from django.test import override_settings, TestCase
 
 from allauth.socialaccount.models import SocialAccount
@@ -1188,6 +1190,54 @@ class ProfileUpdateAbuseMetricTest(ProfileTestCase):
         assert self.abuse_metric.forwarded_email_size_per_day == 100
         assert self.profile.last_account_flagged == self.expected_now
 
+    def test_first_event_of_day_creates_one_metrics_row(self) -> None:
+        self.abuse_metric.first_recorded = self.expected_now - timedelta(days=1)
+        self.abuse_metric.save()
+        midnight = datetime.combine(
+            self.expected_now.date(), datetime.min.time(), timezone.utc
+        )
+
+        self.profile.update_abuse_metric(address_created=True)
+        self.profile.update_abuse_metric(email_forwarded=True, forwarded_email_size=10)
+
+        # The previous day is deleted by the delete_old_abuse_metrics command
+        assert AbuseMetrics.objects.filter(user=self.profile.user).count() == 2
+        today = AbuseMetrics.objects.get(
+            user=self.profile.user, first_recorded=midnight
+        )
+        assert today.num_address_created_per_day == 1
+        assert today.num_email_forwarded_per_day == 1
+        assert today.forwarded_email_size_per_day == 10
+        assert today.last_recorded == self.expected_now
+
+    def test_concurrent_first_event_of_day_adds_to_inserted_row(self) -> None:
+        midnight = datetime.combine(
+            self.expected_now.date(), datetime.min.time(), timezone.utc
+        )
+        AbuseMetrics.objects.filter(id=self.abuse_metric.id).update(
+            first_recorded=midnight, num_replies_per_day=1
+        )
+        update = QuerySet.update
+        num_updates = 0
+
+        def update_after_concurrent_insert(queryset: QuerySet, **kwargs: Any) -> int:
+            nonlocal num_updates
+            num_updates += 1
+            # The first update ran before the other event inserted the row
+            return 0 if num_updates == 1 else update(queryset, **kwargs)
+
+        with patch.object(QuerySet, "update", update_after_concurrent_insert):
+            metrics = AbuseMetrics.increment_for_day(
+                self.profile.user.id,
+                start=midnight,
+                now=self.expected_now,
+                increments={"num_replies_per_day": 1},
+            )
+
+        assert metrics.id == self.abuse_metric.id
+        assert metrics.num_replies_per_day == 2
+        assert AbuseMetrics.objects.filter(user=self.profile.user).count() == 1
+
 
 class ProfileMetricsEnabledTest(ProfileTestCase):
 
@@ -1,7 +1,11 @@
 """Tests for emails.policy"""
 
+from collections.abc import Callable
+from copy import deepcopy
 from email import message_from_string, errors
+from email.headerregistry import BaseHeader
 from typing_extensions import TypedDict
+import pickle
 
 import pytest
 
@@ -99,3 +103,35 @@ def test_compliant_header_parsing(email_id: str) -> None:
     email = message_from_string(email_in_text, policy=relay_policy)
     for header_name, value in email.items():
         assert len(value.defects) == 0
+
+
+def test_header_classes_reused_and_unstructured_lazy() -> None:
+    email_in_text = EMAIL_INCOMING["emperor_norton"]
+    email = message_from_string(email_in_text, policy=relay_policy)
+    from_header = email["From"]
+    assert type(email["From"]) is type(from_header)
+    assert "as_unstructured" not in vars(from_header)
+    assert str(from_header.as_unstructured) == (
+        "Norton I., Emperor of the United States <norton@sf.us.example.com>"
+    )
+    assert from_header.as_unstructured is from_header.as_unstructured
+
+
+@pytest.mark.parametrize(
+    "copy_header",
+    [deepcopy, lambda header: pickle.loads(pickle.dumps(header))],
+    ids=["deepcopy", "pickle"],
+)
+def test_header_copy_keeps_unstructured(
+    copy_header: Callable[[BaseHeader], BaseHeader],
+) -> None:
+    email_in_text = EMAIL_INCOMING["emperor_norton"]
+    email = message_from_string(email_in_text, policy=relay_policy)
+    from_header = email["From"]
+    copied = copy_header(from_header)
+    assert type(copied) is type(from_header)
+    assert str(copied) == str(from_header)
+    assert len(copied.defects) == len(from_header.defects)
+    assert str(getattr(copied, "as_unstructured")) == (
+        "Norton I., Emperor of the United States <norton@sf.us.example.com>"
+    )
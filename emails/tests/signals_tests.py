@@ -4,7 +4,11 @@ from unittest.mock import patch
 from django.test import TestCase
 
 from ..models import Profile
-from .models_tests import make_free_test_user
+from .models_tests import (
+    make_free_test_user,
+    make_premium_test_user,
+    phone_subscription,
+)
 
 
 class MeasureFeatureUsageSignalTest(TestCase):
@@ -72,3 +76,24 @@ class MeasureFeatureUsageSignalTest(TestCase):
     def test_profile_created_does_not_emit_metric_and_logs(self) -> None:
         self.mocked_incr.assert_not_called()
         self.mocked_events_info.assert_not_called()
+
+
+class ProfileEntitlementsSignalTest(TestCase):
+    """Test the entitlements are updated with the Mozilla account data"""
+
+    def test_saved_subscriptions_update_entitlements(self) -> None:
+        user = make_free_test_user()
+        fxa = user.profile.fxa
+        assert fxa
+        fxa.extra_data["subscriptions"] = [phone_subscription()]
+        fxa.save()
+        profile = Profile.objects.get(user=user)
+        assert profile.phone_entitlement
+        assert profile.has_phone
+
+    def test_deleted_account_clears_entitlements(self) -> None:
+        user = make_premium_test_user()
+        fxa = user.profile.fxa
+        assert fxa
+        fxa.delete()
+        assert not Profile.objects.get(user=user).premium_entitlement
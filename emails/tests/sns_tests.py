@@ -1,9 +1,17 @@
 from unittest.mock import patch
 
+from OpenSSL import crypto
+
 from django.core.exceptions import SuspiciousOperation
 from django.test import TestCase
 
-from ..sns import _grab_keyfile
+from ..sns import (
+    _cert_cache,
+    _get_certificate,
+    _grab_keyfile,
+    CERT_CACHE_MAX_SIZE,
+    CERT_CACHE_SECONDS,
+)
 
 
 class GrabKeyfileTest(TestCase):
@@ -15,3 +23,54 @@ class GrabKeyfileTest(TestCase):
         with self.assertRaises(SuspiciousOperation):
             cert_url = "https://attacker.com/cert.pem"
             _grab_keyfile(cert_url)
+
+
+class GetCertificateTest(TestCase):
+    cert_url = "https://sns.us-east-1.amazonaws.com/SimpleNotificationService-{}.pem"
+
+    def setUp(self):
+        _cert_cache.clear()
+        self.addCleanup(_cert_cache.clear)
+        grab_patcher = patch(
+            "emails.sns._grab_keyfile", side_effect=lambda url: f"PEM {url}"
+        )
+        self.mock_grab_keyfile = grab_patcher.start()
+        self.addCleanup(grab_patcher.stop)
+        load_patcher = patch(
+            "emails.sns.crypto.load_certificate",
+            side_effect=lambda filetype, pemfile: f"cert for {pemfile}",
+        )
+        self.mock_load_certificate = load_patcher.start()
+        self.addCleanup(load_patcher.stop)
+
+    def test_certificate_loaded_once(self):
+        url = self.cert_url.format(1)
+        cert = _get_certificate(url)
+        assert _get_certificate(url) is cert
+        self.mock_grab_keyfile.assert_called_once_with(url)
+        self.mock_load_certificate.assert_called_once_with(
+            crypto.FILETYPE_PEM, f"PEM {url}"
+        )
+
+    @patch("emails.sns.time.monotonic")
+    def test_certificate_reloaded_after_expiration(self, mock_monotonic):
+        url = self.cert_url.format(1)
+        mock_monotonic.return_value = 1000.0
+        _get_certificate(url)
+        mock_monotonic.return_value = 1000.0 + CERT_CACHE_SECONDS - 1
+        _get_certificate(url)
+        assert self.mock_load_certificate.call_count == 1
+        mock_monotonic.return_value = 1000.0 + CERT_CACHE_SECONDS
+        _get_certificate(url)
+        assert self.mock_load_certificate.call_count == 2
+
+    def test_least_recently_used_certificate_dropped(self):
+        urls = [self.cert_url.format(num) for num in range(CERT_CACHE_MAX_SIZE + 1)]
+        for url in urls[:-1]:
+            _get_certificate(url)
+        _get_certificate(urls[0])  # Now the most recently used
+        _get_certificate(urls[-1])  # Drops urls[1]
+        assert len(_cert_cache) == CERT_CACHE_MAX_SIZE
+        assert urls[0] in _cert_cache
+        assert urls[1] not in _cert_cache
+        assert self.mock_load_certificate.call_count == CERT_CACHE_MAX_SIZE + 1
@@ -1,18 +1,39 @@
 from base64 import b64encode
-from typing import Literal
+from email.message import EmailMessage
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Literal
 from urllib.parse import quote_plus
 from django.test import TestCase, override_settings
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 import json
+import random
+import re
 import pytest
 
+import emails.utils
+from emails.policy import relay_policy
 from emails.utils import (
+    email_size_bucket,
+    email_to_bytes,
+    analyze_trackers,
+    build_tracker_index,
     generate_from_header,
     get_domains_from_settings,
     get_email_domain_from_settings,
+    get_message_file_from_s3,
+    get_tracker_matcher,
+    parse_email_file,
     parse_email_header,
+    refresh_tracker_index,
     remove_trackers,
+    store_tracker_index,
     InvalidFromHeader,
+    TrackerIndex,
+    TrackerMatcher,
+    EMAIL_CHUNK_BYTES,
+    EMAIL_SPOOL_MAX_BYTES,
+    TRACKER_INDEX_FILE_NAME,
 )
 from .models_tests import make_free_test_user, make_premium_test_user  # noqa: F401
 
@@ -385,3 +406,361 @@ class RemoveTrackers(TestCase):
         assert changed_content == content
         assert general_removed == 0
         assert general_count == 0
+        assert tracker_details["level_two"] == {
+            "count": 2,
+            "trackers": {"strict.tracker.com": 2},
+        }
+
+
+def _legacy_tracker_pattern(domain: str) -> str:
+    """
+    The per-domain pattern used before TrackerMatcher.
+
+    It repeated the subdomain group before the domain, which takes exponential time
+    on long links with mixed quotes. An optional group tries the same positions in
+    the same order.
+    """
+    return r"""(["'])(\S*://(\S*\.)?""" + re.escape(domain) + r"\S*)\1"
+
+
+def _legacy_count_tracker(html_content: str, trackers: list[str]) -> dict[str, Any]:
+    """Count trackers one domain at a time, as before TrackerMatcher."""
+    tracker_total = 0
+    details = {}
+    for tracker in trackers:
+        pattern = _legacy_tracker_pattern(tracker)
+        html_content, count = re.subn(pattern, "", html_content)
+        if count:
+            tracker_total += count
+            details[tracker] = count
+    return {"count": tracker_total, "trackers": details}
+
+
+def _legacy_replace_trackers(
+    html_content: str, trackers: list[str], convert_link: Callable[[str], str]
+) -> tuple[str, int]:
+    """Replace trackers one domain at a time, as before TrackerMatcher."""
+    total = 0
+
+    def replace_link(match: re.Match[str]) -> str:
+        return f"{match[1]}{convert_link(match[2])}{match[1]}"
+
+    for tracker in trackers:
+        html_content, count = re.subn(
+            _legacy_tracker_pattern(tracker), replace_link, html_content
+        )
+        total += count
+    return html_content, total
+
+
+_EQUIVALENCE_TRACKERS = [
+    "trckr.com",
+    "open.tracker.com",
+    "tracker.com",
+    "click.mail.example.net",
+    "example.net",
+    "t.co",
+    "pixel.ads.example.org",
+    "ads.example.org",
+    "list-manage.com",
+]
+
+
+def _random_tracker_html(rng: random.Random, mixed_quotes: bool = False) -> str:
+    """
+    Generate HTML with a mix of tracker, lookalike, and plain links.
+
+    If mixed_quotes is True, some links are nested in or run into links with the
+    other quote type.
+    """
+    hosts = _EQUIVALENCE_TRACKERS + [
+        "fooopen.tracker.com",
+        "nottrckr.com",
+        "example.com",
+        "mail.example.net.evil.com",
+        "us1.list-manage.com",
+        "foo.open.tracker.com",
+        "a.b.pixel.ads.example.org",
+    ]
+    parts = []
+    for _ in range(rng.randint(1, 30)):
+        quote = rng.choice(['"', "'"])
+        host = rng.choice(hosts)
+        path = rng.choice(["", "/", "/foo/bar.html", "/p.gif?u=1"])
+        if rng.random() < 0.3:
+            path += f"?src={rng.choice(hosts)}"
+        if rng.random() < 0.2:
+            path += f"&next=https://{rng.choice(hosts)}/x"
+        scheme = rng.choice(["https://", "http://", "//", "mailto:"])
+        url = f"{scheme}{host}{path}"
+        tag = rng.choice(
+            [
+                f"<a href={quote}{url}{quote}>{rng.choice(hosts)}</a>",
+                f"<img src={quote}{url}{quote}/>",
+                f"<a href={quote}{url}{quote}><img src={quote}{url}{quote}></a>",
+                f"<p>Visit {url} today</p>",
+            ]
+        )
+        if mixed_quotes and rng.random() < 0.5:
+            other = "'" if quote == '"' else '"'
+            url2 = f"https://{rng.choice(hosts)}{path}"
+            tag = rng.choice(
+                [
+                    f"x{quote}{url}{other}{url2}{quote}",
+                    f"<a href={quote}{url}{other}{url2}{other}{quote}>",
+                    f"<a href={quote}{url}{other}>{url2}{quote}",
+                    f"{quote}{url}{other}{quote}{url2}{other}",
+                ]
+            )
+        parts.append(tag)
+    return rng.choice(["\n", " ", ""]).join(parts)
+
+
+def _assert_tracker_matcher_equivalent_to_legacy(
+    html: str, trackers: list[str]
+) -> None:
+    matcher = TrackerMatcher(trackers)
+
+    def convert_link(link: str) -> str:
+        return "https://test.com/contains-tracker-warning/#" + quote_plus(
+            json.dumps({"original_link": link}, separators=(",", ":"))
+        )
+
+    expected_count = _legacy_count_tracker(html, trackers)
+    count = matcher.count(html)
+    assert count == expected_count
+    assert list(count["trackers"]) == list(expected_count["trackers"])
+    assert matcher.replace(html, convert_link) == _legacy_replace_trackers(
+        html, trackers, convert_link
+    )
+
+
+@pytest.mark.parametrize("mixed_quotes", [False, True])
+@pytest.mark.parametrize("seed", range(50))
+def test_tracker_matcher_equivalent_to_legacy(seed: int, mixed_quotes: bool) -> None:
+    """TrackerMatcher gives the same results as checking one domain at a time."""
+    rng = random.Random(seed)
+    trackers = _EQUIVALENCE_TRACKERS.copy()
+    rng.shuffle(trackers)
+    html = _random_tracker_html(rng, mixed_quotes=mixed_quotes)
+    _assert_tracker_matcher_equivalent_to_legacy(html, trackers)
+
+
+def test_tracker_matcher_overlapping_links_in_list_order() -> None:
+    """Where links with different quotes overlap, the earlier tracker wins."""
+    html = """"://t.co'"://pixel.ads.example.org'"""
+    trackers = _EQUIVALENCE_TRACKERS.copy()
+    trackers.remove("pixel.ads.example.org")
+    trackers.insert(0, "pixel.ads.example.org")
+    assert TrackerMatcher(trackers).count(html) == {
+        "count": 1,
+        "trackers": {"pixel.ads.example.org": 1},
+    }
+    _assert_tracker_matcher_equivalent_to_legacy(html, trackers)
+
+
+def test_tracker_matcher_repeated_tracker() -> None:
+    """A tracker listed twice is checked twice, like checking each list entry."""
+    html = """<a href='https://open.tracker.com/x'>"""
+    _assert_tracker_matcher_equivalent_to_legacy(
+        html, ["tracker.com", "open.tracker.com", "tracker.com"]
+    )
+
+
+@pytest.mark.parametrize("level", ["general", "strict"])
+@pytest.mark.parametrize("seed", range(20))
+def test_analyze_trackers_equivalent_to_separate_scans(seed: int, level: str) -> None:
+    """analyze_trackers gives the same results as scanning for each level."""
+    rng = random.Random(seed)
+    trackers = _EQUIVALENCE_TRACKERS.copy()
+    rng.shuffle(trackers)
+    general, strict = trackers[::2], trackers[1::2]
+    html = _random_tracker_html(rng, mixed_quotes=True)
+
+    def convert_link(link: str) -> str:
+        return "https://test.com/contains-tracker-warning/#" + quote_plus(link)
+
+    with (
+        patch("emails.utils.general_trackers", return_value=general),
+        patch("emails.utils.strict_trackers", return_value=strict),
+    ):
+        content, details = analyze_trackers(html, convert_link, level)
+        counted_content, counted_details = analyze_trackers(html)
+    expected_content, expected_removed = TrackerMatcher(
+        general if level == "general" else strict
+    ).replace(html, convert_link)
+    assert content == expected_content
+    assert details == {
+        "tracker_removed": expected_removed,
+        "level_one": TrackerMatcher(general).count(html),
+        "level_two": TrackerMatcher(strict).count(html),
+    }
+    assert counted_content == html
+    assert counted_details == details | {"tracker_removed": 0}
+
+
+@pytest.mark.parametrize("convert", [True, False])
+def test_analyze_trackers_link_nested_in_other_quotes(convert: bool) -> None:
+    """A general tracker inside a strict tracker link with other quotes is found."""
+    html = """x'http://strict.com/"http://general.com/'"""
+
+    def convert_link(link: str) -> str:
+        return "https://test.com/contains-tracker-warning/#" + quote_plus(link)
+
+    with (
+        patch("emails.utils.general_trackers", return_value=["general.com"]),
+        patch("emails.utils.strict_trackers", return_value=["strict.com"]),
+    ):
+        content, details = analyze_trackers(html, convert_link if convert else None)
+    assert details["level_one"] == {"count": 1, "trackers": {"general.com": 1}}
+    if convert:
+        assert details["tracker_removed"] == 1
+        assert (
+            content
+            == "x'" + convert_link("""http://strict.com/"http://general.com/""") + "'"
+        )
+    else:
+        assert content == html
+
+
+def test_tracker_matcher_empty_list() -> None:
+    matcher = TrackerMatcher([])
+    html = '<a href="https://open.tracker.com/foo">A link</a>'
+    assert matcher.count(html) == {"count": 0, "trackers": {}}
+    assert matcher.replace(html, lambda link: "replaced") == (html, 0)
+
+
+def test_tracker_index_artifact_loaded_and_refreshed(tmp_path: Path) -> None:
+    """The tracker index is loaded from the artifact, and replaced when it changes."""
+    html = (
+        '<a href="https://open.tracker.com/foo">A link</a>'
+        '<img src="https://strict.tracker.com/foo.jpg">'
+    )
+    index = build_tracker_index(["open.tracker.com"], ["strict.tracker.com"])
+    store_tracker_index(index, tmp_path)
+    assert [path.name for path in tmp_path.iterdir()] == [TRACKER_INDEX_FILE_NAME]
+
+    with (
+        patch("emails.utils._tracker_index", None),
+        patch("emails.utils.get_trackers") as mock_get_trackers,
+    ):
+        assert refresh_tracker_index(tmp_path) == index["version"]
+        assert refresh_tracker_index(tmp_path) is None
+        _, details = analyze_trackers(html)
+        assert details["level_one"]["trackers"] == {"open.tracker.com": 1}
+        assert details["level_two"]["trackers"] == {"strict.tracker.com": 1}
+
+        # The same lists do not replace the index
+        store_tracker_index(
+            build_tracker_index(["open.tracker.com"], ["strict.tracker.com"]),
+            tmp_path,
+        )
+        assert refresh_tracker_index(tmp_path) is None
+
+        new_index = build_tracker_index(["strict.tracker.com"], ["open.tracker.com"])
+        assert new_index["version"] != index["version"]
+        store_tracker_index(new_index, tmp_path)
+        assert refresh_tracker_index(tmp_path) == new_index["version"]
+        _, details = analyze_trackers(html)
+        assert details["level_one"]["trackers"] == {"strict.tracker.com": 1}
+        assert details["level_two"]["trackers"] == {"open.tracker.com": 1}
+    mock_get_trackers.assert_not_called()
+
+
+def test_tracker_index_matchers_used_for_index_lists() -> None:
+    """The matchers of the current index are found without building or hashing."""
+    index = TrackerIndex(["open.tracker.com"], ["strict.tracker.com"])
+    html = '<a href="https://open.tracker.com/foo">A link</a>'
+    with (
+        patch("emails.utils._tracker_index", index),
+        patch("emails.utils._build_tracker_matcher") as mock_build,
+    ):
+        assert (
+            get_tracker_matcher(index.level_one) is index.matchers[id(index.level_one)]
+        )
+        _, details = analyze_trackers(html)
+    mock_build.assert_not_called()
+    assert details["level_one"]["trackers"] == {"open.tracker.com": 1}
+
+    # An equal list that is not the index's list is cached by value
+    other_list = list(index.level_one)
+    assert get_tracker_matcher(other_list) is get_tracker_matcher(list(other_list))
+
+
+def test_tracker_index_artifact_unknown_format(tmp_path: Path) -> None:
+    """An index with an unknown format is not loaded."""
+    index = build_tracker_index(["open.tracker.com"], ["strict.tracker.com"])
+    store_tracker_index(index | {"format": 999}, tmp_path)
+    current_index = Mock(spec_set=["mtime_ns", "version"], mtime_ns=0, version="v1")
+    with patch("emails.utils._tracker_index", current_index):
+        assert refresh_tracker_index(tmp_path) is None
+        assert emails.utils._tracker_index is current_index
+
+
+@pytest.mark.parametrize("size", [100, EMAIL_SPOOL_MAX_BYTES + 1])
+def test_get_message_file_from_s3_spools_in_chunks(size: int) -> None:
+    """The email is copied in chunks, and large emails are moved to disk."""
+    content = b"x" * size
+    body = Mock(spec_set=["iter_chunks"])
+    body.iter_chunks.return_value = [
+        content[pos : pos + EMAIL_CHUNK_BYTES]
+        for pos in range(0, size, EMAIL_CHUNK_BYTES)
+    ]
+    client = Mock(spec_set=["get_object"])
+    client.get_object.return_value = {"Body": body}
+    with patch("emails.utils.s3_client", return_value=client):
+        email_file = get_message_file_from_s3("bucket", "key")
+    with email_file:
+        body.iter_chunks.assert_called_once_with(EMAIL_CHUNK_BYTES)
+        assert email_file.read() == content
+        assert email_file._rolled == (size > EMAIL_SPOOL_MAX_BYTES)
+
+
+def test_parse_email_file() -> None:
+    """An email parsed from a file in chunks matches parsing the bytes."""
+    email = EmailMessage()
+    email["Subject"] = "Large email"
+    email.set_content("A line of text 👍\n" * EMAIL_CHUNK_BYTES)
+    email_bytes = email.as_bytes()
+    assert len(email_bytes) > 2 * EMAIL_CHUNK_BYTES
+
+    parsed = parse_email_file(BytesIO(email_bytes))
+    assert parsed["Subject"] == "Large email"
+    assert parsed.get_content() == email.get_content()
+    assert parsed.as_bytes() == email_bytes
+
+
+def test_email_to_bytes_matches_bytes_generator() -> None:
+    """Attachments are written in one step, with the same output as as_bytes()."""
+    email = EmailMessage()
+    email["Subject"] = "With an attachment"
+    email.set_content("Text with UTF-8 👍\n")
+    email.add_attachment(
+        bytes(range(256)) * 1000,
+        maintype="application",
+        subtype="octet-stream",
+        filename="data.bin",
+    )
+    email_bytes = email.as_bytes().replace(b"\n", b"\r\n")
+    parsed = parse_email_file(BytesIO(email_bytes))
+
+    output = email_to_bytes(parsed)
+    assert output == parsed.as_bytes(policy=relay_policy.clone(cte_type="7bit"))
+    assert b"\r\n" not in output
+    assert "👍".encode() not in output  # UTF-8 text is re-encoded for 7bit
+
+
+@pytest.mark.parametrize(
+    "email_size,bucket",
+    [
+        (None, "unknown"),
+        (0, "under_10kb"),
+        (9_999, "under_10kb"),
+        (10_000, "10kb_100kb"),
+        (999_999, "100kb_1mb"),
+        (1_000_000, "1mb_10mb"),
+        (10_000_000, "over_10mb"),
+    ],
+)
+def test_email_size_bucket(email_size: int | None, bucket: str) -> None:
+    assert email_size_bucket(email_size) == bucket
@@ -1,8 +1,10 @@
 from base64 import b64decode
+from contextlib import nullcontext
 from copy import deepcopy
 from datetime import datetime, timedelta, timezone
 from email import message_from_string
 from email.message import EmailMessage
+from io import BytesIO
 from typing import cast
 from unittest.mock import patch, Mock
 from uuid import uuid4
@@ -10,11 +12,15 @@ import glob
 import json
 import os
 import re
+import time
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, connection, transaction
 from django.http import HttpResponse
 from django.test import override_settings, Client, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 
 from allauth.socialaccount.models import SocialAccount
 from botocore.exceptions import ClientError
@@ -24,6 +30,14 @@ from model_bakery import baker
 import pytest
 
 from privaterelay.ftl_bundles import main
+from emails import message_context
+from emails.address_cache import AddressSnapshot, set_snapshot
+from emails.address_filter import (
+    build_address_filter,
+    LoadedFilter,
+    store_address_filter,
+)
+from emails.counters import flush_counters
 from emails.models import (
     DeletedAddress,
     DomainAddress,
@@ -46,6 +60,7 @@ from emails.views import (
     ReplyHeadersNotFound,
     _build_reply_requires_premium_email,
     _get_address,
+    _get_address_snapshot,
     _get_keys_from_headers,
     _record_receipt_verdicts,
     _replace_headers,
@@ -117,9 +132,9 @@ SEND_RAW_EMAIL_FAILED = ClientError(
 
 def create_email_from_notification(
     notification: AWS_SNSMessageJSON, text: str
-) -> bytes:
+) -> BytesIO:
     """
-    Create an email from an SNS notification, return the serialized bytes.
+    Create an email from an SNS notification, return it serialized in a binary file.
 
     The email will have the headers from the notification and the `text` value as the
     plain text body.
@@ -136,7 +151,7 @@ def create_email_from_notification(
         email[entry["name"]] = entry["value"]
     assert email["Content-Type"].startswith("multipart/alternative")
     email.add_alternative(text, subtype="plain")
-    return email.as_bytes()
+    return BytesIO(email.as_bytes())
 
 
 def create_notification_from_email(email_text: str) -> AWS_SNSMessageJSON:
@@ -332,7 +347,9 @@ class SNSNotificationTest(TestCase):
         source = self.mock_send_raw_email.call_args[1]["Source"]
         destinations = self.mock_send_raw_email.call_args[1]["Destinations"]
         assert len(destinations) == 1
-        raw_message = self.mock_send_raw_email.call_args[1]["RawMessage"]["Data"]
+        raw_message = self.mock_send_raw_email.call_args[1]["RawMessage"][
+            "Data"
+        ].decode()
         headers: dict[str, str] = {}
         last_key = None
         for line in raw_message.splitlines():
@@ -372,6 +389,7 @@ class SNSNotificationTest(TestCase):
         }
         assert_email_equals(email, "single_recipient")
 
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at is not None
@@ -382,6 +400,20 @@ class SNSNotificationTest(TestCase):
             self.ra.user.profile.last_engagement > pre_sns_notification_last_engagement
         )
 
+    def test_reply_record_kept_when_deferred_writes_fail(self) -> None:
+        """The Reply record for a sent email is stored before the deferred writes."""
+        with (
+            patch.object(
+                Profile, "update_abuse_metric", side_effect=DatabaseError("down")
+            ),
+            self.assertLogs("events", "ERROR") as logs,
+        ):
+            response = _sns_notification(EMAIL_SNS_BODIES["single_recipient"])
+        assert response.status_code == 200
+        self.mock_send_raw_email.assert_called_once()
+        assert Reply.objects.filter(relay_address=self.ra).count() == 1
+        assert any("message_context_writes_failed" in line for line in logs.output)
+
     def test_single_french_recipient_sns_notification(self) -> None:
         """
         The email content can contain non-ASCII characters.
@@ -412,6 +444,7 @@ class SNSNotificationTest(TestCase):
         assert 'Content-Type: text/html; charset="utf-8"' in email
         assert "Content-Transfer-Encoding: quoted-printable" in email
 
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at is not None
@@ -435,6 +468,7 @@ class SNSNotificationTest(TestCase):
         }
         assert_email_equals(email, "single_recipient_list")
 
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at is not None
@@ -450,6 +484,7 @@ class SNSNotificationTest(TestCase):
         _sns_notification(EMAIL_SNS_BODIES["single_recipient_list"])
 
         self.mock_send_raw_email.assert_not_called()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 0
         assert self.ra.num_blocked == 1
@@ -471,6 +506,7 @@ class SNSNotificationTest(TestCase):
         _sns_notification(EMAIL_SNS_BODIES["single_recipient_list"])
 
         self.mock_send_raw_email.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.num_blocked == 0
@@ -481,6 +517,7 @@ class SNSNotificationTest(TestCase):
         _sns_notification(EMAIL_SNS_BODIES["spamVerdict_FAIL"])
 
         self.mock_send_raw_email.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
 
@@ -492,6 +529,7 @@ class SNSNotificationTest(TestCase):
         _sns_notification(EMAIL_SNS_BODIES["spamVerdict_FAIL"])
 
         self.mock_send_raw_email.assert_not_called()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 0
 
@@ -514,6 +552,7 @@ class SNSNotificationTest(TestCase):
         }
         assert_email_equals(email, "domain_recipient")
 
+        flush_counters()
         da = DomainAddress.objects.get(user=self.premium_user, address="wildcard")
         assert da.num_forwarded == 1
         assert da.last_used_at
@@ -524,6 +563,7 @@ class SNSNotificationTest(TestCase):
 
         self.mock_send_raw_email.assert_called_once()
         self.mock_remove_message_from_s3.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at is not None
@@ -536,11 +576,12 @@ class SNSNotificationTest(TestCase):
 
         self.mock_send_raw_email.assert_called_once()
         self.mock_remove_message_from_s3.assert_not_called()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 0
         assert self.ra.last_used_at is None
 
-    @patch("emails.views.get_message_content_from_s3")
+    @patch("emails.views.get_message_file_from_s3")
     def reply_test_implementation(
         self, mock_get_content: Mock, text: str, expected_fixture_name: str
     ) -> str:
@@ -596,6 +637,7 @@ class SNSNotificationTest(TestCase):
         }
         assert_email_equals(email, expected_fixture_name)
 
+        flush_counters()
         relay_address.refresh_from_db()
         assert relay_address.num_replied == 1
         last_used_at = relay_address.last_used_at
@@ -619,6 +661,85 @@ class SNSNotificationTest(TestCase):
         assert 'Content-Type: text/plain; charset="utf-8"' in email
         assert "Content-Transfer-Encoding: base64" in email
 
+    def make_reply_record(self, address: RelayAddress, message_id: str) -> None:
+        lookup_key, encryption_key = derive_reply_keys(get_message_id_bytes(message_id))
+        metadata = {"message-id": str(uuid4()), "from": "sender@external.example.com"}
+        Reply.objects.create(
+            lookup=b64_lookup_key(lookup_key),
+            encrypted_metadata=encrypt_reply_metadata(encryption_key, metadata),
+            relay_address=address,
+        )
+
+    def count_notification_queries(
+        self, notification: dict[str, str], use_context: bool
+    ) -> int:
+        """
+        Count the queries to process a notification, with or without a message
+        context, and roll back its writes.
+        """
+        cache.clear()
+        context = message_context.message_context if use_context else nullcontext
+        with (
+            patch("emails.views.message_context.message_context", context),
+            transaction.atomic(),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = _sns_notification(notification)
+            assert response.status_code == 200
+            transaction.set_rollback(True)
+        return len(queries)
+
+    @patch("emails.views.get_message_file_from_s3")
+    def test_reply_query_count(self, mock_get_content: Mock) -> None:
+        """A reply loads the Reply record and its owner once."""
+        user = baker.make(User, email="source@sender.com")
+        upgrade_test_user_to_premium(user)
+        relay_address = baker.make(RelayAddress, user=user, address="a1b2c3d4")
+        self.make_reply_record(
+            relay_address, "CA+J4FJFw0TXCr63y9dGcauvCGaZ7pXxspzOjEDhRpg5Zh4ziWg"
+        )
+        mock_get_content.side_effect = lambda *args: create_email_from_notification(
+            EMAIL_SNS_BODIES["s3_stored_replies"], text="this is a text reply"
+        )
+        notification = EMAIL_SNS_BODIES["s3_stored_replies"]
+
+        # Look up replies@ as an address, load the Reply with the owner's profile,
+        # then the writes: num_replied, the abuse metrics update and read, and
+        # last_engagement. The context runs the writes in a savepoint, which adds
+        # two queries. Before the message context and the address snapshots, this
+        # took 14 queries.
+        assert (
+            self.count_notification_queries(notification, use_context=False),
+            self.count_notification_queries(notification, use_context=True),
+        ) == (7, 9)
+
+    def test_reply_from_external_sender_query_count(self) -> None:
+        """The References of a reply to a Relay user are found in one query."""
+        self.ra.user = self.premium_user
+        self.ra.save()
+        self.make_reply_record(self.ra, "<known@example.com>")
+        notification = deepcopy(EMAIL_SNS_BODIES["single_recipient"])
+        message = json.loads(notification["Message"])
+        message["mail"]["headers"].append(
+            {
+                "name": "References",
+                "value": "<a@example.com> <b@example.com> <known@example.com>",
+            }
+        )
+        notification["Message"] = json.dumps(message)
+
+        # Look up the address and owner, the Reply, the waffle flags, then the
+        # writes: the new Reply, the profile, and the abuse metrics for a new day,
+        # which are inserted in a savepoint after the update finds no row. The
+        # context loads the address once, and runs the deferred abuse metrics
+        # writes in a savepoint, which adds two queries. Before the message context and the one query
+        # for the References, this took 23 queries.
+        assert (
+            self.count_notification_queries(notification, use_context=False),
+            self.count_notification_queries(notification, use_context=True),
+        ) == (15, 16)
+        assert self.mock_send_raw_email.call_count == 2
+
     @patch("emails.views.generate_from_header", side_effect=InvalidFromHeader())
     @patch("emails.views.info_logger")
     def test_invalid_from_header(self, mock_logger, mock_generate_from_header) -> None:
@@ -639,6 +760,7 @@ class SNSNotificationTest(TestCase):
 
         self.mock_send_raw_email.assert_not_called()
         self.mock_remove_message_from_s3.assert_not_called()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 0
         assert self.ra.last_used_at is None
@@ -666,6 +788,7 @@ class SNSNotificationTest(TestCase):
         assert content_id in email  # Issue 691
 
         self.mock_remove_message_from_s3.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at
@@ -716,6 +839,7 @@ class SNSNotificationTest(TestCase):
         assert_email_equals(email, "russian_spam")
 
         self.mock_remove_message_from_s3.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at
@@ -744,6 +868,7 @@ class SNSNotificationTest(TestCase):
         assert_email_equals(email, "plain_text", replace_mime_boundaries=True)
 
         self.mock_remove_message_from_s3.assert_called_once()
+        flush_counters()
         self.ra.refresh_from_db()
         assert self.ra.num_forwarded == 1
         assert self.ra.last_used_at
@@ -1248,6 +1373,7 @@ class SNSNotificationValidUserEmailsInS3Test(TestCase):
         self.mock_remove_message_from_s3.assert_called_once_with(self.bucket, self.key)
         assert response.status_code == 200
         assert response.content == b"Address is temporarily disabled."
+        flush_counters()
         profile.refresh_from_db()
         assert profile.last_engagement > pre_blocked_email_last_engagement
 
@@ -1268,10 +1394,11 @@ class SNSNotificationValidUserEmailsInS3Test(TestCase):
         self.mock_remove_message_from_s3.assert_called_once_with(self.bucket, self.key)
         assert response.status_code == 200
         assert response.content == b"Address is not accepting list emails."
+        flush_counters()
         profile.refresh_from_db()
         assert profile.last_engagement > pre_blocked_email_last_engagement
 
-    @patch("emails.views.get_message_content_from_s3")
+    @patch("emails.views.get_message_file_from_s3")
     def test_get_text_html_s3_client_error_email_in_s3_not_deleted(
         self, mocked_get_content: Mock
     ) -> None:
@@ -1285,7 +1412,7 @@ class SNSNotificationValidUserEmailsInS3Test(TestCase):
         assert response.content == b"Cannot fetch the message content from S3"
 
     @patch("emails.apps.EmailsConfig.ses_client", spec_set=["send_raw_email"])
-    @patch("emails.views.get_message_content_from_s3")
+    @patch("emails.views.get_message_file_from_s3")
     def test_ses_client_error_email_in_s3_not_deleted(
         self, mocked_get_content: Mock, mocked_ses_client: Mock
     ) -> None:
@@ -1300,7 +1427,7 @@ class SNSNotificationValidUserEmailsInS3Test(TestCase):
         assert response.content == b"SES client error on Raw Email"
 
     @patch("emails.apps.EmailsConfig.ses_client", spec_set=["send_raw_email"])
-    @patch("emails.views.get_message_content_from_s3")
+    @patch("emails.views.get_message_file_from_s3")
     def test_successful_email_in_s3_deleted(
         self, mocked_get_content: Mock, mocked_ses_client: Mock
     ) -> None:
@@ -1316,7 +1443,7 @@ class SNSNotificationValidUserEmailsInS3Test(TestCase):
 
     @override_settings(STATSD_ENABLED=True)
     @patch("emails.apps.EmailsConfig.ses_client", spec_set=["send_raw_email"])
-    @patch("emails.views.get_message_content_from_s3")
+    @patch("emails.views.get_message_file_from_s3")
     def test_dmarc_failure_s3_deleted(
         self, mocked_get_content: Mock, mocked_ses_client: Mock
     ) -> None:
@@ -1347,7 +1474,7 @@ class SnsMessageTest(TestCase):
         baker.make(RelayAddress, user=user, address="sender", domain=2)
 
         get_content_patcher = patch(
-            "emails.views.get_message_content_from_s3",
+            "emails.views.get_message_file_from_s3",
             return_value=create_email_from_notification(
                 EMAIL_SNS_BODIES["s3_stored"], "text"
             ),
@@ -1419,6 +1546,22 @@ class GetAddressTest(TestCase):
             _get_address("deleted456@test.com")
         mm.assert_incr_once("fx.private.relay.email_for_deleted_address_multiple")
 
+    def test_address_not_in_filter_raises_without_queries(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        loaded_filter_patcher = patch("emails.address_filter._loaded", LoadedFilter())
+        loaded_filter_patcher.start()
+        self.addCleanup(loaded_filter_patcher.stop)
+        store_address_filter(build_address_filter(), time.time())
+        assert _get_address("relay123@test.com") == self.relay_address
+        with (
+            pytest.raises(RelayAddress.DoesNotExist),
+            MetricsMock() as mm,
+            self.assertNumQueries(0),
+        ):
+            _get_address("deleted456@test.com")
+        mm.assert_incr_once("fx.private.relay.email_for_address_not_in_filter")
+
     def test_existing_domain_address(self):
         assert _get_address("domain@subdomain.test.com") == self.domain_address
 
@@ -1475,6 +1618,130 @@ class GetAddressTest(TestCase):
         assert DomainAddress.objects.filter(user=self.user).count() == 2
 
 
+@override_settings(SITE_ORIGIN="https://test.com", ADDRESS_CACHE_SECONDS=300)
+class GetAddressSnapshotTest(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = make_free_test_user("free@example.com")
+        self.profile = self.user.profile
+        self.relay_address = baker.make(
+            RelayAddress, user=self.user, address="relay123"
+        )
+        self.premium_user = make_premium_test_user()
+        self.premium_user.profile.subdomain = "subdomain"
+        self.premium_user.profile.save()
+        self.domain_address = baker.make(
+            DomainAddress, user=self.premium_user, address="domain"
+        )
+        # Forget the markers of the new users, as if they were created earlier
+        cache.clear()
+
+    def test_relay_address_is_cached(self):
+        snapshot = _get_address_snapshot("relay123@test.com")
+        assert snapshot.address.id == self.relay_address.id
+        assert not snapshot.address.is_domain_address
+        assert snapshot.address.enabled
+        assert snapshot.owner.email == "free@example.com"
+        assert snapshot.owner.language == "en"
+        assert not snapshot.owner.has_premium
+        with self.assertNumQueries(0):
+            assert _get_address_snapshot("Relay123@Test.Com") == snapshot
+
+    def test_domain_address_is_cached(self):
+        snapshot = _get_address_snapshot("domain@subdomain.test.com")
+        assert snapshot.address.id == self.domain_address.id
+        assert snapshot.address.is_domain_address
+        assert snapshot.owner.has_premium
+        assert snapshot.owner.subdomain == "subdomain"
+        with self.assertNumQueries(0):
+            assert _get_address_snapshot("Domain@SubDomain.test.com") == snapshot
+
+    def test_counters_update_keeps_cache(self):
+        snapshot = _get_address_snapshot("relay123@test.com")
+        self.relay_address.num_forwarded += 1
+        self.relay_address.last_used_at = datetime.now(timezone.utc)
+        self.relay_address.save(
+            update_fields=["num_forwarded", "last_used_at", "block_list_emails"]
+        )
+        self.profile.refresh_from_db()
+        self.profile.last_engagement = datetime.now(timezone.utc)
+        self.profile.save()
+        with self.assertNumQueries(0):
+            assert _get_address_snapshot("relay123@test.com") == snapshot
+
+    def test_disabled_address_is_forgotten(self):
+        assert _get_address_snapshot("relay123@test.com").address.enabled
+        self.relay_address.enabled = False
+        self.relay_address.save()
+        assert not _get_address_snapshot("relay123@test.com").address.enabled
+
+    def test_snapshot_loaded_before_change_is_not_cached(self):
+        """A snapshot loaded before a change is committed is not cached after it."""
+        stale_snapshot = AddressSnapshot.from_address(self.relay_address)
+        self.relay_address.enabled = False
+        self.relay_address.save()
+        set_snapshot("relay123", "test.com", stale_snapshot)
+        assert not _get_address_snapshot("relay123@test.com").address.enabled
+
+        self.user.email = "new@example.com"
+        self.user.save()
+        set_snapshot("relay123", "test.com", stale_snapshot)
+        assert _get_address_snapshot("relay123@test.com").owner.email == (
+            "new@example.com"
+        )
+
+    def test_deleted_address_is_forgotten(self):
+        _get_address_snapshot("relay123@test.com")
+        _get_address_snapshot("domain@subdomain.test.com")
+        self.relay_address.delete()
+        self.domain_address.delete()
+        with pytest.raises(RelayAddress.DoesNotExist):
+            _get_address_snapshot("relay123@test.com")
+        new_address = _get_address_snapshot("domain@subdomain.test.com").address
+        assert new_address.id != self.domain_address.id
+
+    def test_flagged_profile_is_forgotten(self):
+        assert not _get_address_snapshot("relay123@test.com").owner.is_flagged
+        self.profile.refresh_from_db()
+        self.profile.last_account_flagged = datetime.now(timezone.utc)
+        self.profile.save()
+        assert _get_address_snapshot("relay123@test.com").owner.is_flagged
+
+    def test_changed_user_email_is_forgotten(self):
+        _get_address_snapshot("relay123@test.com")
+        self.user.email = "new@example.com"
+        self.user.save()
+        owner = _get_address_snapshot("relay123@test.com").owner
+        assert owner.email == "new@example.com"
+
+    def test_mozilla_account_update_is_forgotten(self):
+        snapshot = _get_address_snapshot("relay123@test.com")
+        assert not snapshot.owner.has_premium
+        fxa = SocialAccount.objects.get(user=self.user, provider="fxa")
+        fxa.extra_data["subscriptions"] = ["premium-relay"]
+        fxa.extra_data["locale"] = "de"
+        fxa.save()
+        owner = _get_address_snapshot("relay123@test.com").owner
+        assert owner.has_premium
+        assert owner.language == "de"
+
+    def test_expired_bounce_is_cleared(self):
+        self.profile.refresh_from_db()
+        self.profile.last_soft_bounce = datetime.now(timezone.utc) - timedelta(days=2)
+        self.profile.save()
+        owner = _get_address_snapshot("relay123@test.com").owner
+        assert owner.check_bounce_pause() == (False, "")
+        self.profile.refresh_from_db()
+        assert self.profile.last_soft_bounce is None
+        assert _get_address_snapshot("relay123@test.com").owner.last_soft_bounce is None
+
+    @override_settings(ADDRESS_CACHE_SECONDS=0)
+    def test_cache_disabled(self):
+        _get_address_snapshot("relay123@test.com")
+        with self.assertNumQueries(4):
+            _get_address_snapshot("relay123@test.com")
+
+
 TEST_AWS_SNS_TOPIC = "arn:aws:sns:us-east-1:111222333:relay"
 TEST_AWS_SNS_TOPIC2 = TEST_AWS_SNS_TOPIC + "-alt"
 
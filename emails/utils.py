@@ -1,15 +1,29 @@
 from __future__ import annotations
 import base64
 import contextlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from email.errors import InvalidHeaderDefect
+from email.feedparser import BytesFeedParser
+from email.generator import BytesGenerator
 from email.headerregistry import Address, AddressHeader
-from email.message import EmailMessage
-from email.utils import formataddr, parseaddr
-from functools import cache
-from typing import cast, Any, Callable, TypeVar
+from email.message import EmailMessage, Message
+from email.utils import (  # type: ignore[attr-defined]
+    _has_surrogates,
+    formataddr,
+    parseaddr,
+)
+from functools import lru_cache
+from io import BytesIO
+from hashlib import sha256
+from tempfile import SpooledTemporaryFile
+from typing import cast, Any, Callable, IO, Iterator, Sequence, TypeVar
+import heapq
 import json
+import os
 import pathlib
 import re
+import time
 from django.template.loader import render_to_string
 from django.utils.text import Truncator
 import requests
@@ -21,6 +35,7 @@ from mypy_boto3_ses.type_defs import ContentTypeDef, SendRawEmailResponseTypeDef
 import jwcrypto.jwe
 import jwcrypto.jwk
 import markus
+from markus.utils import generate_tag
 import logging
 from urllib.parse import quote_plus, urlparse
 
@@ -34,6 +49,7 @@ from privaterelay.plans import get_bundle_country_language_mapping
 from privaterelay.utils import get_countries_info_from_lang_and_mapping
 
 from .apps import s3_client, ses_client
+from .policy import relay_policy
 
 logger = logging.getLogger("events")
 info_logger = logging.getLogger("eventsinfo")
@@ -46,6 +62,12 @@ shavar_prod_lists_url = (
 )
 EMAILS_FOLDER_PATH = pathlib.Path(__file__).parent
 TRACKER_FOLDER_PATH = EMAILS_FOLDER_PATH / "tracker_lists"
+TRACKER_INDEX_FILE_NAME = "tracker-index.json"
+# Emails are read in chunks, and spooled to disk if larger than the limit
+EMAIL_CHUNK_BYTES = 64 * 1024
+EMAIL_SPOOL_MAX_BYTES = 1024 * 1024
+_SEND_POLICY = relay_policy.clone(cte_type="7bit")
+TRACKER_INDEX_FORMAT = 1
 
 
 def ses_message_props(data: str) -> ContentTypeDef:
@@ -98,14 +120,147 @@ def store_trackers(trackers, path, file_name):
         json.dump(trackers, f, indent=4)
 
 
-@cache
 def general_trackers():
-    return get_trackers(level=1)
+    return tracker_index().level_one
 
 
-@cache
 def strict_trackers():
-    return get_trackers(level=2)
+    return tracker_index().level_two
+
+
+def build_tracker_index(level_one: list[str], level_two: list[str]) -> dict[str, Any]:
+    """
+    Build the tracker index artifact for the level one and level two lists.
+
+    The index includes the trie regular expressions, so workers do not have to
+    build them at startup, and a version that changes when the lists change.
+    """
+    lists_json = json.dumps([level_one, level_two], separators=(",", ":"))
+    return {
+        "format": TRACKER_INDEX_FORMAT,
+        "version": sha256(lists_json.encode()).hexdigest()[:16],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "level_one": {
+            "trackers": level_one,
+            "trie_regex": _tracker_trie_regex(list(dict.fromkeys(level_one))),
+        },
+        "level_two": {
+            "trackers": level_two,
+            "trie_regex": _tracker_trie_regex(list(dict.fromkeys(level_two))),
+        },
+    }
+
+
+def store_tracker_index(index: dict[str, Any], path: pathlib.Path) -> None:
+    """Write the tracker index, replacing any old index in one step."""
+    tmp_path = path / f".{TRACKER_INDEX_FILE_NAME}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path / TRACKER_INDEX_FILE_NAME)
+
+
+class TrackerIndex:
+    """The level one and level two tracker lists, with their matchers."""
+
+    def __init__(
+        self,
+        level_one: list[str],
+        level_two: list[str],
+        version: str | None = None,
+        trie_regexes: dict[str, str] | None = None,
+        mtime_ns: int | None = None,
+    ) -> None:
+        trie_regexes = trie_regexes or {}
+        self.level_one = level_one
+        self.level_two = level_two
+        self.version = version
+        self.mtime_ns = mtime_ns
+        # Keyed by the id of the list, which the index keeps alive
+        self.matchers = {
+            id(trackers): TrackerMatcher(trackers, trie_regexes.get(name))
+            for name, trackers in (("level_one", level_one), ("level_two", level_two))
+        }
+
+    @classmethod
+    def from_artifact(
+        cls, index: dict[str, Any], mtime_ns: int | None = None
+    ) -> TrackerIndex:
+        if index.get("format") != TRACKER_INDEX_FORMAT:
+            raise ValueError(f"Unknown tracker index format {index.get('format')!r}")
+        return cls(
+            level_one=index["level_one"]["trackers"],
+            level_two=index["level_two"]["trackers"],
+            version=index["version"],
+            trie_regexes={
+                "level_one": index["level_one"]["trie_regex"],
+                "level_two": index["level_two"]["trie_regex"],
+            },
+            mtime_ns=mtime_ns,
+        )
+
+
+_tracker_index: TrackerIndex | None = None
+
+
+def load_tracker_index(path: pathlib.Path = TRACKER_FOLDER_PATH) -> TrackerIndex:
+    """
+    Load the tracker index artifact, or the tracker lists if there is no index.
+
+    Loading the lists will download missing lists, so the index should be created
+    by the get_latest_email_tracker_lists command before processing email.
+    """
+    index_path = path / TRACKER_INDEX_FILE_NAME
+    try:
+        mtime_ns = index_path.stat().st_mtime_ns
+        with open(index_path, "r") as f:
+            return TrackerIndex.from_artifact(json.load(f), mtime_ns)
+    except FileNotFoundError:
+        return TrackerIndex(get_trackers(level=1), get_trackers(level=2))
+
+
+def tracker_index() -> TrackerIndex:
+    """Get the current tracker index, loading it on first use."""
+    global _tracker_index
+    if _tracker_index is None:
+        _tracker_index = load_tracker_index()
+    return _tracker_index
+
+
+def refresh_tracker_index(path: pathlib.Path = TRACKER_FOLDER_PATH) -> str | None:
+    """
+    Load the tracker index artifact if it has changed since it was last loaded.
+
+    The new index replaces the current one in a single assignment, so this should
+    be called between batches of emails. Returns the new version if the index was
+    replaced, or None if it was not.
+    """
+    global _tracker_index
+    try:
+        mtime_ns = (path / TRACKER_INDEX_FILE_NAME).stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    if _tracker_index is not None and (
+        mtime_ns is None or mtime_ns == _tracker_index.mtime_ns
+    ):
+        return None
+    try:
+        new_index = load_tracker_index(path)
+    except (OSError, ValueError, KeyError):
+        logger.exception("tracker_index_load_failed")
+        return None
+    if _tracker_index is not None and new_index.version == _tracker_index.version:
+        _tracker_index.mtime_ns = new_index.mtime_ns
+        return None
+    _tracker_index = new_index
+    info_logger.info(
+        "tracker_index_loaded",
+        extra={
+            "version": new_index.version,
+            "level_one_count": len(new_index.level_one),
+            "level_two_count": len(new_index.level_two),
+        },
+    )
+    return new_index.version
 
 
 _TimedFunction = TypeVar("_TimedFunction", bound=Callable[..., Any])
@@ -142,6 +297,98 @@ def gauge_if_enabled(name, value, tags=None):
         metrics.gauge(name, value, tags)
 
 
+# Upper limits, in bytes, of the email size buckets for stage metrics
+EMAIL_SIZE_BUCKETS = (
+    (10_000, "under_10kb"),
+    (100_000, "10kb_100kb"),
+    (1_000_000, "100kb_1mb"),
+    (10_000_000, "1mb_10mb"),
+)
+
+
+def email_size_bucket(email_size: int | None) -> str:
+    """Get the size bucket for the email size, for tagging metrics."""
+    if email_size is None:
+        return "unknown"
+    for limit, bucket in EMAIL_SIZE_BUCKETS:
+        if email_size < limit:
+            return bucket
+    return "over_10mb"
+
+
+class StageTimer:
+    """
+    Record the time spent in each stage of processing an email.
+
+    A stage can be entered more than once, such as for retries, and the times are
+    added. The email size is set when the email is loaded, and other details, such
+    as part counts, as they are found. Details must not include personal data.
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, float] = {}
+        self.email_size: int | None = None
+        self.details: dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def log_data(self) -> dict[str, float]:
+        """Get the stage times in seconds, with millisecond precision."""
+        return {name: round(elapsed, 3) for name, elapsed in self.stages.items()}
+
+    def emit_metrics(self) -> None:
+        """Emit a histogram for each stage, in milliseconds, tagged by size."""
+        tags = [generate_tag("email_size", email_size_bucket(self.email_size))]
+        for name, elapsed in self.stages.items():
+            histogram_if_enabled(f"email_stage.{name}", round(elapsed * 1000), tags)
+
+
+_stage_timer: ContextVar[StageTimer | None] = ContextVar("stage_timer", default=None)
+
+
+@contextlib.contextmanager
+def stage_timer() -> Iterator[StageTimer]:
+    """Time the stages of processing an email in this thread or task."""
+    timer = StageTimer()
+    token = _stage_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _stage_timer.reset(token)
+
+
+@contextlib.contextmanager
+def email_stage(name: str) -> Iterator[None]:
+    """Time a stage of processing an email, if a stage timer is active."""
+    timer = _stage_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def set_stage_email_size(email_size: int) -> None:
+    """Set the email size for the stage metrics, if a stage timer is active."""
+    timer = _stage_timer.get()
+    if timer is not None:
+        timer.email_size = email_size
+
+
+def set_stage_details(**details: int) -> None:
+    """Set counts describing the email, if a stage timer is active."""
+    timer = _stage_timer.get()
+    if timer is not None:
+        timer.details.update(details)
+
+
 def get_email_domain_from_settings() -> str:
     email_network_locality = str(urlparse(settings.SITE_ORIGIN).netloc)
     # on dev server we need to add "mail" prefix
@@ -220,6 +467,51 @@ def get_welcome_email(user: User, format: str) -> str:
     )
 
 
+class PassThroughBytesGenerator(BytesGenerator):
+    """
+    Generate an email as bytes, writing unchanged encoded parts in one step.
+
+    The standard generator writes a part's encoded payload one line at a time,
+    which takes most of the time for emails with large attachments. When a part
+    does not need to be re-encoded, this writes the payload with one write, after
+    converting the line endings. The output is the same as BytesGenerator.
+
+    Parts with 8bit content, such as the rewritten text and HTML bodies, use the
+    standard generator, which re-encodes them for a 7bit policy.
+    """
+
+    def _handle_text(self, msg: Message) -> None:
+        payload = msg._payload  # type: ignore[attr-defined]
+        if (
+            not isinstance(payload, str)
+            or self._mangle_from_  # type: ignore[attr-defined]
+            or _has_surrogates(payload)
+        ):
+            super()._handle_text(msg)  # type: ignore[misc]
+            return
+        # Convert line endings, like _write_lines, but without splitting
+        payload = payload.replace("\r\n", "\n").replace("\r", "\n")
+        if self._NL != "\n":  # type: ignore[attr-defined]
+            payload = payload.replace("\n", self._NL)  # type: ignore[attr-defined]
+        self.write(payload)
+
+    # Also used for non-text parts, such as attachments
+    _writeBody = _handle_text
+
+
+def email_to_bytes(message: EmailMessage) -> bytes:
+    """
+    Serialize an email for sending.
+
+    The 7bit policy re-encodes 8bit parts, such as UTF-8 text, as when serializing
+    to a str. Other parts are written as they were received.
+    """
+    output = BytesIO()
+    PassThroughBytesGenerator(output, policy=_SEND_POLICY).flatten(message)
+    return output.getvalue()
+
+
+@email_stage("ses_send")
 @time_if_enabled("ses_send_raw_email")
 def ses_send_raw_email(
     source_address: str,
@@ -229,7 +521,7 @@ def ses_send_raw_email(
     assert (client := ses_client()) is not None
     assert settings.AWS_SES_CONFIGSET
 
-    data = message.as_string()
+    data = email_to_bytes(message)
     try:
         ses_response = client.send_raw_email(
             Source=source_address,
@@ -387,14 +679,48 @@ def _get_bucket_and_key_from_s3_json(message_json):
     return bucket, object_key
 
 
+@email_stage("s3_fetch")
 @time_if_enabled("s3_get_message_content")
-def get_message_content_from_s3(bucket, object_key):
+def get_message_file_from_s3(bucket, object_key):
+    """
+    Copy an email from S3 to a temporary file, in chunks.
+
+    The file is in memory for smaller emails, and moves to disk when it is larger
+    than EMAIL_SPOOL_MAX_BYTES. The caller should close the file.
+    """
     if bucket and object_key:
         assert (client := s3_client()) is not None
         streamed_s3_object = client.get_object(Bucket=bucket, Key=object_key).get(
             "Body"
         )
-        return streamed_s3_object.read()
+        email_file = SpooledTemporaryFile(max_size=EMAIL_SPOOL_MAX_BYTES)
+        try:
+            for chunk in streamed_s3_object.iter_chunks(EMAIL_CHUNK_BYTES):
+                email_file.write(chunk)
+        except BaseException:
+            email_file.close()
+            raise
+        email_file.seek(0)
+        return email_file
+
+
+@email_stage("mime_parse")
+def parse_email_file(email_file: IO[bytes]) -> EmailMessage:
+    """
+    Parse an email from a binary file, feeding the parser in chunks.
+
+    This avoids reading the whole file into a bytes object, and then decoding it
+    into a str, before parsing.
+    """
+    parser = BytesFeedParser(policy=relay_policy)
+    while chunk := email_file.read(EMAIL_CHUNK_BYTES):
+        parser.feed(chunk)
+    email = parser.close()
+    # python/typeshed issue 2418
+    # The Python 3.2 default was Message, 3.6 uses policy.message_factory, and
+    # policy.default.message_factory is EmailMessage
+    assert isinstance(email, EmailMessage)
+    return email
 
 
 @time_if_enabled("s3_remove_message_from")
@@ -433,26 +759,257 @@ def set_user_group(user):
     internal_group.user_set.add(user)
 
 
-def convert_domains_to_regex_patterns(domain_pattern):
-    return r"""(["'])(\S*://(\S*\.)*""" + re.escape(domain_pattern) + r"\S*)\1"
+def _tracker_trie_regex(trackers: Sequence[str]) -> str:
+    """
+    Return a regular expression that matches any of the tracker domains.
+
+    The domains are combined into a trie, so matching at a position only follows
+    the branches that match the next character, rather than trying each domain.
+    """
+    trie: dict[str, dict] = {}
+    for tracker in trackers:
+        node = trie
+        for char in tracker:
+            node = node.setdefault(char, {})
+        node[""] = {}  # Marks the end of a domain
+
+    def node_regex(node: dict[str, dict]) -> str:
+        branches = [
+            re.escape(char) + node_regex(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+        is_end = "" in node
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if is_end else group
+
+    return node_regex(trie)
+
+
+class TrackerMatcher:
+    """
+    Find quoted links to tracker domains in HTML content.
+
+    A link matches a tracker if it is in single or double quotes, and the tracker
+    domain follows the "://", or a "." somewhere after it. Checking thousands of
+    domains one at a time is slow, so one regular expression, compiled once per
+    tracker list, first finds the tracker domains in the content. Only those
+    trackers are then checked one at a time, in list order.
+
+    The results match checking every domain in list order: where links overlap, the
+    tracker earlier in the list claims its link first. When a tracker's links are
+    removed or replaced, the new content is searched again for later trackers, which
+    matters when one tracker is a subdomain of another.
+    """
+
+    def __init__(self, trackers: Sequence[str], trie_regex: str | None = None) -> None:
+        self.trackers = list(trackers)
+        self.tracker_nums: dict[str, list[int]] = {}
+        for num, tracker in enumerate(self.trackers):
+            self.tracker_nums.setdefault(tracker, []).append(num)
+        self.tracker_lengths = sorted({len(tracker) for tracker in self.tracker_nums})
+        self.link_patterns: dict[str, re.Pattern[str]] = {}
+        self.pattern: re.Pattern[str] | None = None
+        if self.tracker_nums:
+            self.pattern = re.compile(
+                r"(?:(?<=://)|(?<=\.))(?:"
+                + (trie_regex or _tracker_trie_regex(list(self.tracker_nums)))
+                + ")"
+            )
+
+    def find_trackers(self, html_content: str) -> set[int]:
+        """
+        Return the list indexes of the tracker domains in the content.
+
+        A domain is found after a "://" or a ".", even if it is not in a quoted
+        link, so some of the trackers may have no links to check.
+        """
+        found: set[int] = set()
+        if not self.pattern:
+            return found
+        for match in self.pattern.finditer(html_content):
+            # The match is the longest domain, with shorter ones at the same start
+            # or after a "." inside it
+            for start in range(match.start(), match.end()):
+                if start > match.start() and html_content[start - 1] != ".":
+                    continue
+                for length in self.tracker_lengths:
+                    if start + length > len(html_content):
+                        break
+                    found.update(
+                        self.tracker_nums.get(html_content[start : start + length], [])
+                    )
+        return found
+
+    def link_pattern(self, tracker: str) -> re.Pattern[str]:
+        """Return the pattern for quoted links to one tracker domain."""
+        try:
+            return self.link_patterns[tracker]
+        except KeyError:
+            pass
+        pattern = re.compile(
+            r"""(["'])(\S*://(?:\S*\.)?""" + re.escape(tracker) + r"\S*)\1"
+        )
+        self.link_patterns[tracker] = pattern
+        return pattern
+
+    def count(self, html_content: str, found: set[int] | None = None) -> dict[str, Any]:
+        """
+        Count the links to trackers.
+
+        A link is counted once, for the first tracker in the list that it matches.
+        Returns a dict with the total "count" and the per-tracker counts in
+        "trackers", in tracker list order. If the result of find_trackers for the
+        content is known, pass it as found.
+        """
+        _, total, details = self.sub_in_order(html_content, lambda _: "", found)
+        return {"count": total, "trackers": details}
+
+    def replace(
+        self,
+        html_content: str,
+        convert_link: Callable[[str], str],
+        found: set[int] | None = None,
+    ) -> tuple[str, int]:
+        """
+        Replace the links to trackers with convert_link(original_link).
+
+        Returns the new content and the number of replacements.
+        """
+
+        def replace_link(match: re.Match[str]) -> str:
+            return f"{match[1]}{convert_link(match[2])}{match[1]}"
+
+        html_content, total, _ = self.sub_in_order(html_content, replace_link, found)
+        return html_content, total
+
+    def sub_in_order(
+        self,
+        html_content: str,
+        convert: Callable[[re.Match[str]], str],
+        found: set[int] | None,
+    ) -> tuple[str, int, dict[str, int]]:
+        """
+        Substitute the links to each tracker in the content, in list order.
+
+        After a tracker's links are substituted, only the text around the new links
+        is searched for later trackers, since a new domain has to overlap one.
+
+        Returns the new content, the number of links, and the number per tracker.
+        """
+        pending = sorted(self.find_trackers(html_content) if found is None else found)
+        # A domain overlapping a new link starts at most this far before it
+        margin = len("://") + self.tracker_lengths[-1] if self.tracker_lengths else 0
+        total = 0
+        details: dict[str, int] = {}
+        last_num = -1
+        while pending:
+            num = heapq.heappop(pending)
+            if num <= last_num:
+                continue
+            last_num = num
+            tracker = self.trackers[num]
+            new_links: list[tuple[int, int]] = []
+            offset = 0
+
+            def convert_and_record(match: re.Match[str]) -> str:
+                nonlocal offset
+                new_link = convert(match)
+                start = match.start() + offset
+                new_links.append((start, start + len(new_link)))
+                offset += len(new_link) - len(match[0])
+                return new_link
+
+            html_content, matched = self.link_pattern(tracker).subn(
+                convert_and_record, html_content
+            )
+            if matched:
+                total += matched
+                details[tracker] = matched
+                for start, end in new_links:
+                    window = html_content[max(start - margin, 0) : end + margin]
+                    for later_num in self.find_trackers(window):
+                        if later_num > num:
+                            heapq.heappush(pending, later_num)
+        return html_content, total, details
+
+
+def get_tracker_matcher(trackers: Sequence[str]) -> TrackerMatcher:
+    """
+    Get the matcher from the tracker index, or build one for other lists.
+
+    The lists of the tracker index are found by identity, without copying the
+    thousands of domains for each email. Other lists are cached by value.
+    """
+    index = _tracker_index
+    if index is not None and (matcher := index.matchers.get(id(trackers))):
+        return matcher
+    return _build_tracker_matcher(tuple(trackers))
+
+
+@lru_cache(maxsize=4)
+def _build_tracker_matcher(trackers: tuple[str, ...]) -> TrackerMatcher:
+    return TrackerMatcher(trackers)
 
 
 def count_tracker(html_content, trackers):
-    tracker_total = 0
-    details = {}
-    # html_content needs to be str for count()
-    for tracker in trackers:
-        pattern = convert_domains_to_regex_patterns(tracker)
-        html_content, count = re.subn(pattern, "", html_content)
-        if count:
-            tracker_total += count
-            details[tracker] = count
-    return {"count": tracker_total, "trackers": details}
+    return get_tracker_matcher(trackers).count(html_content)
+
+
+def analyze_trackers(
+    html_content: str,
+    convert_link: Callable[[str], str] | None = None,
+    level: str = "general",
+) -> tuple[str, dict[str, Any]]:
+    """
+    Count level one and level two trackers, and optionally replace them.
+
+    If convert_link is set, links to trackers of the given level ("general" or
+    "strict") are replaced with convert_link(original_link). The content is searched
+    once per level for the tracker domains, and the counting and replacing check
+    only the trackers found.
+
+    Returns a tuple:
+    * The HTML content, with tracker links replaced if convert_link is set
+    * A dict with the details:
+      - tracker_removed: The number of links replaced
+      - level_one: The "count" and "trackers" for general (level one) trackers
+      - level_two: The "count" and "trackers" for strict (level two) trackers
+    """
+    general = get_tracker_matcher(general_trackers())
+    strict = get_tracker_matcher(strict_trackers())
+    general_found = general.find_trackers(html_content)
+    strict_found = strict.find_trackers(html_content)
+    details: dict[str, Any] = {
+        "tracker_removed": 0,
+        "level_one": general.count(html_content, general_found),
+        "level_two": strict.count(html_content, strict_found),
+    }
+    if convert_link is not None:
+        remover, found = (
+            (general, general_found) if level == "general" else (strict, strict_found)
+        )
+        html_content, details["tracker_removed"] = remover.replace(
+            html_content, convert_link, found
+        )
+    return html_content, details
 
 
-def count_all_trackers(html_content):
-    general_detail = count_tracker(html_content, general_trackers())
-    strict_detail = count_tracker(html_content, strict_trackers())
+def count_all_trackers(html_content, tracker_details=None):
+    """
+    Emit metrics and a study log of the level one and level two trackers.
+
+    If the tracker_details from remove_trackers are passed, they are used instead
+    of scanning the HTML content again.
+    """
+    if tracker_details is None:
+        _, tracker_details = analyze_trackers(html_content)
+    general_detail = tracker_details["level_one"]
+    strict_detail = tracker_details["level_two"]
 
     incr_if_enabled("tracker.general_count", general_detail["count"])
     incr_if_enabled("tracker.strict_count", strict_detail["count"])
@@ -463,37 +1020,19 @@ def count_all_trackers(html_content):
 
 
 def remove_trackers(html_content, from_address, datetime_now, level="general"):
-    trackers = general_trackers() if level == "general" else strict_trackers()
-    tracker_removed = 0
-    changed_content = html_content
-
-    for tracker in trackers:
-        pattern = convert_domains_to_regex_patterns(tracker)
-
-        def convert_to_tracker_warning_link(matchobj):
-            quote, original_link, _ = matchobj.groups()
-            tracker_link_details = {
-                "sender": from_address,
-                "received_at": datetime_now,
-                "original_link": original_link,
-            }
-            anchor = quote_plus(json.dumps(tracker_link_details, separators=(",", ":")))
-            url = f"{settings.SITE_ORIGIN}/contains-tracker-warning/#{anchor}"
-            return f"{quote}{url}{quote}"
-
-        changed_content, matched = re.subn(
-            pattern, convert_to_tracker_warning_link, changed_content
-        )
-        tracker_removed += matched
-
-    level_one_detail = count_tracker(html_content, general_trackers())
-    level_two_detail = count_tracker(html_content, strict_trackers())
-
-    tracker_details = {
-        "tracker_removed": tracker_removed,
-        "level_one": level_one_detail,
-    }
-    logger_details = {"level": level, "level_two": level_two_detail}
+    def convert_to_tracker_warning_link(original_link):
+        tracker_link_details = {
+            "sender": from_address,
+            "received_at": datetime_now,
+            "original_link": original_link,
+        }
+        anchor = quote_plus(json.dumps(tracker_link_details, separators=(",", ":")))
+        return f"{settings.SITE_ORIGIN}/contains-tracker-warning/#{anchor}"
+
+    changed_content, tracker_details = analyze_trackers(
+        html_content, convert_to_tracker_warning_link, level
+    )
+    logger_details = {"level": level}
     logger_details.update(tracker_details)
     info_logger.info(
         "email_tracker_summary",
@@ -1,19 +1,18 @@
 from collections import defaultdict
 from copy import deepcopy
 from datetime import datetime, timezone
-from email import message_from_bytes
 from email.iterators import _structure
 from email.message import EmailMessage
 from email.utils import parseaddr
 import html
-from io import StringIO
+from io import BytesIO, SEEK_END, StringIO
 import json
 from json import JSONDecodeError
 import logging
 import re
 import shlex
 from textwrap import dedent
-from typing import Any, Literal
+from typing import Any, IO, Literal
 from urllib.parse import urlencode
 
 from botocore.exceptions import ClientError
@@ -28,7 +27,6 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from django.db.models import prefetch_related_objects
 from django.http import HttpRequest, HttpResponse
 from django.template.loader import render_to_string
 from django.utils.html import escape
@@ -37,6 +35,8 @@ from django.views.decorators.csrf import csrf_exempt
 from privaterelay.utils import get_subplat_upgrade_link_by_language
 
 
+from . import address_cache, address_filter, counters, message_context
+from .address_cache import AddressSnapshot, AddressState
 from .models import (
     CannotMakeAddressException,
     DeletedAddress,
@@ -47,7 +47,6 @@ from .models import (
     address_hash,
     get_domain_numerical,
 )
-from .policy import relay_policy
 from .types import (
     AWS_MailJSON,
     AWS_SNSMessageJSON,
@@ -61,10 +60,11 @@ from .utils import (
     count_all_trackers,
     decrypt_reply_metadata,
     derive_reply_keys,
+    email_stage,
     encrypt_reply_metadata,
     generate_from_header,
     get_domains_from_settings,
-    get_message_content_from_s3,
+    get_message_file_from_s3,
     get_message_id_bytes,
     get_reply_to_address,
     histogram_if_enabled,
@@ -72,9 +72,12 @@ from .utils import (
     remove_message_from_s3,
     remove_trackers,
     ses_send_raw_email,
+    set_stage_details,
+    set_stage_email_size,
     urlize_and_linebreaks,
     InvalidFromHeader,
     parse_email_header,
+    parse_email_file,
 )
 from .sns import verify_from_sns, SUPPORTED_SNS_TYPES
 
@@ -316,7 +319,7 @@ def wrapped_email_test(request: HttpRequest) -> HttpResponse:
 
 
 def _store_reply_record(
-    mail: AWS_MailJSON, message_id: str, address: RelayAddress | DomainAddress
+    mail: AWS_MailJSON, message_id: str, address: AddressState
 ) -> AWS_MailJSON:
     # After relaying email, store a Reply record for it
     reply_metadata = {}
@@ -331,10 +334,10 @@ def _store_reply_record(
         "lookup": lookup,
         "encrypted_metadata": encrypted_metadata,
     }
-    if type(address) == DomainAddress:
-        reply_create_args["domain_address"] = address
-    elif type(address) == RelayAddress:
-        reply_create_args["relay_address"] = address
+    if address.is_domain_address:
+        reply_create_args["domain_address_id"] = address.id
+    else:
+        reply_create_args["relay_address_id"] = address.id
     Reply.objects.create(**reply_create_args)
     return mail
 
@@ -354,7 +357,9 @@ def sns_inbound(request):
         logger.error("validate_sns_arn_and_type_error", extra=error_details)
         return HttpResponse(error_details["error"], status=400)
 
-    return _sns_inbound_logic(topic_arn, message_type, verified_json_body)
+    response = _sns_inbound_logic(topic_arn, message_type, verified_json_body)
+    counters.flush_counters_if_due()
+    return response
 
 
 def validate_sns_arn_and_type(
@@ -484,12 +489,13 @@ def _sns_message(message_json: AWS_SNSMessageJSON) -> HttpResponse:
     incr_if_enabled("sns_inbound_Notification_Received", 1)
     notification_type = message_json.get("notificationType")
     event_type = message_json.get("eventType")
-    if notification_type == "Bounce" or event_type == "Bounce":
-        return _handle_bounce(message_json)
-    if notification_type == "Complaint" or event_type == "Complaint":
-        return _handle_complaint(message_json)
-    assert notification_type == "Received" and event_type is None
-    return _handle_received(message_json)
+    with message_context.message_context():
+        if notification_type == "Bounce" or event_type == "Bounce":
+            return _handle_bounce(message_json)
+        if notification_type == "Complaint" or event_type == "Complaint":
+            return _handle_complaint(message_json)
+        assert notification_type == "Received" and event_type is None
+        return _handle_received(message_json)
 
 
 def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
@@ -560,9 +566,8 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
         # FIXME: this ambiguous return of either
         # RelayAddress or DomainAddress types makes the Rustacean in me throw
         # up a bit.
-        address = _get_address(to_address)
-        prefetch_related_objects([address.user], "socialaccount_set", "profile")
-        user_profile = address.user.profile
+        with email_stage("address_lookup"):
+            snapshot = _get_address_snapshot(to_address)
     except (
         ObjectDoesNotExist,
         CannotMakeAddressException,
@@ -574,9 +579,11 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
             response = HttpResponse("Address does not exist", status=404)
         return response
 
+    address_state, owner = snapshot.address, snapshot.owner
+
     _record_receipt_verdicts(receipt, "valid_user")
     # if this is spam and the user is set to auto-block spam, early return
-    if user_profile.auto_block_spam and _get_verdict(receipt, "spam") == "FAIL":
+    if owner.auto_block_spam and _get_verdict(receipt, "spam") == "FAIL":
         incr_if_enabled("email_auto_suppressed_for_spam", 1)
         return HttpResponse("Address rejects spam.")
 
@@ -592,7 +599,7 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
             return HttpResponse("DMARC failure, policy is reject", status=400)
 
     # if this user is over bounce limits, early return
-    bounce_paused, bounce_type = user_profile.check_bounce_pause()
+    bounce_paused, bounce_type = owner.check_bounce_pause()
     if bounce_paused:
         _record_receipt_verdicts(receipt, "user_bounce_paused")
         incr_if_enabled("email_suppressed_for_%s_bounce" % bounce_type, 1)
@@ -602,7 +609,9 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
     try:
         (lookup_key, _) = _get_keys_from_headers(mail["headers"])
         reply_record = _get_reply_record_from_lookup_key(lookup_key)
-        address = reply_record.address
+        reply_address = reply_record.address
+        if reply_address is not None:
+            address_state = AddressState.from_address(reply_address)
         message_id = _get_message_id_from_headers(mail["headers"])
         # make sure the relay user is premium
         if not _reply_allowed(from_address, to_address, reply_record, message_id):
@@ -615,17 +624,17 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
         pass
 
     # if account flagged for abuse, early return
-    if user_profile.is_flagged:
+    if owner.is_flagged:
         return HttpResponse("Address is temporarily disabled.")
 
     # if address is set to block, early return
-    if not address.enabled:
+    if not address_state.enabled:
         incr_if_enabled("email_for_disabled_address", 1)
-        address.num_blocked += 1
-        address.save(update_fields=["num_blocked"])
+        counters.increment(address_state.model, address_state.id, "num_blocked")
         _record_receipt_verdicts(receipt, "disabled_alias")
-        user_profile.last_engagement = datetime.now(timezone.utc)
-        user_profile.save()
+        counters.set_latest(
+            Profile, owner.profile_id, "last_engagement", datetime.now(timezone.utc)
+        )
         # TODO: Add metrics
         return HttpResponse("Address is temporarily disabled.")
 
@@ -634,21 +643,20 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
 
     # if address is blocking list emails, and email is from list, early return
     if (
-        address
-        and address.block_list_emails
-        and user_profile.has_premium
+        address_state.block_list_emails
+        and owner.has_premium
         and _check_email_from_list(mail["headers"])
     ):
         incr_if_enabled("list_email_for_address_blocking_lists", 1)
-        address.num_blocked += 1
-        address.save(update_fields=["num_blocked"])
-        user_profile.last_engagement = datetime.now(timezone.utc)
-        user_profile.save()
+        counters.increment(address_state.model, address_state.id, "num_blocked")
+        counters.set_latest(
+            Profile, owner.profile_id, "last_engagement", datetime.now(timezone.utc)
+        )
         return HttpResponse("Address is not accepting list emails.")
 
     # Collect new headers
     subject = common_headers.get("subject", "")
-    destination_address = user_profile.user.email
+    destination_address = owner.email
     reply_address = get_reply_to_address()
     try:
         from_header = generate_from_header(from_address, to_address)
@@ -679,7 +687,9 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
 
     # Get incoming email
     try:
-        (incoming_email_bytes, transport, load_time_s) = _get_email_bytes(message_json)
+        (incoming_email_file, email_size, transport, load_time_s) = _get_email_file(
+            message_json
+        )
     except ClientError as e:
         if e.response["Error"].get("Code", "") == "NoSuchKey":
             logger.error("s3_object_does_not_exist", extra=e.response["Error"])
@@ -690,26 +700,27 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
 
     # Convert to new email
     sample_trackers = bool(sample_is_active("tracker_sample"))
-    tracker_removal_flag = flag_is_active_in_task("tracker_removal", address.user)
+    tracker_removal_flag = flag_is_active_in_task("tracker_removal", owner.user)
     remove_level_one_trackers = bool(
-        tracker_removal_flag and user_profile.remove_level_one_email_trackers
-    )
-    (
-        forwarded_email,
-        issues,
-        level_one_trackers_removed,
-        has_html,
-        has_text,
-    ) = _convert_to_forwarded_email(
-        incoming_email_bytes=incoming_email_bytes,
-        headers=headers,
-        to_address=to_address,
-        from_address=from_address,
-        language=user_profile.language,
-        has_premium=user_profile.has_premium,
-        sample_trackers=sample_trackers,
-        remove_level_one_trackers=remove_level_one_trackers,
+        tracker_removal_flag and owner.remove_level_one_email_trackers
     )
+    with incoming_email_file:
+        (
+            forwarded_email,
+            issues,
+            level_one_trackers_removed,
+            has_html,
+            has_text,
+        ) = _convert_to_forwarded_email(
+            incoming_email_file=incoming_email_file,
+            headers=headers,
+            to_address=to_address,
+            from_address=from_address,
+            language=owner.language,
+            has_premium=owner.has_premium,
+            sample_trackers=sample_trackers,
+            remove_level_one_trackers=remove_level_one_trackers,
+        )
     if has_html:
         incr_if_enabled("email_with_html_content", 1)
     if has_text:
@@ -731,27 +742,31 @@ def _handle_received(message_json: AWS_SNSMessageJSON) -> HttpResponse:
         return HttpResponse("SES client error on Raw Email", status=503)
 
     message_id = ses_response["MessageId"]
-    _store_reply_record(mail, message_id, address)
-
-    user_profile.update_abuse_metric(
-        email_forwarded=True, forwarded_email_size=len(incoming_email_bytes)
+    # Replies to the sent email are routed with the Reply record
+    _store_reply_record(mail, message_id, address_state)
+    if address_state.block_list_emails and not owner.has_premium:
+        # Saving the address turns off the premium-only setting
+        address_state.model.objects.get(id=address_state.id).save(
+            update_fields=["block_list_emails"]
+        )
+    # The abuse metrics are written in one transaction after the message is processed
+    message_context.defer_write(
+        lambda: owner.get_profile().update_abuse_metric(
+            email_forwarded=True, forwarded_email_size=email_size
+        )
     )
-    user_profile.last_engagement = datetime.now(timezone.utc)
-    user_profile.save()
-    address.num_forwarded += 1
-    address.last_used_at = datetime.now(timezone.utc)
+    # The statistics are written to the database by counters.flush_counters
+    now = datetime.now(timezone.utc)
+    counters.set_latest(Profile, owner.profile_id, "last_engagement", now)
+    counters.increment(address_state.model, address_state.id, "num_forwarded")
+    counters.set_latest(address_state.model, address_state.id, "last_used_at", now)
     if level_one_trackers_removed:
-        address.num_level_one_trackers_blocked = (
-            address.num_level_one_trackers_blocked or 0
-        ) + level_one_trackers_removed
-    address.save(
-        update_fields=[
-            "num_forwarded",
-            "last_used_at",
-            "block_list_emails",
+        counters.increment(
+            address_state.model,
+            address_state.id,
             "num_level_one_trackers_blocked",
-        ]
-    )
+            level_one_trackers_removed,
+        )
     return HttpResponse("Sent email to final recipient.", status=200)
 
 
@@ -797,15 +812,15 @@ def _get_keys_from_headers(headers):
 
         if header["name"].lower() == "references":
             message_ids = header["value"]
-            for message_id in message_ids.split(" "):
-                message_id_bytes = get_message_id_bytes(message_id)
-                lookup_key, encryption_key = derive_reply_keys(message_id_bytes)
-                try:
-                    # FIXME: calling code is likely to duplicate this query
-                    _get_reply_record_from_lookup_key(lookup_key)
+            keys = [
+                derive_reply_keys(get_message_id_bytes(message_id))
+                for message_id in message_ids.split(" ")
+            ]
+            # Find the Reply records in one query, and share them with the caller
+            replies = _get_reply_records([b64_lookup_key(key) for key, _ in keys])
+            for lookup_key, encryption_key in keys:
+                if replies[b64_lookup_key(lookup_key)] is not None:
                     return lookup_key, encryption_key
-                except Reply.DoesNotExist:
-                    pass
             raise Reply.DoesNotExist
     incr_if_enabled("mail_to_replies_without_reply_headers", 1)
     raise ReplyHeadersNotFound
@@ -813,7 +828,34 @@ def _get_keys_from_headers(headers):
 
 def _get_reply_record_from_lookup_key(lookup_key):
     lookup = b64_lookup_key(lookup_key)
-    return Reply.objects.get(lookup=lookup)
+    reply = _get_reply_records([lookup])[lookup]
+    if reply is None:
+        raise Reply.DoesNotExist("Reply matching query does not exist.")
+    return reply
+
+
+def _get_reply_records(lookups: list[str]) -> dict[str, Reply | None]:
+    """
+    Get the Reply records for lookup values, with the address owners.
+
+    Records already loaded for the message are reused, and the others are loaded with
+    one query. The result has None for lookup values without a record.
+    """
+
+    def load_replies(keys: list[tuple[str, str]]) -> dict[tuple[str, str], Reply]:
+        replies: dict[tuple[str, str], Reply] = {}
+        for reply in Reply.objects.filter(
+            lookup__in=[lookup for _, lookup in keys]
+        ).select_related(
+            "relay_address__user__profile", "domain_address__user__profile"
+        ):
+            replies.setdefault(("reply", reply.lookup), reply)
+        return replies
+
+    replies = message_context.load_many(
+        [("reply", lookup) for lookup in lookups], load_replies
+    )
+    return {lookup: reply for (_, lookup), reply in replies.items()}
 
 
 def _strip_localpart_tag(address):
@@ -825,26 +867,39 @@ def _strip_localpart_tag(address):
 _TransportType = Literal["sns", "s3"]
 
 
-def _get_email_bytes(
+def _get_email_file(
     message_json: AWS_SNSMessageJSON,
-) -> tuple[bytes, _TransportType, float]:
+) -> tuple[IO[bytes], int, _TransportType, float]:
+    """
+    Get the email as a binary file, which the caller should close.
+
+    Return is a tuple:
+    - email_file - The email, positioned at the start
+    - email_size - The size of the email in bytes
+    - transport - "sns" if the email was in the SNS message, "s3" if loaded from S3
+    - load_time_s - The time to load the email, in seconds
+    """
     with Timer(logger=None) as load_timer:
+        email_file: IO[bytes]
         if "content" in message_json:
             # email content in sns message
-            message_content = message_json["content"].encode("utf-8")
+            email_file = BytesIO(message_json["content"].encode("utf-8"))
             transport: Literal["sns", "s3"] = "sns"
         else:
             # assume email content in S3
             bucket, object_key = _get_bucket_and_key_from_s3_json(message_json)
-            message_content = get_message_content_from_s3(bucket, object_key)
+            email_file = get_message_file_from_s3(bucket, object_key)
             transport = "s3"
-        histogram_if_enabled("relayed_email.size", len(message_content))
+        email_size = email_file.seek(0, SEEK_END)
+        email_file.seek(0)
+        histogram_if_enabled("relayed_email.size", email_size)
+        set_stage_email_size(email_size)
     load_time_s = round(load_timer.last, 3)
-    return (message_content, transport, load_time_s)
+    return (email_file, email_size, transport, load_time_s)
 
 
 def _convert_to_forwarded_email(
-    incoming_email_bytes: bytes,
+    incoming_email_file: IO[bytes],
     headers: OutgoingHeaders,
     to_address: str,
     from_address: str,
@@ -855,7 +910,7 @@ def _convert_to_forwarded_email(
     now: datetime | None = None,
 ) -> tuple[EmailMessage, EmailForwardingIssues, int, bool, bool]:
     """
-    Convert an email (as bytes) to a forwarded email.
+    Convert an email (as a binary file) to a forwarded email.
 
     Return is a tuple:
     - email - The forwarded email
@@ -864,11 +919,11 @@ def _convert_to_forwarded_email(
     - has_html - True if the email has an HTML representation
     - has_text - True if the email has a plain text representation
     """
-    email = message_from_bytes(incoming_email_bytes, policy=relay_policy)
-    # python/typeshed issue 2418
-    # The Python 3.2 default was Message, 3.6 uses policy.message_factory, and
-    # policy.default.message_factory is EmailMessage
-    assert isinstance(email, EmailMessage)
+    email = parse_email_file(incoming_email_file)
+    set_stage_details(
+        mime_parts=sum(1 for _ in email.walk()),
+        attachments=sum(1 for _ in email.iter_attachments()),
+    )
 
     # Replace headers in the original email
     header_issues = _replace_headers(email, headers)
@@ -931,6 +986,7 @@ def _convert_to_forwarded_email(
     return (email, issues, level_one_trackers_removed, has_html, has_text)
 
 
+@email_stage("header_replace")
 def _replace_headers(
     email: EmailMessage, headers: OutgoingHeaders
 ) -> EmailHeaderIssues:
@@ -1016,6 +1072,7 @@ def _replace_headers(
     return dict(issues)
 
 
+@email_stage("html_convert")
 def _convert_html_content(
     html_content: str,
     to_address: str,
@@ -1034,17 +1091,20 @@ def _convert_html_content(
     # and apply default link styles
     display_email = re.sub("([@.:])", r"<span>\1</span>", to_address)
 
-    # sample tracker numbers
-    if sample_trackers:
-        count_all_trackers(html_content)
-
     tracker_report_link = ""
     removed_count = 0
+    tracker_details = None
+    original_html_content = html_content
     if remove_level_one_trackers:
         html_content, tracker_details = remove_trackers(
             html_content, from_address, datetime_now_ms
         )
         removed_count = tracker_details["tracker_removed"]
+        set_stage_details(
+            level_one_trackers=tracker_details["level_one"]["count"],
+            level_two_trackers=tracker_details["level_two"]["count"],
+            trackers_removed=removed_count,
+        )
         tracker_report_details = {
             "sender": from_address,
             "received_at": datetime_now_ms,
@@ -1054,6 +1114,10 @@ def _convert_html_content(
             tracker_report_details
         )
 
+    # sample tracker numbers, reusing the counts from removing trackers
+    if sample_trackers:
+        count_all_trackers(original_html_content, tracker_details)
+
     wrapped_html = wrap_html_email(
         original_html=html_content,
         language=language,
@@ -1111,7 +1175,7 @@ def _build_reply_requires_premium_email(
 
 def _set_forwarded_first_reply(profile):
     profile.forwarded_first_reply = True
-    profile.save()
+    Profile.objects.filter(id=profile.id).update(forwarded_first_reply=True)
 
 
 def _send_reply_requires_premium_email(
@@ -1165,8 +1229,8 @@ def _reply_allowed(
         # The From: is not a Relay user, so make sure this is a reply *TO* a
         # premium Relay user
         try:
-            address = _get_address(to_address)
-            if address.user.profile.has_premium:
+            snapshot = _get_address_snapshot(to_address)
+            if snapshot.owner.has_premium:
                 return True
         except ObjectDoesNotExist:
             return False
@@ -1229,7 +1293,7 @@ def _handle_reply(
     }
 
     try:
-        (email_bytes, transport, load_time_s) = _get_email_bytes(message_json)
+        (email_file, email_size, transport, load_time_s) = _get_email_file(message_json)
     except ClientError as e:
         if e.response["Error"].get("Code", "") == "NoSuchKey":
             logger.error("s3_object_does_not_exist", extra=e.response["Error"])
@@ -1238,8 +1302,8 @@ def _handle_reply(
         # we are returning a 500 so that SNS can retry the email processing
         return HttpResponse("Cannot fetch the message content from S3", status=503)
 
-    email = message_from_bytes(email_bytes, policy=relay_policy)
-    assert isinstance(email, EmailMessage)
+    with email_file:
+        email = parse_email_file(email_file)
 
     # Convert to a reply email
     # TODO: Issue #1747 - Remove wrapper / prefix in replies
@@ -1255,11 +1319,14 @@ def _handle_reply(
         logger.error("ses_client_error", extra=e.response["Error"])
         return HttpResponse("SES client error", status=400)
 
-    reply_record.increment_num_replied()
+    # The statistics are written in one transaction after the message is processed
     profile = address.user.profile
-    profile.update_abuse_metric(replied=True)
-    profile.last_engagement = datetime.now(timezone.utc)
-    profile.save()
+    now = datetime.now(timezone.utc)
+    message_context.defer_write(reply_record.increment_num_replied)
+    message_context.defer_write(lambda: profile.update_abuse_metric(replied=True))
+    message_context.defer_write(
+        lambda: Profile.objects.filter(id=profile.id).update(last_engagement=now)
+    )
     return HttpResponse("Sent email to final recipient.", status=200)
 
 
@@ -1298,13 +1365,32 @@ def _get_domain_address(local_portion: str, domain_portion: str) -> DomainAddres
                     locked_profile, local_portion, True
                 )
             domain_address.last_used_at = datetime.now(timezone.utc)
-            domain_address.save()
+            domain_address.save(update_fields=["last_used_at"])
             return domain_address
     except Profile.DoesNotExist as e:
         incr_if_enabled("email_for_dne_subdomain", 1)
         raise e
 
 
+def _get_address_snapshot(address: str) -> AddressSnapshot:
+    """
+    Get the forwarding state of an email address, and of its owner.
+
+    The state is read from the cache, or from _get_address and then cached.
+    Raises the same exceptions as _get_address.
+    """
+    local_portion, domain_portion = address.split("@")
+
+    def load_snapshot() -> AddressSnapshot:
+        snapshot = address_cache.get_snapshot(local_portion, domain_portion)
+        if snapshot is None:
+            snapshot = AddressSnapshot.from_address(_get_address(address))
+            address_cache.set_snapshot(local_portion, domain_portion, snapshot)
+        return snapshot
+
+    return message_context.load(("address", address.lower()), load_snapshot)
+
+
 def _get_address(address: str) -> RelayAddress | DomainAddress:
     """
     Find or create the RelayAddress or DomainAddress for an email address.
@@ -1328,7 +1414,11 @@ def _get_address(address: str) -> RelayAddress | DomainAddress:
     if domain not in email_domains:
         return _get_domain_address(local_address, domain)
 
-    # the domain is the site's 'top' relay domain, so look up the RelayAddress
+    # the domain is the site's 'top' relay domain, so look up the RelayAddress,
+    # unless the filter of live addresses shows it is unknown or deleted
+    if not address_filter.might_exist(local_address, domain):
+        incr_if_enabled("email_for_address_not_in_filter", 1)
+        raise RelayAddress.DoesNotExist("Address does not exist")
     try:
         domain_numerical = get_domain_numerical(domain)
         relay_address = RelayAddress.objects.get(
@@ -1,66 +1,190 @@
+"""
+Sync the phone subscription dates on profiles with the Mozilla accounts data.
+
+The subscription data is fetched from Mozilla accounts for each phone user, which
+is an HTTP request or more per user. The requests are made by a pool of worker
+threads, spaced to a maximum rate, while the profiles are updated in bulk per chunk
+of accounts. After each chunk, the last account id is stored in the cache as a
+checkpoint, so that an interrupted run continues after it. Use --restart to ignore
+the checkpoint.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any
+import logging
+import threading
+import time
+
 from django.conf import settings
-from django.core.management.base import BaseCommand, CommandParser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connections
+
+from allauth.socialaccount.models import SocialAccount
 
+from emails.models import Profile
 from privaterelay.fxa_utils import get_phone_subscription_dates
 from privaterelay.management.utils import (
     get_free_phone_social_accounts,
     get_phone_subscriber_social_accounts,
+    iterate_chunks_with_profiles,
 )
-import logging
 
 logger = logging.getLogger("events")
 
+# Keep the checkpoint of an interrupted run for a week
+CHECKPOINT_SECONDS = 7 * 24 * 60 * 60
+SYNCED_FIELDS = [
+    "date_subscribed_phone",
+    "date_phone_subscription_start",
+    "date_phone_subscription_end",
+    "date_phone_subscription_reset",
+]
+
+
+class RateLimiter:
+    """Space out the calls from several threads to a maximum rate."""
+
+    def __init__(self, per_second: float) -> None:
+        self.interval = 1 / per_second if per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start_time = max(self.next_time, now)
+            self.next_time = start_time + self.interval
+        time.sleep(start_time - now)
+
+
+def checkpoint_key(group: str) -> str:
+    return f"sync_phone_related_dates_on_profile:{group}:last_id"
+
+
+def fetch_phone_subscription_dates(
+    limiter: RateLimiter, social_account: SocialAccount
+) -> Any:
+    """
+    Get the phone subscription dates from Mozilla accounts in a worker thread.
+
+    Django opens a database connection per thread, so close this thread's
+    connections when done, rather than leaving them for the garbage collector.
+    """
+    limiter.wait()
+    try:
+        return get_phone_subscription_dates(social_account)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def set_phone_dates(
+    social_account: SocialAccount,
+    dates: tuple[Any, Any, Any],
+    datetime_now: datetime,
+    group: str,
+    is_free_phone_user: bool,
+) -> bool:
+    """Set the phone dates on the profile, and return True if it needs saving."""
+    date_subscribed_phone, start_date, end_date = dates
+    profile = social_account.user.profile
+    if (date_subscribed_phone and start_date and end_date) is None:
+        # No subscription info from FxA
+        if group == "subscription":
+            # Unsure if social account user should have phone subscription
+            logger.error(
+                "no_subscription_data_in_fxa_for_user_with_phone_subscription",
+                extra={"fxa_uid": social_account.uid},
+            )
+        if is_free_phone_user and profile.date_phone_subscription_reset is None:
+            profile.date_phone_subscription_reset = datetime_now.replace(day=1)
+            return True
+        return False
+
+    # User has/had a valid phone subscriptions, populate phone date fields
+    profile.date_subscribed_phone = date_subscribed_phone
+    profile.date_phone_subscription_start = start_date
+    profile.date_phone_subscription_end = end_date
+    if profile.date_phone_subscription_reset is None:
+        # initialize the reset date for phone subscription users to the start of the subscription
+        profile.date_phone_subscription_reset = start_date
+    thirtyone_days_ago = datetime_now - timedelta(settings.MAX_DAYS_IN_MONTH)
+    while profile.date_phone_subscription_reset < thirtyone_days_ago:
+        profile.date_phone_subscription_reset += timedelta(settings.MAX_DAYS_IN_MONTH)
+    return True
+
+
+def sync_phone_related_dates_on_profile(
+    group: str,
+    workers: int = 1,
+    requests_per_second: float = 0,
+    chunk_size: int = 100,
+    restart: bool = False,
+) -> int:
+    if not settings.PHONES_ENABLED:
+        return 0
 
-def sync_phone_related_dates_on_profile(group: str) -> int:
     social_accounts_with_phones = get_phone_subscriber_social_accounts()
     free_phones_social_accounts = get_free_phone_social_accounts()
     if group == "free":
         social_accounts_with_phones = free_phones_social_accounts
     if group == "both":
-        social_accounts_with_phones.update(free_phones_social_accounts)
+        social_accounts_with_phones |= free_phones_social_accounts
+    # The free phone users are few, unlike the accounts in the loop
+    free_phones_account_ids = set(
+        free_phones_social_accounts.values_list("id", flat=True)
+    )
 
-    if not settings.PHONES_ENABLED or len(social_accounts_with_phones) == 0:
-        return 0
+    key = checkpoint_key(group)
+    if restart:
+        cache.delete(key)
+    elif last_id := cache.get(key):
+        logger.info(
+            "sync_phone_related_dates_resumed", extra={"group": group, "after": last_id}
+        )
+        social_accounts_with_phones = social_accounts_with_phones.filter(id__gt=last_id)
 
+    fetch_dates = partial(
+        fetch_phone_subscription_dates, RateLimiter(requests_per_second)
+    )
+    executor = (
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync_phone_dates")
+        if workers > 1
+        else None
+    )
     num_updated_accounts = 0
     datetime_now = datetime.now(timezone.utc)
-    for social_account in social_accounts_with_phones:
-        date_subscribed_phone, start_date, end_date = get_phone_subscription_dates(
-            social_account
-        )
-        profile = social_account.user.profile
-        if (date_subscribed_phone and start_date and end_date) is None:
-            # No subscription info from FxA
-            if group == "subscription":
-                # Unsure if social account user should have phone subscription
-                logger.error(
-                    "no_subscription_data_in_fxa_for_user_with_phone_subscription",
-                    extra={"fxa_uid": social_account.uid},
-                )
-            if (
-                social_account in free_phones_social_accounts
-                and profile.date_phone_subscription_reset is None
-            ):
-                profile.date_phone_subscription_reset = datetime_now.replace(day=1)
-                profile.save()
-                num_updated_accounts += 1
-            continue
-
-        # User has/had a valid phone subscriptions, populate phone date fields
-        profile.date_subscribed_phone = date_subscribed_phone
-        profile.date_phone_subscription_start = start_date
-        profile.date_phone_subscription_end = end_date
-        if profile.date_phone_subscription_reset is None:
-            # initialize the reset date for phone subscription users to the start of the subscription
-            profile.date_phone_subscription_reset = start_date
-        thirtyone_days_ago = datetime_now - timedelta(settings.MAX_DAYS_IN_MONTH)
-        while profile.date_phone_subscription_reset < thirtyone_days_ago:
-            profile.date_phone_subscription_reset += timedelta(
-                settings.MAX_DAYS_IN_MONTH
+    chunks = iterate_chunks_with_profiles(social_accounts_with_phones, chunk_size)
+    try:
+        for chunk in chunks:
+            all_dates = (
+                executor.map(fetch_dates, chunk)
+                if executor
+                else map(fetch_dates, chunk)
             )
-        profile.save()
-        num_updated_accounts += 1
+            updated_profiles = [
+                social_account.user.profile
+                for social_account, dates in zip(chunk, all_dates)
+                if set_phone_dates(
+                    social_account,
+                    dates,
+                    datetime_now,
+                    group,
+                    social_account.id in free_phones_account_ids,
+                )
+            ]
+            Profile.objects.bulk_update(updated_profiles, SYNCED_FIELDS)
+            num_updated_accounts += len(updated_profiles)
+            cache.set(key, chunk[-1].id, CHECKPOINT_SECONDS)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    cache.delete(key)
     return num_updated_accounts
 
 
@@ -74,8 +198,40 @@ class Command(BaseCommand):
             choices=["subscription", "free", "both"],
             help="Choose phone subscription users, free phone users, or both. Defaults to subscription users.",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="The number of concurrent requests to Mozilla accounts",
+        )
+        parser.add_argument(
+            "--requests-per-second",
+            type=float,
+            default=10,
+            help="The maximum rate of users fetched from Mozilla accounts, 0 for no limit",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100,
+            help="The number of profiles to update per query and checkpoint",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first user, rather than after the last checkpoint",
+        )
 
     def handle(self, *args, **options):
-        group = options["group"]
-        num_updated_accounts = sync_phone_related_dates_on_profile(group)
+        if options["workers"] < 1:
+            raise CommandError("The number of workers must be at least 1.")
+        if options["chunk_size"] < 1:
+            raise CommandError("The chunk size must be at least 1.")
+        num_updated_accounts = sync_phone_related_dates_on_profile(
+            options["group"],
+            workers=options["workers"],
+            requests_per_second=options["requests_per_second"],
+            chunk_size=options["chunk_size"],
+            restart=options["restart"],
+        )
         self.stdout.write(f"{num_updated_accounts} updated")
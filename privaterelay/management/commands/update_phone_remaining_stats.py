@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta, timezone
+from typing import Iterable
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q, QuerySet
 
 import logging
 
@@ -18,25 +20,40 @@ if settings.PHONES_ENABLED:
 logger = logging.getLogger("events")
 
 
-def reset_phone_remaining_stats(user: User) -> None:
+def reset_phone_remaining_stats(user_ids: Iterable[int]) -> None:
     # re-set remaining_texts and remaining_seconds to the maximum value
-    try:
-        relay_number = RelayNumber.objects.get(user=user)
-    except RelayNumber.DoesNotExist:
-        # no RelayNumber set, do nothing
-        return
-    relay_number.remaining_texts = settings.MAX_TEXTS_PER_BILLING_CYCLE
-    relay_number.remaining_seconds = settings.MAX_MINUTES_PER_BILLING_CYCLE * 60
-    relay_number.save()
-
-
-def get_next_reset_date(profile: Profile) -> datetime:
-    # TODO: consider moving this as a property in Profile model
-    # assumes that profile being passed have already been checked to have
-    # phone subscription or a free phone user
-    if profile.date_phone_subscription_reset is None:
-        # there is a problem with the sync_phone_related_dates_on_profile
-        # or a new foxfooder whose date_phone_subscription_reset did not get set in
+    RelayNumber.objects.filter(user_id__in=user_ids).update(
+        remaining_texts=settings.MAX_TEXTS_PER_BILLING_CYCLE,
+        remaining_seconds=settings.MAX_MINUTES_PER_BILLING_CYCLE * 60,
+    )
+
+
+def reset_is_due(datetime_now: datetime) -> Q:
+    """
+    Select the profiles with a next reset date of now or in the past.
+
+    The next reset date is MAX_DAYS_IN_MONTH days after the last reset, or the end
+    of the phone subscription if that is sooner. Profiles without a last reset date
+    are reset now.
+    """
+    return (
+        Q(date_phone_subscription_reset__isnull=True)
+        | Q(
+            date_phone_subscription_reset__lte=datetime_now
+            - timedelta(settings.MAX_DAYS_IN_MONTH)
+        )
+        | Q(date_phone_subscription_end__lte=datetime_now)
+    )
+
+
+def log_profiles_without_reset_date(profiles: QuerySet[Profile]) -> None:
+    # there is a problem with the sync_phone_related_dates_on_profile
+    # or a new foxfooder whose date_phone_subscription_reset did not get set in
+    for profile in (
+        profiles.filter(date_phone_subscription_reset__isnull=True)
+        .select_related("user")
+        .prefetch_related("user__socialaccount_set")
+    ):
         if profile.fxa:
             fxa_uid = profile.fxa.uid
         else:
@@ -51,40 +68,44 @@ def get_next_reset_date(profile: Profile) -> datetime:
                 "date_phone_subscription_end": profile.date_phone_subscription_end,
             },
         )
-        return datetime.now(timezone.utc) - timedelta(minutes=15)
-
-    calculated_next_reset_date = profile.date_phone_subscription_reset + timedelta(
-        settings.MAX_DAYS_IN_MONTH
-    )
-    if profile.date_phone_subscription_end is None:
-        return calculated_next_reset_date
-    if profile.date_phone_subscription_end < calculated_next_reset_date:
-        # return the past or the closest next reset date
-        return profile.date_phone_subscription_end
-    return calculated_next_reset_date
 
 
-def update_phone_remaining_stats() -> tuple[int, int]:
-    social_accounts_with_phones = get_phone_subscriber_social_accounts()
-    free_phones_social_accounts = get_free_phone_social_accounts()
-    social_accounts_with_phones.update(free_phones_social_accounts)
+def update_phone_remaining_stats(chunk_size: int = 1000) -> tuple[int, int]:
+    if not settings.PHONES_ENABLED:
+        return 0, 0
 
-    if not settings.PHONES_ENABLED or len(social_accounts_with_phones) == 0:
+    social_accounts_with_phones = (
+        get_phone_subscriber_social_accounts() | get_free_phone_social_accounts()
+    )
+    num_social_accounts = social_accounts_with_phones.count()
+    if num_social_accounts == 0:
         return 0, 0
 
-    updated_profiles = []
     datetime_now = datetime.now(timezone.utc)
-    for social_account in social_accounts_with_phones:
-        profile = social_account.user.profile
-        next_reset_date = get_next_reset_date(profile)
-        if next_reset_date > datetime_now:
-            continue
-        # next reset day is now or in the past
-        reset_phone_remaining_stats(profile.user)
-        profile.date_phone_subscription_reset = datetime_now
-        profile.save()
-        updated_profiles.append(profile)
-    return len(social_accounts_with_phones), len(updated_profiles)
+    profiles_to_reset = Profile.objects.filter(
+        reset_is_due(datetime_now),
+        user__in=social_accounts_with_phones.values("user"),
+    ).order_by("id")
+    log_profiles_without_reset_date(profiles_to_reset)
+
+    # Reset the limits and dates with two UPDATEs per chunk of profiles. Profiles
+    # past the end of their subscription are still due after the reset, so the
+    # chunks are selected by id.
+    num_updated_profiles = 0
+    last_id = 0
+    while chunk := list(
+        profiles_to_reset.filter(id__gt=last_id).values_list("id", "user_id")[
+            :chunk_size
+        ]
+    ):
+        last_id = chunk[-1][0]
+        profile_ids = [profile_id for profile_id, _ in chunk]
+        with transaction.atomic():
+            reset_phone_remaining_stats(user_id for _, user_id in chunk)
+            num_updated_profiles += Profile.objects.filter(id__in=profile_ids).update(
+                date_phone_subscription_reset=datetime_now
+            )
+    return num_social_accounts, num_updated_profiles
 
 
 class Command(BaseCommand):
@@ -1,27 +1,43 @@
-from django.conf import settings
+from typing import Iterator
+
+from django.contrib.auth.models import User
+from django.db.models import Q, QuerySet
 
 from allauth.socialaccount.models import SocialAccount
 from waffle.models import Flag
 
 
-def get_free_phone_social_accounts() -> set[SocialAccount]:
+def get_free_phone_social_accounts() -> QuerySet[SocialAccount]:
     free_phones_flag = Flag.objects.filter(name="free_phones").first()
     if free_phones_flag is None:
-        return set()
+        no_social_accounts: QuerySet[SocialAccount] = SocialAccount.objects.none()
+        return no_social_accounts
 
-    free_phones_sa = set(
-        SocialAccount.objects.filter(user__in=free_phones_flag.users.all())
+    group_users = User.objects.filter(groups__in=free_phones_flag.groups.all())
+    free_phones_sa: QuerySet[SocialAccount] = SocialAccount.objects.filter(
+        Q(user__in=free_phones_flag.users.all()) | Q(user__in=group_users)
     )
-    for group in free_phones_flag.groups.all():
-        free_phones_sa.update(SocialAccount.objects.filter(user__in=group.users.all()))
     return free_phones_sa
 
 
-def get_phone_subscriber_social_accounts() -> set[SocialAccount]:
-    phone_subscribers_sa = set()
-    for sub_with_phone in settings.SUBSCRIPTIONS_WITH_PHONE:
-        social_accounts = SocialAccount.objects.filter(
-            extra_data__icontains=sub_with_phone
-        )
-        phone_subscribers_sa.update(social_accounts)
+def get_phone_subscriber_social_accounts() -> QuerySet[SocialAccount]:
+    # Profile.phone_entitlement is indexed, unlike the subscriptions in extra_data
+    phone_subscribers_sa: QuerySet[SocialAccount] = SocialAccount.objects.filter(
+        provider="fxa", user__profile__phone_entitlement=True
+    )
     return phone_subscribers_sa
+
+
+def iterate_chunks_with_profiles(
+    social_accounts: QuerySet[SocialAccount], chunk_size: int = 1000
+) -> Iterator[list[SocialAccount]]:
+    """
+    Get the social accounts, with their users and profiles, in chunks by id.
+
+    Each chunk is a separate query, so rows can be updated between chunks.
+    """
+    social_accounts = social_accounts.select_related("user__profile").order_by("id")
+    last_id = 0
+    while chunk := list(social_accounts.filter(id__gt=last_id)[:chunk_size]):
+        yield chunk
+        last_id = chunk[-1].id
@@ -417,6 +417,19 @@ PREMIUM_FEATURE_PAUSED_DAYS: int = config(
 SOFT_BOUNCE_ALLOWED_DAYS: int = config("SOFT_BOUNCE_ALLOWED_DAYS", 1, cast=int)
 HARD_BOUNCE_ALLOWED_DAYS: int = config("HARD_BOUNCE_ALLOWED_DAYS", 30, cast=int)
 
+# Seconds to cache the forwarding state of addresses for inbound emails, 0 to disable
+ADDRESS_CACHE_SECONDS: int = config("ADDRESS_CACHE_SECONDS", 300, cast=int)
+# Filter of live Relay addresses, see emails/address_filter.py
+ADDRESS_FILTER_ERROR_RATE: float = config(
+    "ADDRESS_FILTER_ERROR_RATE", 0.001, cast=float
+)
+ADDRESS_FILTER_MAX_AGE_SECONDS: int = config(
+    "ADDRESS_FILTER_MAX_AGE_SECONDS", 24 * 60 * 60, cast=int
+)
+ADDRESS_FILTER_REFRESH_SECONDS: int = config(
+    "ADDRESS_FILTER_REFRESH_SECONDS", 60, cast=int
+)
+
 WSGI_APPLICATION = "privaterelay.wsgi.application"
 
 # Database
@@ -795,6 +808,9 @@ if USE_SILK:
 PROCESS_EMAIL_BATCH_SIZE = config(
     "PROCESS_EMAIL_BATCH_SIZE", 10, cast=Choices(range(1, 11), cast=int)
 )
+PROCESS_EMAIL_CONCURRENCY = config(
+    "PROCESS_EMAIL_CONCURRENCY", 1, cast=Choices(range(1, 11), cast=int)
+)
 PROCESS_EMAIL_DELETE_FAILED_MESSAGES = config(
     "PROCESS_EMAIL_DELETE_FAILED_MESSAGES", False, cast=bool
 )
@@ -802,6 +818,16 @@ PROCESS_EMAIL_HEALTHCHECK_PATH = config(
     "PROCESS_EMAIL_HEALTHCHECK_PATH", os.path.join(TMP_DIR, "healthcheck.json")
 )
 PROCESS_EMAIL_MAX_SECONDS = config("PROCESS_EMAIL_MAX_SECONDS", 0, cast=int) or None
+PROCESS_EMAIL_PROFILE_DIR = config("PROCESS_EMAIL_PROFILE_DIR", "") or None
+PROCESS_EMAIL_PROFILE_MAX_FILES = config(
+    "PROCESS_EMAIL_PROFILE_MAX_FILES", 20, cast=int
+)
+PROCESS_EMAIL_PROFILE_SECONDS = config(
+    "PROCESS_EMAIL_PROFILE_SECONDS", 10.0, cast=float
+)
+PROCESS_EMAIL_PREFETCH_BATCHES = config(
+    "PROCESS_EMAIL_PREFETCH_BATCHES", 0, cast=Choices(range(0, 11), cast=int)
+)
 PROCESS_EMAIL_VERBOSITY = config(
     "PROCESS_EMAIL_VERBOSITY", 1, cast=Choices(range(0, 4), cast=int)
 )
@@ -8,19 +8,26 @@ import pytest
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.management import call_command
 
-from allauth.socialaccount.models import SocialAccount
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
 from model_bakery import baker
 from waffle.models import Flag
+import responses
 
 from emails.models import Profile
 from privaterelay.management.commands.sync_phone_related_dates_on_profile import (
+    RateLimiter,
+    checkpoint_key,
     sync_phone_related_dates_on_profile,
 )
 
 if settings.PHONES_ENABLED:
-    from phones.tests.models_tests import make_phone_test_user
+    from phones.tests.models_tests import (
+        make_phone_test_user,
+        upgrade_test_user_to_phone,
+    )
 
 
 pytestmark = pytest.mark.skipif(
@@ -284,3 +291,104 @@ def test_command_sync_phone(
     num_profiles_updated = int(out.split(" ")[0])
 
     assert num_profiles_updated == 0
+
+
+def _make_phone_user_with_token(email: str) -> User:
+    user = baker.make(User, email=email)
+    upgrade_test_user_to_phone(user)
+    SocialToken.objects.filter(account__user=user).update(
+        app=baker.make(SocialApp, provider="fxa")
+    )
+    return user
+
+
+@pytest.mark.django_db(transaction=True)
+@responses.activate
+def test_command_fetches_from_fake_fxa_concurrently(capsys) -> None:
+    """The worker threads get the subscriptions from a fake Mozilla accounts API."""
+    users = [_make_phone_user_with_token(f"phone{num}@example.com") for num in range(3)]
+    created = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    period_start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(3)
+    period_end = period_start + timedelta(30)
+    responses.get(
+        settings.FXA_ACCOUNTS_ENDPOINT
+        + "/oauth/mozilla-subscriptions/customer/billing-and-subscriptions",
+        json={
+            "subscriptions": [
+                {
+                    "product_id": settings.PHONE_PROD_ID,
+                    "created": created.timestamp(),
+                    "current_period_start": period_start.timestamp(),
+                    "current_period_end": period_end.timestamp(),
+                }
+            ]
+        },
+    )
+
+    call_command(
+        SYNC_COMMAND,
+        "--workers",
+        "2",
+        "--chunk-size",
+        "2",
+        "--requests-per-second",
+        "0",
+    )
+
+    out, _ = capsys.readouterr()
+    assert out == "3 updated\n"
+    assert len(responses.calls) == 3
+    for user in users:
+        profile = Profile.objects.get(user=user)
+        assert profile.date_subscribed_phone == created
+        assert profile.date_phone_subscription_start == period_start
+        assert profile.date_phone_subscription_end == period_end
+        assert profile.date_phone_subscription_reset == period_start
+    assert cache.get(checkpoint_key("subscription")) is None
+
+
+@patch(f"{MOCK_BASE}.get_phone_subscription_dates")
+def test_interrupted_sync_resumes_after_checkpoint(
+    mocked_dates, patch_datetime_now, db
+) -> None:
+    users = [make_phone_test_user() for _ in range(3)]
+    accounts = [SocialAccount.objects.get(user=user) for user in users]
+    date_subscribed_phone = patch_datetime_now - timedelta(3)
+    dates = (date_subscribed_phone, date_subscribed_phone, date_subscribed_phone)
+    mocked_dates.side_effect = [dates, dates, ConnectionError("FxA is down")]
+
+    with pytest.raises(ConnectionError):
+        sync_phone_related_dates_on_profile("subscription", chunk_size=2)
+    assert cache.get(checkpoint_key("subscription")) == accounts[1].id
+
+    mocked_dates.side_effect = None
+    mocked_dates.return_value = dates
+    assert sync_phone_related_dates_on_profile("subscription", chunk_size=2) == 1
+    mocked_dates.assert_called_with(accounts[2])
+    assert cache.get(checkpoint_key("subscription")) is None
+    for user in users:
+        profile = Profile.objects.get(user=user)
+        assert profile.date_subscribed_phone == date_subscribed_phone
+
+
+@patch(f"{MOCK_BASE}.get_phone_subscription_dates")
+def test_restart_ignores_checkpoint(mocked_dates, patch_datetime_now, phone_user):
+    mocked_dates.return_value = (None, None, None)
+    account = SocialAccount.objects.get(user=phone_user)
+    cache.set(checkpoint_key("subscription"), account.id)
+
+    sync_phone_related_dates_on_profile("subscription", restart=True)
+    mocked_dates.assert_called_once_with(account)
+
+
+@patch(f"{MOCK_BASE}.time")
+def test_rate_limiter_spaces_out_requests(mocked_time) -> None:
+    mocked_time.monotonic.return_value = 100.0
+    limiter = RateLimiter(per_second=4)
+    for _ in range(3):
+        limiter.wait()
+    assert [call.args[0] for call in mocked_time.sleep.call_args_list] == [
+        0.0,
+        0.25,
+        0.5,
+    ]
@@ -7,6 +7,7 @@ from unittest.mock import patch
 import pytest
 
 from django.conf import settings
+from django.contrib.auth.models import Group, User
 from django.core.management import call_command
 
 from allauth.socialaccount.models import SocialAccount
@@ -20,7 +21,10 @@ from privaterelay.management.commands.update_phone_remaining_stats import (
 
 if settings.PHONES_ENABLED:
     from api.tests.phones_views_tests import mocked_twilio_client  # noqa: F401
-    from phones.tests.models_tests import make_phone_test_user
+    from phones.tests.models_tests import (
+        make_phone_test_user,
+        upgrade_test_user_to_phone,
+    )
     from phones.models import RealPhone, RelayNumber
 
 pytestmark = pytest.mark.skipif(
@@ -95,6 +99,19 @@ def test_free_phone_user_with_no_date_phone_subscription_reset_gets_phone_limits
     assert relay_number.remaining_seconds == settings.MAX_MINUTES_PER_BILLING_CYCLE * 60
 
 
+def test_free_phone_group_user_and_free_phone_subscriber_counted_once(
+    patch_datetime_now, mock_free_phones_profile, phone_user
+):
+    free_phones_flag = Flag.objects.get(name="free_phones")
+    group = baker.make(Group)
+    group.user_set.add(mock_free_phones_profile.user, phone_user)
+    free_phones_flag.groups.add(group)
+    num_profiles_w_phones, num_profiles_updated = update_phone_remaining_stats()
+
+    assert num_profiles_w_phones == 2
+    assert num_profiles_updated == 2
+
+
 def test_free_phone_user_with_no_date_phone_subscription_end_does_not_get_reset_date_updated(  # noqa: E501
     patch_datetime_now, mock_free_phones_profile
 ):
@@ -308,6 +325,34 @@ def test_phone_subscriber_with_subscription_end_date_after_reset_phone_limits_up
     assert relay_number.remaining_texts == settings.MAX_TEXTS_PER_BILLING_CYCLE
 
 
+@pytest.mark.django_db
+def test_phone_subscribers_reset_in_chunks(patch_datetime_now) -> None:
+    expected_now = patch_datetime_now
+    last_reset = expected_now - timedelta(settings.MAX_DAYS_IN_MONTH)
+    relay_numbers = []
+    for reset_date in (last_reset, last_reset, expected_now - timedelta(1)):
+        user = baker.make(User)
+        upgrade_test_user_to_phone(user)
+        Profile.objects.filter(user=user).update(
+            date_phone_subscription_reset=reset_date
+        )
+        relay_numbers.append(_make_used_relay_number(user))
+
+    num_profiles_w_phones, num_profiles_updated = update_phone_remaining_stats(
+        chunk_size=1
+    )
+
+    assert num_profiles_w_phones == 3
+    assert num_profiles_updated == 2
+    for relay_number, was_reset in zip(relay_numbers, (True, True, False)):
+        relay_number.refresh_from_db()
+        assert (
+            relay_number.remaining_texts == settings.MAX_TEXTS_PER_BILLING_CYCLE
+        ) == was_reset
+        profile = Profile.objects.get(user=relay_number.user)
+        assert (profile.date_phone_subscription_reset == expected_now) == was_reset
+
+
 @pytest.mark.django_db
 def test_update_user_with_command(
     capsys,
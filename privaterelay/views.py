@@ -322,6 +322,8 @@ def _update_all_data(
                 incr_if_enabled("user_has_dropped_phone", 1)
             social_account.user.email = new_email
             social_account.user.save()
+            # The premium entitlement also depends on the email domain
+            profile.update_entitlements(social_account)
             email_address_record = social_account.user.emailaddress_set.first()
             if email_address_record:
                 email_address_record.email = new_email